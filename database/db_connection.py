@@ -2,12 +2,126 @@
 Shared database connection utilities for ERCOT Analytics Dashboard
 """
 import os
+import re
+import threading
 import psycopg2
+from psycopg2 import pool as pg_pool
+from psycopg2 import extensions as pg_extensions
 from psycopg2.extras import RealDictCursor
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Advisory lock namespaces (first key of pg_advisory_[xact_]lock(int, int)) used to
+# serialize default-panel creation and AI panel ordering per user, and to elect
+# the one worker that refreshes the materialized views
+USER_DEFAULTS_LOCK_NS = 1001
+AI_PANEL_ORDER_LOCK_NS = 1002
+METADATA_REFRESH_LOCK_NS = 1003
+
+class PreparingConnection(pg_extensions.connection):
+    """psycopg2 connection that remembers which statements it has PREPAREd"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+
+def execute_prepared(cursor, name, sql, params=None):
+    """Execute `sql` through a server-side prepared statement named `name`.
+
+    `sql` uses $1, $2 ... placeholders. The statement is prepared the first time
+    a pooled connection sees it and reused afterwards, skipping parse and plan.
+    Connections that did not come from the pool just run the query directly.
+    """
+    conn = cursor.connection
+    if not isinstance(conn, PreparingConnection):
+        cursor.execute(sql if params is None else _to_pyformat(sql), params)
+        return
+    
+    if name not in conn.prepared_statements:
+        cursor.execute(f"PREPARE {name} AS {sql}")
+        conn.prepared_statements.add(name)
+    
+    placeholders = ', '.join(['%s'] * len(params)) if params else ''
+    try:
+        cursor.execute(f"EXECUTE {name}({placeholders})" if params else f"EXECUTE {name}", params)
+    except psycopg2.errors.InvalidSqlStatementName:
+        # Lost server-side (e.g. DISCARD ALL); prepare again on next use
+        conn.prepared_statements.discard(name)
+        raise
+
+def _to_pyformat(sql):
+    """Rewrite $n placeholders (used once each, in order) as %s for cursor.execute()"""
+    return re.sub(r'\$\d+', '%s', sql.replace('%', '%%'))
+
+class PooledConnection:
+    """Connection borrowed from the shared pool.
+
+    Behaves like a psycopg2 connection, but close() hands the connection back
+    to the pool (rolling back any open transaction) instead of disconnecting.
+    """
+    
+    def __init__(self, connection_pool, conn, slots=None):
+        object.__setattr__(self, '_pool', connection_pool)
+        object.__setattr__(self, '_conn', conn)
+        object.__setattr__(self, '_slots', slots)
+    
+    def __getattr__(self, name):
+        conn = object.__getattribute__(self, '_conn')
+        if conn is None:
+            raise psycopg2.InterfaceError("connection already returned to the pool")
+        return getattr(conn, name)
+    
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self._conn.commit()
+            else:
+                self._conn.rollback()
+        finally:
+            self.close()
+    
+    def __del__(self):
+        # Safety net for code paths that bail out before calling close()
+        try:
+            self.close()
+        except Exception:
+            pass
+    
+    @property
+    def closed(self):
+        return self._conn is None or self._conn.closed
+    
+    def close(self):
+        """Return the connection to the pool"""
+        conn = self._conn
+        if conn is None:
+            return
+        object.__setattr__(self, '_conn', None)
+        
+        discard = bool(conn.closed)
+        if not discard:
+            try:
+                if conn.get_transaction_status() != pg_extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception as e:
+                logger.warning(f"Discarding pooled connection after failed rollback: {e}")
+                discard = True
+        
+        try:
+            self._pool.putconn(conn, close=discard)
+        except Exception as e:
+            logger.error(f"Error returning connection to pool: {e}")
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
 class DatabaseConnection:
     """Centralized database connection management with enhanced error handling"""
     
@@ -44,6 +158,11 @@ class DatabaseConnection:
                 'password': '',
                 'port': 5432
             }
+        
+        self._pool = None
+        self._pool_slots = None
+        self._pool_wait_seconds = 10.0
+        self._pool_lock = threading.Lock()
     
     def _validate_config(self):
         """Validate database configuration parameters"""
@@ -109,6 +228,82 @@ class DatabaseConnection:
             logger.error(f"Unexpected database connection error: {e}")
             raise ConnectionError(f"Failed to connect to database: {e}")
     
+    def _get_pool(self):
+        """Create the shared connection pool on first use"""
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    try:
+                        min_size = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+                        max_size = int(os.getenv("DB_POOL_MAX_SIZE", "16"))
+                        self._pool_wait_seconds = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+                    except ValueError as e:
+                        logger.warning(f"Invalid database pool configuration: {e}. Using defaults")
+                        min_size, max_size = 2, 16
+                        self._pool_wait_seconds = 10.0
+                    max_size = max(max_size, min_size, 1)
+                    
+                    connection_config = self.config.copy()
+                    connection_config['connect_timeout'] = 10
+                    # ThreadedConnectionPool.getconn() fails immediately once every
+                    # connection is out; one slot per connection makes callers wait
+                    self._pool_slots = threading.BoundedSemaphore(max_size)
+                    self._pool = pg_pool.ThreadedConnectionPool(
+                        min_size, max_size,
+                        connection_factory=PreparingConnection,
+                        **connection_config
+                    )
+                    logger.info(f"Database connection pool created (min={min_size}, max={max_size})")
+        return self._pool
+    
+    def get_pooled_connection(self, autocommit=True, timeout=None):
+        """Borrow a connection from the shared pool; close() returns it to the pool.
+
+        Waits up to `timeout` seconds (DB_POOL_TIMEOUT, default 10) for a
+        connection to be returned when all of them are in use.
+        """
+        try:
+            connection_pool = self._get_pool()
+            slots = self._pool_slots
+            if timeout is None:
+                timeout = self._pool_wait_seconds
+            if not slots.acquire(timeout=timeout):
+                raise pg_pool.PoolError(f"no connection returned within {timeout}s")
+            
+            try:
+                conn = connection_pool.getconn()
+                if conn.closed:
+                    connection_pool.putconn(conn, close=True)
+                    conn = connection_pool.getconn()
+                
+                conn.autocommit = autocommit
+            except Exception:
+                slots.release()
+                raise
+            return PooledConnection(connection_pool, conn, slots)
+            
+        except pg_pool.PoolError as e:
+            logger.error(f"Database connection pool exhausted: {e}")
+            raise ConnectionError(f"Database connection pool exhausted: {e}")
+        except psycopg2.OperationalError as e:
+            logger.error(f"Database operational error creating pooled connection: {e}")
+            raise ConnectionError(f"Database connection failed: {e}")
+        except psycopg2.Error as e:
+            logger.error(f"PostgreSQL error: {e}")
+            raise ConnectionError(f"Database error: {e}")
+    
+    def close_pool(self):
+        """Close every connection held by the shared pool"""
+        with self._pool_lock:
+            if self._pool is not None:
+                try:
+                    self._pool.closeall()
+                    logger.info("Database connection pool closed")
+                except Exception as e:
+                    logger.error(f"Error closing database connection pool: {e}")
+                finally:
+                    self._pool = None
+    
     def get_cursor(self, cursor_factory=None, autocommit=True):
         """Get a database cursor with optional cursor factory"""
         conn = self.get_connection(autocommit=autocommit)
@@ -187,33 +382,21 @@ class DatabaseConnection:
             conn = self.get_connection(timeout=10)
             cursor = conn.cursor()
             
-            # Test basic connectivity
-            cursor.execute("SELECT 1 as test")
+            # Connectivity, server version and expected tables in one round trip
+            cursor.execute("""
+                SELECT 1 AS test, version(),
+                       (SELECT COUNT(*) FROM information_schema.tables
+                        WHERE table_schema = 'public'
+                        AND table_name IN ('users', 'ercot_capacity_monitor', 'ercot_settlement_prices'))
+            """)
             result = cursor.fetchone()
             
             if not result or result[0] != 1:
                 logger.error("Database test query returned unexpected result")
                 return False
             
-            # Test database version
-            try:
-                cursor.execute("SELECT version()")
-                version = cursor.fetchone()[0]
-                logger.info(f"Connected to: {version.split(',')[0]}")
-            except Exception as version_error:
-                logger.warning(f"Could not get database version: {version_error}")
-            
-            # Test if we can access our expected tables
-            try:
-                cursor.execute("""
-                    SELECT table_name FROM information_schema.tables 
-                    WHERE table_schema = 'public' 
-                    AND table_name IN ('users', 'ercot_capacity_monitor', 'ercot_settlement_prices')
-                """)
-                tables = cursor.fetchall()
-                logger.info(f"Found {len(tables)} expected tables in database")
-            except Exception as table_error:
-                logger.warning(f"Could not check for expected tables: {table_error}")
+            logger.info(f"Connected to: {result[1].split(',')[0]}")
+            logger.info(f"Found {result[2]} expected tables in database")
             
             logger.info("Database connection test successful")
             return True
@@ -294,10 +477,14 @@ class DatabaseConnection:
 # Global database instance
 db = DatabaseConnection()
 
-def get_db_connection():
-    """Convenience function for backward compatibility with error handling"""
+def get_db_connection(autocommit=True):
+    """Borrow a pooled connection; callers release it with conn.close() as before"""
     try:
-        return db.get_connection()
+        return db.get_pooled_connection(autocommit=autocommit)
     except Exception as e:
         logger.error(f"Failed to get database connection via convenience function: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def close_db_pool():
+    """Release all pooled connections (called on application shutdown)"""
+    db.close_pool()
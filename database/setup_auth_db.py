@@ -24,7 +24,7 @@ CREATE TABLE IF NOT EXISTS users (
 CREATE TABLE IF NOT EXISTS user_sessions (
     id SERIAL PRIMARY KEY,
     user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-    token_hash VARCHAR(255) NOT NULL,
+    token_hash BYTEA NOT NULL, -- raw 32-byte SHA-256 of the JWT
     expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     ip_address INET,
@@ -60,9 +60,23 @@ CREATE TABLE IF NOT EXISTS user_dashboard_settings (
     UNIQUE(user_id, panel_id)
 );
 
+-- Older installs stored token_hash as hex text; convert it to raw bytes
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'user_sessions' AND column_name = 'token_hash' AND data_type <> 'bytea'
+    ) THEN
+        ALTER TABLE user_sessions ALTER COLUMN token_hash TYPE BYTEA USING decode(token_hash, 'hex');
+    END IF;
+END
+$$;
+
 -- Create indexes for performance
 CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
 CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
+CREATE INDEX IF NOT EXISTS users_active_email_lower ON users(lower(email)) WHERE is_active;
+CREATE INDEX IF NOT EXISTS users_active_id ON users(id) WHERE is_active;
 CREATE INDEX IF NOT EXISTS idx_user_sessions_user_id ON user_sessions(user_id);
 CREATE INDEX IF NOT EXISTS idx_user_sessions_token_hash ON user_sessions(token_hash);
 CREATE INDEX IF NOT EXISTS idx_user_sessions_expires_at ON user_sessions(expires_at);
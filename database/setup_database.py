@@ -45,7 +45,7 @@ CREATE TABLE IF NOT EXISTS users (
 CREATE TABLE IF NOT EXISTS user_sessions (
     id SERIAL PRIMARY KEY,
     user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-    token_hash VARCHAR(255) NOT NULL,
+    token_hash BYTEA NOT NULL, -- raw 32-byte SHA-256 of the JWT
     expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     ip_address INET,
@@ -227,6 +227,79 @@ WHERE NOT EXISTS (
 );
 """
 
+# Pre-aggregated metadata for the ERCOT data tables. The app refreshes these
+# with REFRESH MATERIALIZED VIEW CONCURRENTLY, which needs a unique index.
+ERCOT_METADATA_VIEWS = """
+CREATE MATERIALIZED VIEW IF NOT EXISTS ercot_settlement_prices_meta AS
+SELECT TRUE AS singleton, MIN(timestamp) AS earliest, MAX(timestamp) AS latest, COUNT(*) AS total_records
+FROM ercot_settlement_prices;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_ercot_settlement_prices_meta ON ercot_settlement_prices_meta(singleton);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS ercot_capacity_monitor_meta AS
+SELECT TRUE AS singleton, MIN(timestamp) AS earliest, MAX(timestamp) AS latest, COUNT(*) AS total_records
+FROM ercot_capacity_monitor;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_ercot_capacity_monitor_meta ON ercot_capacity_monitor_meta(singleton);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS ercot_capacity_monitor_categories AS
+SELECT DISTINCT category, subcategory, unit
+FROM ercot_capacity_monitor;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_ercot_capacity_monitor_categories
+    ON ercot_capacity_monitor_categories(category, subcategory, unit);
+
+-- Rolling 48 hour price window served by /api/price-data
+CREATE MATERIALIZED VIEW IF NOT EXISTS ercot_settlement_prices_48h AS
+SELECT timestamp, oper_day, interval_ending, hb_busavg, hb_houston,
+       hb_hubavg, hb_north, lz_houston, lz_north, lz_south, lz_west
+FROM ercot_settlement_prices
+WHERE timestamp >= NOW() - INTERVAL '48 hours';
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_ercot_settlement_prices_48h
+    ON ercot_settlement_prices_48h(oper_day, interval_ending);
+
+CREATE INDEX IF NOT EXISTS idx_ercot_settlement_prices_48h_timestamp
+    ON ercot_settlement_prices_48h(timestamp DESC);
+"""
+
+# Sessions created before token_hash became BYTEA stored the SHA-256 as hex text
+SESSION_TOKEN_HASH_MIGRATION = """
+    ALTER TABLE user_sessions
+        ALTER COLUMN token_hash TYPE BYTEA USING decode(token_hash, 'hex')
+"""
+
+# Covering indexes for the "recent rows, newest first" reads the API makes.
+# A backward scan over these returns LIMIT rows without sorting or heap
+# visits. CREATE INDEX CONCURRENTLY cannot run inside a transaction, so each
+# statement is executed on its own autocommit connection.
+ERCOT_TIME_SERIES_INDEXES = [
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_ercot_capacity_monitor_ts_covering
+        ON ercot_capacity_monitor (timestamp DESC)
+        INCLUDE (category, subcategory, value, unit)
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_ercot_settlement_prices_ts_covering
+        ON ercot_settlement_prices (timestamp DESC)
+        INCLUDE (oper_day, interval_ending, hb_busavg, hb_houston, hb_hubavg, hb_north,
+                 lz_houston, lz_north, lz_south, lz_west)
+    """,
+]
+
+# Partial indexes matching the auth lookups in src/auth_utils.py, which only
+# ever read active users: one index probe, no is_active filter step
+AUTH_LOOKUP_INDEXES = [
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS users_active_email_lower
+        ON users (lower(email)) WHERE is_active
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS users_active_id
+        ON users (id) WHERE is_active
+    """,
+]
+
 def test_database_connection():
     """Test database connectivity with enhanced error handling"""
     logger.info("🔍 Testing database connection...")
@@ -404,6 +477,94 @@ def setup_default_dashboard_panels():
             
         return False
 
+def migrate_session_token_hash():
+    """Convert a hex-text user_sessions.token_hash column to BYTEA"""
+    conn = None
+    try:
+        conn = db.get_connection(autocommit=True)
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT data_type FROM information_schema.columns
+            WHERE table_name = 'user_sessions' AND column_name = 'token_hash'
+        """)
+        row = cursor.fetchone()
+        if row and row[0] != 'bytea':
+            cursor.execute(SESSION_TOKEN_HASH_MIGRATION)
+            logger.info("✅ user_sessions.token_hash converted to BYTEA")
+        cursor.close()
+        return True
+        
+    except Exception as e:
+        logger.warning(f"⚠️  Could not migrate user_sessions.token_hash: {e}")
+        return False
+    finally:
+        if conn:
+            conn.close()
+
+def setup_auth_lookup_indexes():
+    """Create the partial indexes used by the active-user lookups"""
+    conn = None
+    try:
+        conn = db.get_connection(autocommit=True)
+        cursor = conn.cursor()
+        for statement in AUTH_LOOKUP_INDEXES:
+            cursor.execute(statement)
+        cursor.close()
+        logger.info("✅ Auth lookup indexes created")
+        return True
+        
+    except Exception as e:
+        logger.warning(f"⚠️  Could not create auth lookup indexes: {e}")
+        return False
+    finally:
+        if conn:
+            conn.close()
+
+def setup_ercot_metadata_views():
+    """Create the materialized views backing the API metadata endpoints"""
+    logger.info("📈 Creating ERCOT metadata views...")
+    
+    try:
+        tables = db.get_table_info()
+        table_names = [table[0] for table in tables]
+        
+        required_tables = ['ercot_settlement_prices', 'ercot_capacity_monitor']
+        missing_tables = [table for table in required_tables if table not in table_names]
+        
+        if table_names and missing_tables:
+            logger.warning(f"Cannot create metadata views: missing tables {missing_tables}")
+            logger.info("Run the scrapers once to create the ERCOT tables, then re-run setup")
+            return False
+        
+        db.execute_script(ERCOT_METADATA_VIEWS)
+        logger.info("✅ ERCOT metadata views created")
+        return True
+        
+    except Exception as e:
+        logger.warning(f"⚠️  Could not create ERCOT metadata views: {e}")
+        return False
+
+def setup_ercot_time_series_indexes():
+    """Create covering timestamp indexes on the ERCOT data tables"""
+    logger.info("🗂️  Creating ERCOT time-series indexes...")
+    
+    conn = None
+    try:
+        conn = db.get_connection(autocommit=True)
+        cursor = conn.cursor()
+        for statement in ERCOT_TIME_SERIES_INDEXES:
+            cursor.execute(statement)
+        cursor.close()
+        logger.info("✅ ERCOT time-series indexes created")
+        return True
+        
+    except Exception as e:
+        logger.warning(f"⚠️  Could not create ERCOT time-series indexes: {e}")
+        return False
+    finally:
+        if conn:
+            conn.close()
+
 def get_database_statistics():
     """Get basic statistics about the database with enhanced error handling"""
     logger.info("📊 Gathering database statistics...")
@@ -525,6 +686,8 @@ def main():
             print("\n❌ Failed to create database schema.")
         else:
             print("✅ Database schema setup completed")
+            migrate_session_token_hash()
+            setup_auth_lookup_indexes()
         
         # Setup default panels
         print("\n⚙️ Phase 4: Setting up default dashboard panels...")
@@ -536,8 +699,24 @@ def main():
             logger.warning(f"Error setting up default panels: {e}")
             error_messages.append(f"Default panels error: {e}")
         
+        # Setup metadata views
+        print("\n📈 Phase 5: Creating ERCOT metadata views and indexes...")
+        try:
+            if not setup_ercot_metadata_views():
+                error_messages.append("ERCOT metadata views were not created")
+        except Exception as e:
+            logger.warning(f"Error creating metadata views: {e}")
+            error_messages.append(f"Metadata views error: {e}")
+        
+        try:
+            if not setup_ercot_time_series_indexes():
+                error_messages.append("ERCOT time-series indexes were not created")
+        except Exception as e:
+            logger.warning(f"Error creating time-series indexes: {e}")
+            error_messages.append(f"Time-series indexes error: {e}")
+        
         # Show statistics
-        print("\n📊 Phase 5: Gathering database statistics...")
+        print("\n📊 Phase 6: Gathering database statistics...")
         try:
             stats = get_database_statistics()
             if not stats or all(v == 0 for v in stats.values()):
@@ -2,19 +2,120 @@
 # AI visualization system with WORKING line chart configuration - FIXED VERSION
 import boto3
 import json
+import orjson
 import asyncio
 import logging
 from typing import Dict, List, Optional, Any
 from dataclasses import dataclass
 from datetime import datetime
-import psycopg2
 from psycopg2.extras import RealDictCursor
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
 import re
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from database.db_connection import get_db_connection
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on Bedrock calls in flight, each holding a worker thread
+BEDROCK_MAX_CONCURRENCY = int(os.getenv("BEDROCK_MAX_CONCURRENCY", "8"))
+
+# Static parts of the AI line-chart dashboard, shared by every request and
+# serialized as-is
+_GRAFANA_DATASOURCE = {
+    "uid": "aep8tntrm562ob",
+    "type": "grafana-postgresql-datasource"
+}
+
+_LINE_FIELD_CONFIG = {
+    "defaults": {
+        "custom": {
+            "drawStyle": "line",
+            "lineInterpolation": "linear",
+            "barAlignment": 0,
+            "lineWidth": 1,
+            "fillOpacity": 0,
+            "gradientMode": "none",
+            "spanNulls": False,
+            "insertNulls": False,
+            "showPoints": "auto",
+            "pointSize": 5,
+            "stacking": {
+                "mode": "none",
+                "group": "A"
+            },
+            "axisPlacement": "auto",
+            "axisLabel": "",
+            "axisColorMode": "text",
+            "axisBorderShow": False,
+            "scaleDistribution": {
+                "type": "linear"
+            },
+            "axisCenteredZero": False,
+            "hideFrom": {
+                "tooltip": False,
+                "viz": False,
+                "legend": False
+            },
+            "thresholdsStyle": {
+                "mode": "off"
+            }
+        },
+        "color": {
+            "mode": "palette-classic"
+        },
+        "mappings": [],
+        "thresholds": {
+            "mode": "absolute",
+            "steps": [
+                {
+                    "value": None,
+                    "color": "green"
+                },
+                {
+                    "value": 80,
+                    "color": "red"
+                }
+            ]
+        }
+    },
+    "overrides": []
+}
+
+_LINE_PANEL_OPTIONS = {
+    "tooltip": {
+        "mode": "single",
+        "sort": "none"
+    },
+    "legend": {
+        "showLegend": False,
+        "displayMode": "hidden",
+        "placement": "right",
+        "calcs": []
+    }
+}
+
+_DASHBOARD_SETTINGS = {
+    "time": {"from": "now-24h", "to": "now"},
+    "refresh": "30s",
+    "schemaVersion": 37,
+    "version": 0,
+    "links": [],
+    "annotations": {"list": []},
+    "templating": {"list": []},
+    "editable": True,
+    "fiscalYearStartMonth": 0,
+    "graphTooltip": 1,
+    "hideControls": False,
+    "liveNow": True,
+    "weekStart": ""
+}
+
 @dataclass
 class DataSource:
     table_name: str
@@ -36,6 +137,15 @@ class GrafanaAPI:
             os.getenv("GRAFANA_PASSWORD", "admin")
         )
         self.session.headers.update({'Content-Type': 'application/json'})
+        
+        # Keep-alive pool; retry only failed connects so a POST that reached
+        # Grafana is not replayed
+        adapter = HTTPAdapter(
+            pool_maxsize=8,
+            max_retries=Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.2)
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
     
     def _clean_sql_query(self, sql_query: str) -> str:
         """Clean SQL query to match working script format - NO INDENTATION"""
@@ -105,101 +215,19 @@ class GrafanaAPI:
                             "gridPos": {"h": 12, "w": 24, "x": 0, "y": 0},
                             "targets": [
                                 {
-                                    "datasource": {
-                                        "uid": "aep8tntrm562ob",
-                                        "type": "grafana-postgresql-datasource"
-                                    },
+                                    "datasource": _GRAFANA_DATASOURCE,
                                     "format": "time_series",
                                     "rawQuery": True,
                                     "rawSql": sql_query,
                                     "refId": "A"
                                 }
                             ],
-                            "fieldConfig": {
-                                "defaults": {
-                                    "custom": {
-                                        "drawStyle": "line",
-                                        "lineInterpolation": "linear",
-                                        "barAlignment": 0,
-                                        "lineWidth": 1,
-                                        "fillOpacity": 0,
-                                        "gradientMode": "none",
-                                        "spanNulls": False,
-                                        "insertNulls": False,
-                                        "showPoints": "auto",
-                                        "pointSize": 5,
-                                        "stacking": {
-                                            "mode": "none",
-                                            "group": "A"
-                                        },
-                                        "axisPlacement": "auto",
-                                        "axisLabel": "",
-                                        "axisColorMode": "text",
-                                        "axisBorderShow": False,
-                                        "scaleDistribution": {
-                                            "type": "linear"
-                                        },
-                                        "axisCenteredZero": False,
-                                        "hideFrom": {
-                                            "tooltip": False,
-                                            "viz": False,
-                                            "legend": False
-                                        },
-                                        "thresholdsStyle": {
-                                            "mode": "off"
-                                        }
-                                    },
-                                    "color": {
-                                        "mode": "palette-classic"
-                                    },
-                                    "mappings": [],
-                                    "thresholds": {
-                                        "mode": "absolute",
-                                        "steps": [
-                                            {
-                                                "value": None,
-                                                "color": "green"
-                                            },
-                                            {
-                                                "value": 80,
-                                                "color": "red"
-                                            }
-                                        ]
-                                    }
-                                },
-                                "overrides": []
-                            },
-                            "options": {
-                                "tooltip": {
-                                    "mode": "single",
-                                    "sort": "none"
-                                },
-                                "legend": {
-                                    "showLegend": False,
-                                    "displayMode": "hidden",
-                                    "placement": "right",
-                                    "calcs": []
-                                }
-                            },
-                            "datasource": {
-                                "uid": "aep8tntrm562ob",
-                                "type": "grafana-postgresql-datasource"
-                            }
+                            "fieldConfig": _LINE_FIELD_CONFIG,
+                            "options": _LINE_PANEL_OPTIONS,
+                            "datasource": _GRAFANA_DATASOURCE
                         }
                     ],
-                    "time": {"from": "now-24h", "to": "now"},
-                    "refresh": "30s",
-                    "schemaVersion": 37,
-                    "version": 0,
-                    "links": [],
-                    "annotations": {"list": []},
-                    "templating": {"list": []},
-                    "editable": True,
-                    "fiscalYearStartMonth": 0,
-                    "graphTooltip": 1,
-                    "hideControls": False,
-                    "liveNow": True,
-                    "weekStart": ""
+                    **_DASHBOARD_SETTINGS
                 },
                 "folderId": 0,
                 "overwrite": False,
@@ -214,7 +242,7 @@ class GrafanaAPI:
             
             response = self.session.post(
                 f"{self.grafana_url}/api/dashboards/db",
-                json=dashboard_config,
+                data=orjson.dumps(dashboard_config),
                 timeout=30
             )
             
@@ -291,12 +319,21 @@ class DatabaseAnalyzer:
         }
     
     def get_db_connection(self):
-        return psycopg2.connect(**self.db_config)
+        """Borrow a connection from the shared pool; close() hands it back"""
+        conn = get_db_connection(autocommit=False)
+        if conn is None:
+            raise ConnectionError("No database connection available")
+        return conn
     
     def analyze_existing_data(self) -> List[DataSource]:
         """Analyze your existing ERCOT tables"""
         try:
             conn = self.get_db_connection()
+        except Exception as e:
+            logger.error(f"Error analyzing database: {e}")
+            return []
+        
+        try:
             cursor = conn.cursor(cursor_factory=RealDictCursor)
             data_sources = []
             
@@ -327,13 +364,14 @@ class DatabaseAnalyzer:
                 ))
             
             cursor.close()
-            conn.close()
             logger.info(f"Analyzed {len(data_sources)} data sources")
             return data_sources
             
         except Exception as e:
             logger.error(f"Error analyzing database: {e}")
             return []
+        finally:
+            conn.close()
 
 class BedrockAIClient:
     """AWS Bedrock client for AI-powered data analysis with enhanced error handling"""
@@ -346,6 +384,7 @@ class BedrockAIClient:
         self.region_name = region_name
         self.client = None
         self.is_available = False
+        self._bedrock_slots = asyncio.Semaphore(BEDROCK_MAX_CONCURRENCY)
         self._initialize_client()
     
     def _initialize_client(self):
@@ -458,10 +497,13 @@ Respond with valid JSON only.
                 ]
             }
             
-            response = self.client.invoke_model(
-                modelId='anthropic.claude-3-sonnet-20240229-v1:0',
-                body=json.dumps(request_body)
-            )
+            # invoke_model blocks for the whole generation; run it on a worker thread
+            async with self._bedrock_slots:
+                response = await asyncio.to_thread(
+                    self.client.invoke_model,
+                    modelId='anthropic.claude-3-sonnet-20240229-v1:0',
+                    body=json.dumps(request_body)
+                )
             
             if not response or 'body' not in response:
                 logger.error("Invalid response from Bedrock")
@@ -664,7 +706,7 @@ class AIVisualizationProcessor:
     
     async def initialize(self):
         """Initialize the processor by analyzing available data"""
-        self.data_sources = self.db_analyzer.analyze_existing_data()
+        self.data_sources = await asyncio.to_thread(self.db_analyzer.analyze_existing_data)
         logger.info(f"AI Visualization Processor initialized with {len(self.data_sources)} data sources")
     
     async def process_user_request(self, user_id: int, request_text: str, visualization_type: str = "chart") -> Dict[str, Any]:
@@ -762,9 +804,18 @@ class AIVisualizationProcessor:
             }
     
     async def _store_grafana_dashboard(self, user_id: int, grafana_result: Dict[str, Any]):
+        """Store Grafana dashboard information without blocking the event loop"""
+        try:
+            await asyncio.to_thread(self._write_grafana_dashboard, user_id, grafana_result)
+            logger.info(f"Stored AI dashboard {grafana_result['dashboard_uid']} in user settings")
+            
+        except Exception as e:
+            logger.error(f"Error storing AI dashboard info: {e}")
+    
+    def _write_grafana_dashboard(self, user_id: int, grafana_result: Dict[str, Any]):
         """Store Grafana dashboard information in database"""
+        conn = self.db_analyzer.get_db_connection()
         try:
-            conn = self.db_analyzer.get_db_connection()
             cursor = conn.cursor()
             
             # Get the next panel order
@@ -791,16 +842,22 @@ class AIVisualizationProcessor:
             
             conn.commit()
             cursor.close()
+        finally:
             conn.close()
-            logger.info(f"Stored AI dashboard {grafana_result['dashboard_uid']} in user settings")
+    
+    async def _store_analysis(self, user_id: int, request_text: str, viz_type: str, analysis: Dict) -> int:
+        """Store analysis without blocking the event loop"""
+        try:
+            return await asyncio.to_thread(self._write_analysis, user_id, request_text, viz_type, analysis)
             
         except Exception as e:
-            logger.error(f"Error storing AI dashboard info: {e}")
+            logger.error(f"Error storing AI analysis: {e}")
+            raise
     
-    async def _store_analysis(self, user_id: int, request_text: str, viz_type: str, analysis: Dict) -> int:
+    def _write_analysis(self, user_id: int, request_text: str, viz_type: str, analysis: Dict) -> int:
         """Store analysis in your existing ai_visualizations table"""
+        conn = self.db_analyzer.get_db_connection()
         try:
-            conn = self.db_analyzer.get_db_connection()
             cursor = conn.cursor()
             
             cursor.execute("""
@@ -813,12 +870,9 @@ class AIVisualizationProcessor:
             viz_id = cursor.fetchone()[0]
             conn.commit()
             cursor.close()
-            conn.close()
             return viz_id
-            
-        except Exception as e:
-            logger.error(f"Error storing AI analysis: {e}")
-            raise
+        finally:
+            conn.close()
     
     async def _get_data_preview(self, sql_query: str, limit: int = 10) -> List[Dict]:
         """Get a preview of the data - DOES NOT MODIFY ORIGINAL QUERY"""
@@ -826,9 +880,6 @@ class AIVisualizationProcessor:
             return []
         
         try:
-            conn = self.db_analyzer.get_db_connection()
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            
             # Create a SEPARATE preview query (DO NOT modify original)
             preview_query = sql_query.replace(
                 '$__timeFilter(timestamp)', 
@@ -842,10 +893,7 @@ class AIVisualizationProcessor:
             logger.info(f"🔍 Preview query (separate from dashboard): {preview_query}")
             logger.info(f"📊 Original dashboard query remains: {sql_query}")
             
-            cursor.execute(preview_query)
-            data = cursor.fetchall()
-            cursor.close()
-            conn.close()
+            data = await asyncio.to_thread(self._read_data_preview, preview_query)
             
             # Convert datetime objects to strings for JSON serialization
             result = []
@@ -863,10 +911,30 @@ class AIVisualizationProcessor:
             logger.error(f"Error getting data preview: {e}")
             return []
     
+    def _read_data_preview(self, preview_query: str) -> List[Dict]:
+        """Run the preview query on a pooled connection"""
+        conn = self.db_analyzer.get_db_connection()
+        try:
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor.execute(preview_query)
+            data = cursor.fetchall()
+            cursor.close()
+            return data
+        finally:
+            conn.close()
+    
     async def _update_visualization_status(self, viz_id: int, status: str, analysis: Dict):
+        """Update visualization status without blocking the event loop"""
+        try:
+            await asyncio.to_thread(self._write_visualization_status, viz_id, status, analysis)
+            
+        except Exception as e:
+            logger.error(f"Error updating AI visualization status: {e}")
+    
+    def _write_visualization_status(self, viz_id: int, status: str, analysis: Dict):
         """Update visualization status in database"""
+        conn = self.db_analyzer.get_db_connection()
         try:
-            conn = self.db_analyzer.get_db_connection()
             cursor = conn.cursor()
             
             cursor.execute("""
@@ -877,10 +945,8 @@ class AIVisualizationProcessor:
             
             conn.commit()
             cursor.close()
+        finally:
             conn.close()
-            
-        except Exception as e:
-            logger.error(f"Error updating AI visualization status: {e}")
 
 # Global processor instance
 _ai_processor = None
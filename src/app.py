@@ -1,21 +1,27 @@
 import os
-from fastapi import FastAPI, Request, HTTPException, Depends, Form, Query
+from fastapi import FastAPI, Request, Response, HTTPException, Depends, Form, Query, BackgroundTasks
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, ORJSONResponse, StreamingResponse
 from starlette.middleware.cors import CORSMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.concurrency import run_in_threadpool
 import uvicorn
 from dotenv import load_dotenv
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 import logging
+import asyncio
 import json
+import orjson
 import secrets
 import hashlib
 import time
+import threading
 from functools import wraps
+from collections import Counter
 from datetime import datetime, timedelta
+from decimal import Decimal
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 
@@ -31,7 +37,7 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Import auth utils after other imports
-from auth_utils import auth_manager, get_current_user_optional, get_current_user
+from auth_utils import auth_manager, get_current_user_optional, get_current_user, safe_eq, log_sha256_throughput, SessionCtx
 
 # Import AI visualization system
 try:
@@ -47,7 +53,7 @@ except ImportError as e:
     logger.warning(f"AI Visualization system not available: {e}")
 
 # Create FastAPI app
-app = FastAPI(title="ERCOT Analytics Dashboard")
+app = FastAPI(title="ERCOT Analytics Dashboard", default_response_class=ORJSONResponse)
 
 # Database configuration for AI system with enhanced error handling
 try:
@@ -97,6 +103,18 @@ async def startup_event():
             # Don't fail startup if AI system fails to initialize
     else:
         logger.info("AI system not available, running in basic mode")
+    
+    app.state.metadata_refresh_task = asyncio.create_task(refresh_metadata_views_periodically())
+    log_sha256_throughput()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background tasks, flush pending writes and release pooled connections on shutdown"""
+    refresh_task = getattr(app.state, "metadata_refresh_task", None)
+    if refresh_task:
+        refresh_task.cancel()
+    await run_in_threadpool(auth_manager.flush_login_updates)
+    close_db_pool()
 
 # Add CORS middleware
 app.add_middleware(
@@ -181,7 +199,40 @@ class APIUsageStats(BaseModel):
 import sys
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
-from database.db_connection import get_db_connection
+from database.db_connection import (
+    get_db_connection, close_db_pool, execute_prepared,
+    USER_DEFAULTS_LOCK_NS, AI_PANEL_ORDER_LOCK_NS, METADATA_REFRESH_LOCK_NS
+)
+
+def iso_timestamp_sql(column: str) -> str:
+    """Select a timestamptz column already rendered as an ISO-8601 string by Postgres.
+
+    The text matches datetime.isoformat(): fractional seconds only appear when
+    they are non-zero. Queries using this must ORDER BY the table-qualified
+    column so the sort stays on the timestamp (and its index) rather than the
+    string alias.
+    """
+    return (
+        f"""(to_char({column}, 'YYYY-MM-DD"T"HH24:MI:SS')"""
+        f""" || CASE WHEN to_char({column}, 'US') = '000000' THEN '' ELSE to_char({column}, '.US') END"""
+        f""" || to_char({column}, 'TZH:TZM')) AS {column}"""
+    )
+
+# Per-hub column selections for /api/v1/settlement-prices
+SETTLEMENT_HUB_COLUMNS = {
+    'houston': 'hb_houston, lz_houston',
+    'north': 'hb_north, lz_north', 
+    'south': 'hb_south, lz_south',
+    'west': 'hb_west, lz_west',
+    'busavg': 'hb_busavg',
+    'hubavg': 'hb_hubavg'
+}
+
+SETTLEMENT_PRICE_COLUMNS = (
+    "id, oper_day, interval_ending, hb_busavg, hb_houston, hb_hubavg, hb_north, hb_pan, "
+    "hb_south, hb_west, lz_aen, lz_cps, lz_houston, lz_lcra, lz_north, lz_raybn, "
+    "lz_south, lz_west"
+)
 
 # API Key utilities
 def generate_api_credentials():
@@ -206,31 +257,29 @@ def verify_api_key(api_key: str, api_secret: str = None):
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         
         try:
-            if api_secret:
-                if not isinstance(api_secret, str):
-                    logger.warning("Invalid API secret format provided")
-                    return None
-                    
-                secret_hash = hashlib.sha256(api_secret.encode()).hexdigest()
-                cursor.execute("""
-                    SELECT ak.*, u.email, u.username 
-                    FROM api_keys ak 
-                    JOIN users u ON ak.user_id = u.id 
-                    WHERE ak.api_key = %s AND ak.api_secret_hash = %s AND ak.is_active = true
-                """, (api_key, secret_hash))
-            else:
-                cursor.execute("""
-                    SELECT ak.*, u.email, u.username 
-                    FROM api_keys ak 
-                    JOIN users u ON ak.user_id = u.id 
-                    WHERE ak.api_key = %s AND ak.is_active = true
-                """, (api_key,))
+            if api_secret and not isinstance(api_secret, str):
+                logger.warning("Invalid API secret format provided")
+                return None
+            
+            cursor.execute("""
+                SELECT ak.*, u.email, u.username 
+                FROM api_keys ak 
+                JOIN users u ON ak.user_id = u.id 
+                WHERE ak.api_key = %s AND ak.is_active = true
+            """, (api_key,))
             
             key_data = cursor.fetchone()
             
             if not key_data:
                 logger.info(f"API key not found or inactive: {api_key[:8]}...")
                 return None
+            
+            # Compare the secret hash here in constant time rather than in the WHERE clause
+            if api_secret:
+                secret_hash = hashlib.sha256(api_secret.encode()).hexdigest()
+                if not safe_eq(secret_hash, key_data['api_secret_hash'] or ''):
+                    logger.info(f"API secret mismatch: {api_key[:8]}...")
+                    return None
                 
             # Check if expired
             if key_data['expires_at'] and datetime.now() > key_data['expires_at']:
@@ -277,7 +326,7 @@ def require_api_key(f):
                 detail="API key required. Include X-API-Key header."
             )
         
-        key_data = verify_api_key(api_key, api_secret)
+        key_data = await run_in_threadpool(verify_api_key, api_key, api_secret)
         if not key_data:
             raise HTTPException(
                 status_code=401,
@@ -288,13 +337,16 @@ def require_api_key(f):
         request.state.api_key_data = key_data
         
         # Log API usage
-        await log_api_usage(request, key_data)
+        await run_in_threadpool(log_api_usage, request, key_data)
         
-        return await f(*args, **kwargs)
+        # Blocking (sync) handlers run in the threadpool so DB work never stalls the event loop
+        if asyncio.iscoroutinefunction(f):
+            return await f(*args, **kwargs)
+        return await run_in_threadpool(f, *args, **kwargs)
     
     return decorated_function
 
-async def log_api_usage(request: Request, key_data: dict):
+def log_api_usage(request: Request, key_data: dict):
     """Log API usage for analytics and rate limiting with enhanced error handling"""
     if not key_data or not isinstance(key_data, dict) or 'id' not in key_data:
         logger.error("Invalid key_data provided to log_api_usage")
@@ -383,7 +435,7 @@ async def home(request: Request, user: dict = Depends(get_current_user_optional)
 
 # Authentication routes
 @app.post("/api/auth/register")
-async def register(user_data: UserCreate, request: Request):
+def register(user_data: UserCreate, request: Request, background_tasks: BackgroundTasks):
     try:
         user = auth_manager.create_user(
             email=user_data.email,
@@ -397,8 +449,8 @@ async def register(user_data: UserCreate, request: Request):
             access_token = auth_manager.create_access_token(
                 data={"sub": str(user['id'])}
             )
-            auth_manager.store_session(user['id'], access_token, request)
-            await create_default_dashboard_settings(user['id'])
+            background_tasks.add_task(auth_manager.store_session, user['id'], access_token, SessionCtx.from_request(request))
+            create_default_dashboard_settings(user['id'])
             
             return {
                 "message": "User created successfully",
@@ -422,7 +474,7 @@ async def register(user_data: UserCreate, request: Request):
         raise HTTPException(status_code=500, detail="Registration failed")
 
 @app.post("/api/auth/login")
-async def login(user_data: UserLogin, request: Request):
+def login(user_data: UserLogin, request: Request, background_tasks: BackgroundTasks):
     try:
         user = auth_manager.authenticate_user(user_data.email, user_data.password)
         
@@ -435,7 +487,8 @@ async def login(user_data: UserLogin, request: Request):
         access_token = auth_manager.create_access_token(
             data={"sub": str(user['id'])}
         )
-        auth_manager.store_session(user['id'], access_token, request)
+        # The session row is written after the token has been sent
+        background_tasks.add_task(auth_manager.store_session, user['id'], access_token, SessionCtx.from_request(request))
         
         return {
             "message": "Login successful",
@@ -467,14 +520,32 @@ async def get_current_user_info(user: dict = Depends(get_current_user)):
     }
 
 # Enhanced Dashboard System
-async def create_default_dashboard_settings(user_id: int):
-    """Create default dashboard settings for a new user with enhanced schema and error handling"""
+
+DASHBOARD_SETTINGS_QUERY = """
+    SELECT panel_id, panel_name, panel_type, is_visible, panel_order, 
+           panel_width, panel_height, panel_grid_column, iframe_src,
+           ai_visualization_id, dashboard_uid
+    FROM user_dashboard_settings 
+    WHERE user_id = %s 
+    ORDER BY panel_order
+"""
+
+def create_default_dashboard_settings(user_id: int, conn=None):
+    """Create default dashboard settings for a new user with enhanced schema and error handling.
+
+    Callers already holding a connection with autocommit off pass it as `conn`
+    (it is committed but left open); otherwise one is borrowed from the pool.
+    """
     if not user_id or not isinstance(user_id, int) or user_id <= 0:
         logger.error(f"Invalid user_id provided: {user_id}")
         return False
-        
+    
+    owns_conn = conn is None
     try:
-        conn = get_db_connection()
+        # Run in an explicit transaction so the xact-scoped advisory lock is held
+        # until the inserts commit and released automatically afterwards
+        if owns_conn:
+            conn = get_db_connection(autocommit=False)
         if not conn:
             logger.error("Failed to get database connection for creating default dashboard settings")
             return False
@@ -482,6 +553,16 @@ async def create_default_dashboard_settings(user_id: int):
         cursor = conn.cursor()
         
         try:
+            cursor.execute("SELECT pg_try_advisory_xact_lock(%s, %s)", (USER_DEFAULTS_LOCK_NS, user_id))
+            lock_row = cursor.fetchone()
+            if not lock_row or not lock_row[0]:
+                # Another request is already inserting this user's defaults; wait for
+                # its transaction to finish instead of racing it on the same rows
+                logger.info(f"Default dashboard settings for user {user_id} are being created by another request")
+                cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)", (USER_DEFAULTS_LOCK_NS, user_id))
+                conn.commit()
+                return True
+            
             grafana_url = os.getenv("GRAFANA_URL", "http://localhost:3000")
             if not grafana_url:
                 logger.warning("GRAFANA_URL environment variable not set, using default")
@@ -495,22 +576,19 @@ async def create_default_dashboard_settings(user_id: int):
                 ('chart5', 'Settlement Point Prices', 'predefined', f'{grafana_url}/d-solo/bep90j9gjtb0gf/ercot?orgId=1&panelId=13&refresh=30s', 5, 2)
             ]
             
+            # All panels go in under the lock's transaction; a failure on any of them
+            # aborts the transaction and is rolled back below
             panels_created = 0
             for panel_id, panel_name, panel_type, iframe_src, panel_order, grid_column in default_panels:
-                try:
-                    cursor.execute("""
-                        INSERT INTO user_dashboard_settings 
-                        (user_id, panel_id, panel_name, panel_type, iframe_src, is_visible, panel_order, panel_grid_column)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                        ON CONFLICT (user_id, panel_id) DO NOTHING
-                    """, (user_id, panel_id, panel_name, panel_type, iframe_src, True, panel_order, grid_column))
-                    
-                    if cursor.rowcount > 0:
-                        panels_created += 1
-                        
-                except psycopg2.Error as e:
-                    logger.error(f"Error creating panel {panel_id} for user {user_id}: {e}")
-                    continue
+                cursor.execute("""
+                    INSERT INTO user_dashboard_settings 
+                    (user_id, panel_id, panel_name, panel_type, iframe_src, is_visible, panel_order, panel_grid_column)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (user_id, panel_id) DO NOTHING
+                """, (user_id, panel_id, panel_name, panel_type, iframe_src, True, panel_order, grid_column))
+                
+                if cursor.rowcount > 0:
+                    panels_created += 1
             
             conn.commit()
             logger.info(f"✅ Created {panels_created} default dashboard panels for user {user_id}")
@@ -535,34 +613,31 @@ async def create_default_dashboard_settings(user_id: int):
         return False
     finally:
         try:
-            if 'conn' in locals() and conn:
+            if owns_conn and conn:
                 conn.close()
         except Exception as e:
             logger.error(f"Error closing database connection: {e}")
 
 @app.get("/api/dashboard/settings")
-async def get_dashboard_settings(user: dict = Depends(get_current_user)):
+def get_dashboard_settings(user: dict = Depends(get_current_user)):
     """Get all dashboard settings including AI-generated panels"""
     try:
-        conn = get_db_connection()
+        # Autocommit off so a first-time user's defaults are created on this
+        # same connection rather than a second one borrowed mid-request
+        conn = get_db_connection(autocommit=False)
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         
-        cursor.execute("""
-            SELECT panel_id, panel_name, panel_type, is_visible, panel_order, 
-                   panel_width, panel_height, panel_grid_column, iframe_src,
-                   ai_visualization_id, dashboard_uid
-            FROM user_dashboard_settings 
-            WHERE user_id = %s 
-            ORDER BY panel_order
-        """, (user['id'],))
+        cursor.execute(DASHBOARD_SETTINGS_QUERY, (user['id'],))
         
         settings = cursor.fetchall()
-        cursor.close()
-        conn.close()
         
         if not settings:
-            await create_default_dashboard_settings(user['id'])
-            return await get_dashboard_settings(user)
+            create_default_dashboard_settings(user['id'], conn)
+            cursor.execute(DASHBOARD_SETTINGS_QUERY, (user['id'],))
+            settings = cursor.fetchall()
+        
+        cursor.close()
+        conn.close()
         
         result = []
         for setting in settings:
@@ -576,7 +651,7 @@ async def get_dashboard_settings(user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail="Failed to fetch dashboard settings")
 
 @app.post("/api/dashboard/settings")
-async def update_dashboard_settings(
+def update_dashboard_settings(
     settings_update: DashboardSettingsUpdate,
     user: dict = Depends(get_current_user)
 ):
@@ -585,13 +660,27 @@ async def update_dashboard_settings(
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        for panel in settings_update.panels:
-            cursor.execute("""
+        # A panel listed twice would hit the same row twice in one statement,
+        # which ON CONFLICT rejects; the last entry wins as it did before
+        panels = {panel.panel_id: panel for panel in settings_update.panels}.values()
+        rows = [
+            (
+                user['id'], panel.panel_id, panel.panel_name, panel.panel_type,
+                panel.is_visible, panel.panel_order, panel.panel_width, 
+                panel.panel_height, panel.panel_grid_column, panel.iframe_src,
+                panel.ai_visualization_id, panel.dashboard_uid
+            )
+            for panel in panels
+        ]
+        
+        # One multi-row upsert instead of a round trip per panel
+        if rows:
+            execute_values(cursor, """
                 INSERT INTO user_dashboard_settings 
                 (user_id, panel_id, panel_name, panel_type, is_visible, panel_order, 
                  panel_width, panel_height, panel_grid_column, iframe_src, 
                  ai_visualization_id, dashboard_uid)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                VALUES %s
                 ON CONFLICT (user_id, panel_id) 
                 DO UPDATE SET
                     panel_name = EXCLUDED.panel_name,
@@ -605,12 +694,7 @@ async def update_dashboard_settings(
                     ai_visualization_id = EXCLUDED.ai_visualization_id,
                     dashboard_uid = EXCLUDED.dashboard_uid,
                     updated_at = CURRENT_TIMESTAMP
-            """, (
-                user['id'], panel.panel_id, panel.panel_name, panel.panel_type,
-                panel.is_visible, panel.panel_order, panel.panel_width, 
-                panel.panel_height, panel.panel_grid_column, panel.iframe_src,
-                panel.ai_visualization_id, panel.dashboard_uid
-            ))
+            """, rows, page_size=max(len(rows), 100))
         
         cursor.close()
         conn.close()
@@ -623,25 +707,30 @@ async def update_dashboard_settings(
         raise HTTPException(status_code=500, detail="Failed to update dashboard settings")
 
 @app.post("/api/dashboard/reset")
-async def reset_dashboard_settings(user: dict = Depends(get_current_user)):
+def reset_dashboard_settings(user: dict = Depends(get_current_user)):
     try:
-        conn = get_db_connection()
+        conn = get_db_connection(autocommit=False)
         cursor = conn.cursor()
         
         cursor.execute("DELETE FROM user_dashboard_settings WHERE user_id = %s", (user['id'],))
         cursor.close()
-        conn.close()
         
-        await create_default_dashboard_settings(user['id'])
+        # The delete and the fresh defaults commit together
+        reset = create_default_dashboard_settings(user['id'], conn)
+        conn.close()
+        if not reset:
+            raise HTTPException(status_code=500, detail="Failed to reset dashboard settings")
         
         return {"message": "Dashboard settings reset to default"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error resetting dashboard settings: {e}")
         raise HTTPException(status_code=500, detail="Failed to reset dashboard settings")
 
 @app.get("/api/dashboard/available-panels")
-async def get_available_panels(user: dict = Depends(get_current_user)):
+def get_available_panels(user: dict = Depends(get_current_user)):
     """Get all available panels (predefined + user's AI-generated) - FIXED VERSION"""
     try:
         conn = get_db_connection()
@@ -732,7 +821,7 @@ async def get_available_panels(user: dict = Depends(get_current_user)):
 
 # API Key management routes
 @app.post("/api/keys", response_model=APIKeyResponse)
-async def create_api_key(
+def create_api_key(
     key_create: APIKeyCreate,
     user: dict = Depends(get_current_user)
 ):
@@ -769,7 +858,7 @@ async def create_api_key(
         raise HTTPException(status_code=500, detail="Failed to create API key")
 
 @app.get("/api/keys")
-async def list_api_keys(user: dict = Depends(get_current_user)):
+def list_api_keys(user: dict = Depends(get_current_user)):
     """List all API keys for the authenticated user"""
     try:
         conn = get_db_connection()
@@ -790,12 +879,6 @@ async def list_api_keys(user: dict = Depends(get_current_user)):
         # Mask API keys (show only last 8 characters)
         for key in keys:
             key['api_key'] = f"...{key['api_key'][-8:]}"
-            if key['created_at']:
-                key['created_at'] = key['created_at'].isoformat()
-            if key['last_used_at']:
-                key['last_used_at'] = key['last_used_at'].isoformat()
-            if key['expires_at']:
-                key['expires_at'] = key['expires_at'].isoformat()
         
         return keys
         
@@ -804,7 +887,7 @@ async def list_api_keys(user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail="Failed to list API keys")
 
 @app.delete("/api/keys/{key_id}")
-async def delete_api_key(key_id: int, user: dict = Depends(get_current_user)):
+def delete_api_key(key_id: int, user: dict = Depends(get_current_user)):
     """Delete an API key"""
     try:
         conn = get_db_connection()
@@ -839,7 +922,7 @@ async def api_documentation(request: Request, user: dict = Depends(get_current_u
 # Protected API endpoints for ERCOT data
 @app.get("/api/v1/settlement-prices")
 @require_api_key
-async def get_settlement_prices(
+def get_settlement_prices(
     request: Request,
     start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
     end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
@@ -847,6 +930,12 @@ async def get_settlement_prices(
     limit: int = Query(1000, description="Maximum number of records", le=10000)
 ):
     """Get ERCOT settlement point prices with optional filtering"""
+    if hub and hub not in SETTLEMENT_HUB_COLUMNS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown hub '{hub}'. Valid hubs: {', '.join(SETTLEMENT_HUB_COLUMNS)}"
+        )
+    
     try:
         conn = get_db_connection()
         cursor = conn.cursor(cursor_factory=RealDictCursor)
@@ -868,25 +957,21 @@ async def get_settlement_prices(
         
         where_clause = " AND ".join(where_clauses) if where_clauses else "1=1"
         
-        # Select columns based on hub filter
+        # Select columns based on hub filter; timestamps are rendered the
+        # same way in both shapes
         if hub:
-            hub_columns = {
-                'houston': 'hb_houston, lz_houston',
-                'north': 'hb_north, lz_north', 
-                'south': 'hb_south, lz_south',
-                'west': 'hb_west, lz_west',
-                'busavg': 'hb_busavg',
-                'hubavg': 'hb_hubavg'
-            }
-            columns = f"timestamp, oper_day, interval_ending, {hub_columns.get(hub, '*')}"
+            columns = f"{iso_timestamp_sql('timestamp')}, oper_day, interval_ending, {SETTLEMENT_HUB_COLUMNS[hub]}"
         else:
-            columns = "*"
+            columns = (
+                f"{iso_timestamp_sql('timestamp')}, {SETTLEMENT_PRICE_COLUMNS}, "
+                f"{iso_timestamp_sql('created_at')}"
+            )
         
         query = f"""
             SELECT {columns}
             FROM ercot_settlement_prices 
             WHERE {where_clause}
-            ORDER BY timestamp DESC 
+            ORDER BY ercot_settlement_prices.timestamp DESC 
             LIMIT %s
         """
         params.append(limit)
@@ -896,15 +981,8 @@ async def get_settlement_prices(
         cursor.close()
         conn.close()
         
-        # Convert timestamps to ISO format
-        for row in data:
-            if 'timestamp' in row and row['timestamp']:
-                row['timestamp'] = row['timestamp'].isoformat()
-            if 'oper_day' in row and row['oper_day']:
-                row['oper_day'] = row['oper_day'].isoformat()
-        
         return {
-            "data": [dict(row) for row in data],
+            "data": data,
             "count": len(data),
             "filtered_by": {
                 "start_date": start_date,
@@ -920,7 +998,7 @@ async def get_settlement_prices(
 
 @app.get("/api/v1/capacity-monitor")
 @require_api_key
-async def get_capacity_monitor(
+def get_capacity_monitor(
     request: Request,
     start_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
     end_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
@@ -959,10 +1037,10 @@ async def get_capacity_monitor(
         where_clause = " AND ".join(where_clauses) if where_clauses else "1=1"
         
         query = f"""
-            SELECT timestamp, category, subcategory, value, unit
+            SELECT {iso_timestamp_sql('timestamp')}, category, subcategory, value, unit
             FROM ercot_capacity_monitor 
             WHERE {where_clause}
-            ORDER BY timestamp DESC 
+            ORDER BY ercot_capacity_monitor.timestamp DESC 
             LIMIT %s
         """
         params.append(limit)
@@ -972,13 +1050,8 @@ async def get_capacity_monitor(
         cursor.close()
         conn.close()
         
-        # Convert timestamps
-        for row in data:
-            if row['timestamp']:
-                row['timestamp'] = row['timestamp'].isoformat()
-        
         return {
-            "data": [dict(row) for row in data],
+            "data": data,
             "count": len(data),
             "filtered_by": {
                 "start_date": start_date,
@@ -994,90 +1067,208 @@ async def get_capacity_monitor(
         raise HTTPException(status_code=500, detail="Failed to fetch capacity monitor data")
 
 # Metadata endpoints
-@app.get("/api/v1/settlement-prices/metadata")
-@require_api_key
-async def get_settlement_prices_metadata(request: Request):
-    """Get metadata about settlement prices data"""
+METADATA_CACHE_TTL = int(os.getenv("METADATA_CACHE_TTL_SECONDS", "60"))
+
+def ttl_cache(seconds: int):
+    """Memoize a function's result in process for `seconds`; exceptions are not cached"""
+    def decorator(func):
+        entries = {}
+        lock = threading.Lock()
+
+        @wraps(func)
+        def wrapper(*args):
+            now = time.monotonic()
+            with lock:
+                entry = entries.get(args)
+            if entry and entry[0] > now:
+                return entry[1]
+            value = func(*args)
+            with lock:
+                entries[args] = (now + seconds, value)
+            return value
+
+        wrapper.cache_clear = entries.clear
+        return wrapper
+    return decorator
+
+METADATA_REFRESH_INTERVAL = int(os.getenv("METADATA_REFRESH_INTERVAL_SECONDS", "60"))
+# The *_meta and categories views re-run full-table aggregates on every
+# refresh, so they are rebuilt far less often than the 48h window
+METADATA_AGGREGATE_REFRESH_INTERVAL = int(os.getenv("METADATA_AGGREGATE_REFRESH_INTERVAL_SECONDS", "900"))
+
+# Materialized views created by database/setup_database.py -> seconds between refreshes
+METADATA_VIEWS = {
+    "ercot_settlement_prices_meta": METADATA_AGGREGATE_REFRESH_INTERVAL,
+    "ercot_capacity_monitor_meta": METADATA_AGGREGATE_REFRESH_INTERVAL,
+    "ercot_capacity_monitor_categories": METADATA_AGGREGATE_REFRESH_INTERVAL,
+    "ercot_settlement_prices_48h": METADATA_REFRESH_INTERVAL,
+}
+
+# Connection holding the refresh lock (None while another worker holds it) and
+# when each view was last refreshed by this process
+metadata_refresh_state = {"conn": None, "last_refreshed": {}}
+
+def acquire_metadata_refresh_lock():
+    """Return the connection holding the view-refresh lock, or None if another worker has it.
+
+    Every uvicorn worker runs the refresh loop; the session-level advisory lock
+    makes exactly one of them refresh. The winner keeps its connection, so the
+    lock passes to another worker only when this process (or its connection) goes away.
+    """
+    conn = metadata_refresh_state["conn"]
+    if conn is not None:
+        if not conn.closed:
+            return conn
+        # Lost the connection (and with it the lock); hand the slot back to the pool
+        conn.close()
+        metadata_refresh_state["conn"] = None
+    
+    conn = get_db_connection()
+    if conn is None:
+        return None
+    cursor = conn.cursor()
+    cursor.execute("SELECT pg_try_advisory_lock(%s, 0)", (METADATA_REFRESH_LOCK_NS,))
+    acquired = cursor.fetchone()[0]
+    cursor.close()
+    if not acquired:
+        conn.close()
+        return None
+    
+    metadata_refresh_state["conn"] = conn
+    metadata_refresh_state["last_refreshed"] = {}
+    return conn
+
+def refresh_metadata_views():
+    """Refresh the pre-aggregated metadata views that are due, without blocking readers"""
+    conn = acquire_metadata_refresh_lock()
+    if conn is None:
+        return
+    
+    now = time.monotonic()
+    last_refreshed = metadata_refresh_state["last_refreshed"]
+    cursor = conn.cursor()
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Get date range
-        cursor.execute("""
+        for view, interval in METADATA_VIEWS.items():
+            if now - last_refreshed.get(view, float("-inf")) < interval:
+                continue
+            # A failing view (e.g. not created yet) is retried on its own
+            # schedule and doesn't hold back the others
+            last_refreshed[view] = now
+            try:
+                cursor.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}")
+            except psycopg2.Error as e:
+                logger.warning(f"Refreshing {view} failed: {e}")
+    finally:
+        cursor.close()
+
+async def refresh_metadata_views_periodically():
+    while True:
+        await asyncio.sleep(METADATA_REFRESH_INTERVAL)
+        try:
+            await run_in_threadpool(refresh_metadata_views)
+        except Exception as e:
+            logger.warning(f"Metadata view refresh failed: {e}")
+
+def fetch_date_range(cursor, table: str):
+    """Read a table's date range from its metadata view, scanning the table if the view is missing"""
+    try:
+        execute_prepared(cursor, f"{table}_meta_range", f"SELECT earliest, latest, total_records FROM {table}_meta")
+    except psycopg2.errors.UndefinedTable:
+        cursor.execute(f"""
             SELECT MIN(timestamp) as earliest, MAX(timestamp) as latest, COUNT(*) as total_records
-            FROM ercot_settlement_prices
+            FROM {table}
         """)
-        date_info = cursor.fetchone()
-        
-        # Get available hubs (column names)
+    return cursor.fetchone()
+
+@ttl_cache(METADATA_CACHE_TTL)
+def load_settlement_prices_metadata():
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    
+    # Get date range
+    date_info = fetch_date_range(cursor, "ercot_settlement_prices")
+    
+    # Get available hubs (column names)
+    execute_prepared(cursor, "ercot_settlement_hubs", """
+        SELECT column_name 
+        FROM information_schema.columns 
+        WHERE table_name = 'ercot_settlement_prices' 
+        AND (column_name LIKE 'hb_%' OR column_name LIKE 'lz_%')
+        ORDER BY column_name
+    """)
+    hubs = [row['column_name'] for row in cursor.fetchall()]
+    
+    cursor.close()
+    conn.close()
+    
+    return {
+        "table": "ercot_settlement_prices",
+        "description": "Real-time settlement point prices from ERCOT",
+        "date_range": {
+            "earliest": date_info['earliest'].isoformat() if date_info['earliest'] else None,
+            "latest": date_info['latest'].isoformat() if date_info['latest'] else None,
+            "total_records": date_info['total_records']
+        },
+        "available_hubs": hubs,
+        "update_frequency": "Every 15 minutes",
+        "data_retention": "Historical data available"
+    }
+
+@ttl_cache(METADATA_CACHE_TTL)
+def load_capacity_monitor_metadata():
+    conn = get_db_connection()
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    
+    # Get date range
+    date_info = fetch_date_range(cursor, "ercot_capacity_monitor")
+    
+    # Get available categories and subcategories
+    try:
+        execute_prepared(cursor, "ercot_capacity_monitor_category_list", """
+            SELECT category, subcategory, unit
+            FROM ercot_capacity_monitor_categories
+            ORDER BY category, subcategory
+        """)
+    except psycopg2.errors.UndefinedTable:
         cursor.execute("""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name = 'ercot_settlement_prices' 
-            AND (column_name LIKE 'hb_%' OR column_name LIKE 'lz_%')
-            ORDER BY column_name
+            SELECT DISTINCT category, subcategory, unit
+            FROM ercot_capacity_monitor 
+            ORDER BY category, subcategory
         """)
-        hubs = [row['column_name'] for row in cursor.fetchall()]
-        
-        cursor.close()
-        conn.close()
-        
-        return {
-            "table": "ercot_settlement_prices",
-            "description": "Real-time settlement point prices from ERCOT",
-            "date_range": {
-                "earliest": date_info['earliest'].isoformat() if date_info['earliest'] else None,
-                "latest": date_info['latest'].isoformat() if date_info['latest'] else None,
-                "total_records": date_info['total_records']
-            },
-            "available_hubs": hubs,
-            "update_frequency": "Every 15 minutes",
-            "data_retention": "Historical data available"
-        }
-        
+    categories = cursor.fetchall()
+    
+    cursor.close()
+    conn.close()
+    
+    return {
+        "table": "ercot_capacity_monitor",
+        "description": "ERCOT capacity and ancillary services monitoring data",
+        "date_range": {
+            "earliest": date_info['earliest'].isoformat() if date_info['earliest'] else None,
+            "latest": date_info['latest'].isoformat() if date_info['latest'] else None,
+            "total_records": date_info['total_records']
+        },
+        "available_categories": [dict(cat) for cat in categories],
+        "update_frequency": "Every minute",
+        "data_retention": "Historical data available"
+    }
+
+@app.get("/api/v1/settlement-prices/metadata")
+@require_api_key
+def get_settlement_prices_metadata(request: Request):
+    """Get metadata about settlement prices data"""
+    try:
+        return load_settlement_prices_metadata()
     except Exception as e:
         logger.error(f"Error fetching metadata: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch metadata")
 
 @app.get("/api/v1/capacity-monitor/metadata")
 @require_api_key
-async def get_capacity_monitor_metadata(request: Request):
+def get_capacity_monitor_metadata(request: Request):
     """Get metadata about capacity monitor data"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Get date range
-        cursor.execute("""
-            SELECT MIN(timestamp) as earliest, MAX(timestamp) as latest, COUNT(*) as total_records
-            FROM ercot_capacity_monitor
-        """)
-        date_info = cursor.fetchone()
-        
-        # Get available categories and subcategories
-        cursor.execute("""
-            SELECT DISTINCT category, subcategory, unit
-            FROM ercot_capacity_monitor 
-            ORDER BY category, subcategory
-        """)
-        categories = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
-        
-        return {
-            "table": "ercot_capacity_monitor",
-            "description": "ERCOT capacity and ancillary services monitoring data",
-            "date_range": {
-                "earliest": date_info['earliest'].isoformat() if date_info['earliest'] else None,
-                "latest": date_info['latest'].isoformat() if date_info['latest'] else None,
-                "total_records": date_info['total_records']
-            },
-            "available_categories": [dict(cat) for cat in categories],
-            "update_frequency": "Every minute",
-            "data_retention": "Historical data available"
-        }
-        
+        return load_capacity_monitor_metadata()
     except Exception as e:
         logger.error(f"Error fetching metadata: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch metadata")
@@ -1086,6 +1277,7 @@ async def get_capacity_monitor_metadata(request: Request):
 @app.post("/api/ai/visualizations")
 async def create_ai_visualization_enhanced(
     viz_request: AIVisualizationRequest,
+    background_tasks: BackgroundTasks,
     user: dict = Depends(get_current_user)
 ):
     """FIXED Enhanced AI visualization creation with automatic dashboard integration"""
@@ -1109,21 +1301,6 @@ async def create_ai_visualization_enhanced(
             if result['success'] and result.get('grafana_dashboard', {}).get('success'):
                 viz_id = result['visualization_id']
                 
-                # FIXED: Check for existing panels to prevent duplicates
-                existing_panel_id = await check_for_existing_ai_panel(user['id'], viz_id)
-                
-                if existing_panel_id:
-                    logger.warning(f"⚠️ AI visualization {viz_id} already exists on dashboard as {existing_panel_id}")
-                    return {
-                        "message": "AI visualization already exists on your dashboard",
-                        "visualization_id": viz_id,
-                        "analysis": result['analysis'],
-                        "data_preview": result['data_preview'],
-                        "grafana_dashboard": result.get('grafana_dashboard'),
-                        "ai_powered": True,
-                        "added_to_dashboard": True
-                    }
-                
                 # Validate Grafana dashboard data before adding
                 grafana_info = result.get('grafana_dashboard', {})
                 iframe_src = grafana_info.get('panel_embed_url') or grafana_info.get('embed_url', '')
@@ -1134,17 +1311,21 @@ async def create_ai_visualization_enhanced(
                 
                 logger.info(f"✅ Adding AI visualization {viz_id} to dashboard with URL: {iframe_src}")
                 
-                # Add to dashboard only if it doesn't already exist and has valid data
-                await add_ai_visualization_to_dashboard(user['id'], result)
+                # The response doesn't depend on the dashboard row, so insert it
+                # after the response is sent; duplicates are skipped by the
+                # insert's ON CONFLICT and failures are logged there
+                background_tasks.add_task(add_ai_visualization_to_dashboard, user['id'], result)
                 
+                # The panel insert hasn't run yet, so report it as scheduled;
+                # "pending" stays truthy for clients that only check the flag
                 return {
-                    "message": "AI visualization created and added to your dashboard",
+                    "message": "AI visualization created; adding it to your dashboard",
                     "visualization_id": viz_id,
                     "analysis": result['analysis'],
                     "data_preview": result['data_preview'],
                     "grafana_dashboard": result.get('grafana_dashboard'),
                     "ai_powered": True,
-                    "added_to_dashboard": True
+                    "added_to_dashboard": "pending"
                 }
             elif result['success']:
                 logger.warning(f"⚠️ AI visualization {result.get('visualization_id')} created but no Grafana dashboard")
@@ -1165,35 +1346,14 @@ async def create_ai_visualization_enhanced(
         except Exception as e:
             logger.error(f"❌ Enhanced AI visualization creation error: {e}")
             # Fall back to basic method
-            return await create_ai_visualization_fallback(viz_request, user)
+            return await run_in_threadpool(create_ai_visualization_fallback, viz_request, user)
     else:
         logger.warning("⚠️ AI system not available, using fallback method")
         # AI system not available, use basic method
-        return await create_ai_visualization_fallback(viz_request, user)
-
-async def check_for_existing_ai_panel(user_id: int, viz_id: int) -> Optional[str]:
-    """Check if an AI visualization is already on the dashboard"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT panel_id FROM user_dashboard_settings 
-            WHERE user_id = %s AND ai_visualization_id = %s
-        """, (user_id, viz_id))
-        
-        result = cursor.fetchone()
-        cursor.close()
-        conn.close()
-        
-        return result[0] if result else None
-        
-    except Exception as e:
-        logger.error(f"Error checking for existing AI panel: {e}")
-        return None
+        return await run_in_threadpool(create_ai_visualization_fallback, viz_request, user)
 
-async def add_ai_visualization_to_dashboard(user_id: int, result: Dict[str, Any]):
-    """FIXED Add AI visualization to user's dashboard settings with deduplication and validation"""
+def add_ai_visualization_to_dashboard(user_id: int, result: Dict[str, Any]):
+    """Add AI visualization to user's dashboard; returns False if it was already there, None on failure"""
     try:
         viz_id = result['visualization_id']
         grafana_info = result['grafana_dashboard']
@@ -1214,30 +1374,6 @@ async def add_ai_visualization_to_dashboard(user_id: int, result: Dict[str, Any]
             logger.error(f"❌ No dashboard UID for visualization {viz_id}")
             return
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # FIXED: Double-check if this visualization is already on the dashboard
-        cursor.execute("""
-            SELECT panel_id, panel_name FROM user_dashboard_settings 
-            WHERE user_id = %s AND ai_visualization_id = %s
-        """, (user_id, viz_id))
-        
-        existing = cursor.fetchone()
-        if existing:
-            logger.warning(f"⚠️ AI visualization {viz_id} already exists on dashboard as {existing[0]} ({existing[1]})")
-            cursor.close()
-            conn.close()
-            return
-        
-        # Get the next panel order
-        cursor.execute("""
-            SELECT COALESCE(MAX(panel_order), 0) + 1
-            FROM user_dashboard_settings 
-            WHERE user_id = %s
-        """, (user_id,))
-        next_order = cursor.fetchone()[0]
-        
         # FIXED: Clean up panel name to avoid double "AI:" prefix
         title = analysis.get('title', 'Custom Visualization')
         if title.startswith('AI: '):
@@ -1247,44 +1383,61 @@ async def add_ai_visualization_to_dashboard(user_id: int, result: Dict[str, Any]
         
         panel_id = f"ai_viz_{viz_id}"
         
-        logger.info(f"🔄 Adding AI visualization to dashboard:")
-        logger.info(f"   - Panel ID: {panel_id}")
-        logger.info(f"   - Panel Name: {panel_name}")
-        logger.info(f"   - Iframe URL: {iframe_src}")
-        logger.info(f"   - Dashboard UID: {dashboard_uid}")
-        logger.info(f"   - Panel Order: {next_order}")
+        logger.info(
+            "🔄 Adding AI visualization to dashboard:\n"
+            "   - Panel ID: %s\n"
+            "   - Panel Name: %s\n"
+            "   - Iframe URL: %s\n"
+            "   - Dashboard UID: %s",
+            panel_id, panel_name, iframe_src, dashboard_uid
+        )
+        
+        conn = get_db_connection(autocommit=False)
+        cursor = conn.cursor()
         
-        # Add to dashboard settings with conflict resolution
+        # Serialize same-user inserts so concurrent requests can't both read
+        # the same MAX(panel_order); released at commit
+        cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)", (AI_PANEL_ORDER_LOCK_NS, user_id))
+        
+        # Order lookup, insert and duplicate detection in one statement: the
+        # panel_id is derived from the visualization id, so a conflict means
+        # this visualization is already on the dashboard
         cursor.execute("""
+            WITH next_order AS (
+                SELECT COALESCE(MAX(panel_order), 0) + 1 AS panel_order
+                FROM user_dashboard_settings 
+                WHERE user_id = %s
+            )
             INSERT INTO user_dashboard_settings 
             (user_id, panel_id, panel_name, panel_type, is_visible, panel_order, 
              panel_grid_column, iframe_src, ai_visualization_id, dashboard_uid)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (user_id, panel_id) DO UPDATE SET
-                panel_name = EXCLUDED.panel_name,
-                iframe_src = EXCLUDED.iframe_src,
-                dashboard_uid = EXCLUDED.dashboard_uid,
-                updated_at = CURRENT_TIMESTAMP
+            SELECT %s, %s, %s, %s, %s, next_order.panel_order, %s, %s, %s, %s
+            FROM next_order
+            ON CONFLICT (user_id, panel_id) DO NOTHING
+            RETURNING panel_order
         """, (
-            user_id, panel_id, panel_name, 'ai_generated', True, next_order,
+            user_id, user_id, panel_id, panel_name, 'ai_generated', True,
             2, iframe_src, viz_id, dashboard_uid  # Full width for AI panels
         ))
         
-        rows_affected = cursor.rowcount
+        inserted = cursor.fetchone()
         conn.commit()
         cursor.close()
         conn.close()
         
-        if rows_affected > 0:
-            logger.info(f"✅ Successfully added AI visualization {viz_id} to dashboard for user {user_id}")
-        else:
-            logger.warning(f"⚠️ No rows affected when adding AI visualization {viz_id} to dashboard")
+        if inserted:
+            logger.info("✅ Successfully added AI visualization %s to dashboard for user %s at position %s",
+                        viz_id, user_id, inserted[0])
+            return True
+        
+        logger.warning("⚠️ AI visualization %s already exists on dashboard as %s", viz_id, panel_id)
+        return False
         
     except Exception as e:
         logger.error(f"❌ Error adding AI visualization to dashboard: {e}")
         # Don't raise the exception, just log it so the main process can continue
 
-async def create_ai_visualization_fallback(viz_request: AIVisualizationRequest, user: dict):
+def create_ai_visualization_fallback(viz_request: AIVisualizationRequest, user: dict):
     """Fallback method using basic storage"""
     try:
         conn = get_db_connection()
@@ -1315,28 +1468,36 @@ async def create_ai_visualization_fallback(viz_request: AIVisualizationRequest,
         raise HTTPException(status_code=500, detail="Failed to create AI visualization")
 
 @app.get("/api/ai/visualizations")
-async def get_user_visualizations(user: dict = Depends(get_current_user)):
-    """Get all AI visualizations for the current user"""
+def get_user_visualizations(
+    since: Optional[datetime] = Query(None, description="Only return visualizations created after this ISO timestamp"),
+    user: dict = Depends(get_current_user)
+):
+    """Get AI visualizations for the current user, optionally only those newer than `since`"""
     try:
         conn = get_db_connection()
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         
-        cursor.execute("""
-            SELECT id, request_text, visualization_type, status, created_at, completed_at, error_message
+        where_clause = "user_id = %s"
+        params = [user['id']]
+        if since:
+            where_clause += " AND ai_visualizations.created_at > %s"
+            params.append(since)
+        
+        cursor.execute(f"""
+            SELECT id, request_text, visualization_type, status,
+                   {iso_timestamp_sql('created_at')}, {iso_timestamp_sql('completed_at')}, error_message
             FROM ai_visualizations 
-            WHERE user_id = %s 
-            ORDER BY created_at DESC
-        """, (user['id'],))
+            WHERE {where_clause} 
+            ORDER BY ai_visualizations.created_at DESC
+        """, params)
         
         visualizations = cursor.fetchall()
         cursor.close()
         conn.close()
         
-        for viz in visualizations:
-            if viz['created_at']:
-                viz['created_at'] = viz['created_at'].isoformat()
-            if viz['completed_at']:
-                viz['completed_at'] = viz['completed_at'].isoformat()
+        # Pollers passing the newest created_at they have get 204 when nothing changed
+        if since and not visualizations:
+            return Response(status_code=204)
         
         return [dict(viz) for viz in visualizations]
         
@@ -1398,7 +1559,7 @@ async def test_auth(user: dict = Depends(get_current_user)):
     }
 
 @app.get("/api/ai/debug/dashboard-entries")
-async def debug_dashboard_entries(user: dict = Depends(get_current_user)):
+def debug_dashboard_entries(user: dict = Depends(get_current_user)):
     """Debug endpoint to check for duplicate or invalid dashboard entries"""
     try:
         conn = get_db_connection()
@@ -1416,44 +1577,34 @@ async def debug_dashboard_entries(user: dict = Depends(get_current_user)):
         """, (user['id'],))
         
         dashboard_entries = cursor.fetchall()
-        
-        # Check for duplicates by ai_visualization_id
-        cursor.execute("""
-            SELECT ai_visualization_id, COUNT(*) as count
-            FROM user_dashboard_settings 
-            WHERE user_id = %s AND panel_type = 'ai_generated' AND ai_visualization_id IS NOT NULL
-            GROUP BY ai_visualization_id
-            HAVING COUNT(*) > 1
-        """, (user['id'],))
-        
-        duplicates = cursor.fetchall()
-        
-        # Check for entries with missing iframe_src
-        cursor.execute("""
-            SELECT panel_id, panel_name, ai_visualization_id
-            FROM user_dashboard_settings 
-            WHERE user_id = %s AND panel_type = 'ai_generated' 
-            AND (iframe_src IS NULL OR iframe_src = '')
-        """, (user['id'],))
-        
-        missing_urls = cursor.fetchall()
-        
         cursor.close()
         conn.close()
         
-        # Convert timestamps
-        for entry in dashboard_entries:
-            if entry['created_at']:
-                entry['created_at'] = entry['created_at'].isoformat()
-            if entry['updated_at']:
-                entry['updated_at'] = entry['updated_at'].isoformat()
+        # Duplicates and missing URLs are derived from the same rows rather
+        # than re-querying the table
+        viz_counts = Counter(
+            entry['ai_visualization_id'] for entry in dashboard_entries
+            if entry['ai_visualization_id'] is not None
+        )
+        duplicates = [
+            {"ai_visualization_id": viz_id, "count": count}
+            for viz_id, count in viz_counts.items() if count > 1
+        ]
+        missing_urls = [
+            {
+                "panel_id": entry['panel_id'],
+                "panel_name": entry['panel_name'],
+                "ai_visualization_id": entry['ai_visualization_id']
+            }
+            for entry in dashboard_entries if not entry['iframe_src']
+        ]
         
         return {
             "user_id": user['id'],
             "total_ai_dashboard_entries": len(dashboard_entries),
             "dashboard_entries": [dict(entry) for entry in dashboard_entries],
-            "duplicates_by_viz_id": [dict(dup) for dup in duplicates],
-            "entries_missing_urls": [dict(entry) for entry in missing_urls],
+            "duplicates_by_viz_id": duplicates,
+            "entries_missing_urls": missing_urls,
             "has_duplicates": len(duplicates) > 0,
             "has_missing_urls": len(missing_urls) > 0
         }
@@ -1463,10 +1614,11 @@ async def debug_dashboard_entries(user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail="Failed to fetch debug info")
 
 @app.post("/api/ai/debug/cleanup-duplicates")
-async def cleanup_duplicate_dashboard_entries(user: dict = Depends(get_current_user)):
+def cleanup_duplicate_dashboard_entries(user: dict = Depends(get_current_user)):
     """Clean up duplicate or invalid AI dashboard entries"""
     try:
-        conn = get_db_connection()
+        # Both deletes commit together
+        conn = get_db_connection(autocommit=False)
         cursor = conn.cursor()
         
         # Remove entries with no iframe_src
@@ -1480,17 +1632,18 @@ async def cleanup_duplicate_dashboard_entries(user: dict = Depends(get_current_u
         
         # For duplicates by ai_visualization_id, keep only the most recent one
         cursor.execute("""
-            DELETE FROM user_dashboard_settings 
-            WHERE user_id = %s AND panel_type = 'ai_generated'
-            AND id NOT IN (
-                SELECT DISTINCT ON (ai_visualization_id) id
+            WITH ranked AS (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY ai_visualization_id ORDER BY created_at DESC
+                ) AS rn
                 FROM user_dashboard_settings 
                 WHERE user_id = %s AND panel_type = 'ai_generated'
                 AND ai_visualization_id IS NOT NULL
-                ORDER BY ai_visualization_id, created_at DESC
             )
-            AND ai_visualization_id IS NOT NULL
-        """, (user['id'], user['id']))
+            DELETE FROM user_dashboard_settings uds
+            USING ranked
+            WHERE uds.id = ranked.id AND ranked.rn > 1
+        """, (user['id'],))
         
         removed_duplicates = cursor.rowcount
         
@@ -1512,7 +1665,7 @@ async def cleanup_duplicate_dashboard_entries(user: dict = Depends(get_current_u
         raise HTTPException(status_code=500, detail="Failed to cleanup duplicates")
 
 @app.delete("/api/ai/visualizations/clear")
-async def clear_all_visualizations(user: dict = Depends(get_current_user)):
+def clear_all_visualizations(user: dict = Depends(get_current_user)):
     """FIXED Clear all AI visualizations and remove from dashboard"""
     try:
         logger.info(f"🗑️ Clearing all visualizations for user {user['id']}")
@@ -1520,21 +1673,23 @@ async def clear_all_visualizations(user: dict = Depends(get_current_user)):
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # First, remove AI panels from dashboard settings
-        cursor.execute("""
-            DELETE FROM user_dashboard_settings 
-            WHERE user_id = %s AND panel_type = 'ai_generated'
-        """, (user['id'],))
-        
-        dashboard_panels_deleted = cursor.rowcount
-        
-        # Then delete AI visualizations
+        # Remove AI panels from dashboard settings and delete the AI
+        # visualizations in one statement
         cursor.execute("""
-            DELETE FROM ai_visualizations 
-            WHERE user_id = %s
-        """, (user['id'],))
+            WITH deleted_panels AS (
+                DELETE FROM user_dashboard_settings 
+                WHERE user_id = %s AND panel_type = 'ai_generated'
+                RETURNING 1
+            ), deleted_visualizations AS (
+                DELETE FROM ai_visualizations 
+                WHERE user_id = %s
+                RETURNING 1
+            )
+            SELECT (SELECT COUNT(*) FROM deleted_panels),
+                   (SELECT COUNT(*) FROM deleted_visualizations)
+        """, (user['id'], user['id']))
         
-        visualizations_deleted = cursor.rowcount
+        dashboard_panels_deleted, visualizations_deleted = cursor.fetchone()
         
         conn.commit()
         cursor.close()
@@ -1553,9 +1708,50 @@ async def clear_all_visualizations(user: dict = Depends(get_current_user)):
         logger.error(f"❌ Error clearing visualizations for user {user.get('id', 'unknown')}: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to clear visualizations: {str(e)}")
 
+# The time-series snapshots below only change when the scrapers insert new
+# rows, so the newest timestamp works as a validator for conditional GETs.
+DATA_CACHE_CONTROL = "max-age=30"
+
+def latest_timestamp_etag(conn, table: str, window: Optional[str] = None, missing_ok: bool = True) -> Optional[str]:
+    """Build a weak ETag from the newest row in `table`; None if it can't be read.
+
+    Endpoints serving a sliding `window` (e.g. '6 hours') also fold in the
+    oldest row still inside it, so the tag changes when rows age out. With
+    missing_ok=False a missing table raises UndefinedTable instead.
+    """
+    try:
+        cursor = conn.cursor()
+        if window is None:
+            execute_prepared(cursor, f"{table}_latest_timestamp", f"SELECT MAX(timestamp) FROM {table}")
+        else:
+            execute_prepared(cursor, f"{table}_window_{window.replace(' ', '_')}", f"""
+                SELECT (SELECT MAX(timestamp) FROM {table}),
+                       (SELECT MIN(timestamp) FROM {table} WHERE timestamp >= NOW() - INTERVAL '{window}')
+            """)
+        bounds = [bound for bound in cursor.fetchone() if bound is not None]
+        cursor.close()
+        return f'W/"{"-".join(str(int(bound.timestamp() * 1000)) for bound in bounds)}"' if bounds else None
+    except Exception as e:
+        # On a transaction connection the failed probe aborts the transaction;
+        # roll back so the caller's query can still run
+        try:
+            conn.rollback()
+        except Exception as rollback_error:
+            logger.error(f"Error rolling back after ETag probe: {rollback_error}")
+        if not missing_ok and isinstance(e, psycopg2.errors.UndefinedTable):
+            raise
+        logger.warning(f"Could not compute ETag for {table}: {e}")
+        return None
+
+def is_not_modified(request: Request, etag: Optional[str]) -> bool:
+    return etag is not None and request.headers.get("if-none-match") == etag
+
+def not_modified_response(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": DATA_CACHE_CONTROL})
+
 # Original data API endpoints (unchanged)
 @app.get("/api/data")
-async def get_data():
+def get_data(request: Request, response: Response):
     """Get ERCOT capacity monitor data with comprehensive error handling"""
     conn = None
     cursor = None
@@ -1565,31 +1761,31 @@ async def get_data():
         if not conn:
             logger.error("Failed to get database connection for /api/data")
             raise HTTPException(status_code=503, detail="Database service unavailable")
+        
+        etag = latest_timestamp_etag(conn, "ercot_capacity_monitor")
+        if is_not_modified(request, etag):
+            return not_modified_response(etag)
+        if etag:
+            response.headers["ETag"] = etag
+            response.headers["Cache-Control"] = DATA_CACHE_CONTROL
             
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         
         try:
-            cursor.execute("SELECT * FROM ercot_capacity_monitor ORDER BY timestamp DESC LIMIT 100")
+            execute_prepared(cursor, "ercot_capacity_monitor_latest", f"""
+                SELECT {iso_timestamp_sql('timestamp')}, category, subcategory, value, unit
+                FROM ercot_capacity_monitor
+                ORDER BY ercot_capacity_monitor.timestamp DESC
+                LIMIT 100
+            """)
             data = cursor.fetchall()
             
             if not data:
                 logger.info("No data found in ercot_capacity_monitor table")
                 return []
             
-            # Safely convert timestamps
-            processed_data = []
-            for row in data:
-                try:
-                    row_dict = dict(row)
-                    if 'timestamp' in row_dict and row_dict['timestamp']:
-                        row_dict['timestamp'] = row_dict['timestamp'].isoformat()
-                    processed_data.append(row_dict)
-                except Exception as e:
-                    logger.warning(f"Error processing row: {e}")
-                    continue
-            
-            logger.info(f"Successfully retrieved {len(processed_data)} records")
-            return processed_data
+            logger.info(f"Successfully retrieved {len(data)} records")
+            return data
             
         except psycopg2.Error as e:
             logger.error(f"Database query error in /api/data: {e}")
@@ -1615,19 +1811,70 @@ async def get_data():
         except Exception as e:
             logger.error(f"Error closing database connection: {e}")
 
+# Rows are pulled from a server-side cursor in batches and written out as a
+# JSON array, so large windows never sit in memory all at once.
+STREAM_BATCH_SIZE = 500
+
+def json_default(value):
+    # orjson encodes datetime/date/time natively; Decimal is the only gap
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def stream_json_rows(conn, cursor, first_batch, convert_row=None):
+    """Yield rows as a JSON array batch by batch, then hand the connection back"""
+    try:
+        yield b"["
+        batch = first_batch
+        first = True
+        while batch:
+            encoded = []
+            for row in batch:
+                row = convert_row(row) if convert_row else row
+                if row is not None:
+                    encoded.append(orjson.dumps(row, default=json_default))
+            if encoded:
+                yield (b"" if first else b",") + b",".join(encoded)
+                first = False
+            batch = cursor.fetchmany(STREAM_BATCH_SIZE)
+        yield b"]"
+    finally:
+        cursor.close()
+        conn.close()
+
+def open_stream_cursor(name: str):
+    """Open a named (server-side) cursor; it needs a transaction, so autocommit is off"""
+    conn = get_db_connection(autocommit=False)
+    if not conn:
+        return None, None
+    return conn, conn.cursor(name=name, cursor_factory=RealDictCursor)
+
+def convert_ercot_row(row):
+    row_dict = dict(row)
+    # Validate numeric fields
+    if 'value' in row_dict and row_dict['value'] is not None:
+        try:
+            row_dict['value'] = float(row_dict['value'])
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Invalid value in row: {row_dict['value']} - {e}")
+            row_dict['value'] = None
+    return row_dict
+
 @app.get("/api/ercot-data")
-async def get_ercot_data():
+def get_ercot_data(request: Request):
     """Get recent ERCOT capacity monitor data with comprehensive error handling"""
     conn = None
     cursor = None
     
     try:
-        conn = get_db_connection()
+        conn, cursor = open_stream_cursor("ercot_data_stream")
         if not conn:
             logger.error("Failed to get database connection for /api/ercot-data")
             raise HTTPException(status_code=503, detail="Database service unavailable")
-            
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        
+        etag = latest_timestamp_etag(conn, "ercot_capacity_monitor", window="6 hours")
+        if is_not_modified(request, etag):
+            return not_modified_response(etag)
         
         try:
             cursor.execute("""
@@ -1636,33 +1883,22 @@ async def get_ercot_data():
                 WHERE timestamp >= NOW() - INTERVAL '6 hours'
                 ORDER BY timestamp DESC
             """)
-            data = cursor.fetchall()
+            first_batch = cursor.fetchmany(STREAM_BATCH_SIZE)
             
-            if not data:
+            if not first_batch:
                 logger.info("No recent ERCOT data found (last 6 hours)")
                 return []
             
-            # Safely convert timestamps and process data
-            processed_data = []
-            for row in data:
-                try:
-                    row_dict = dict(row)
-                    if 'timestamp' in row_dict and row_dict['timestamp']:
-                        row_dict['timestamp'] = row_dict['timestamp'].isoformat()
-                    # Validate numeric fields
-                    if 'value' in row_dict and row_dict['value'] is not None:
-                        try:
-                            row_dict['value'] = float(row_dict['value'])
-                        except (ValueError, TypeError) as e:
-                            logger.warning(f"Invalid value in row: {row_dict['value']} - {e}")
-                            row_dict['value'] = None
-                    processed_data.append(row_dict)
-                except Exception as e:
-                    logger.warning(f"Error processing ERCOT data row: {e}")
-                    continue
-            
-            logger.info(f"Successfully retrieved {len(processed_data)} ERCOT records")
-            return processed_data
+            # The generator now owns the connection and closes it when done
+            response = StreamingResponse(
+                stream_json_rows(conn, cursor, first_batch, convert_ercot_row),
+                media_type="application/json"
+            )
+            if etag:
+                response.headers["ETag"] = etag
+                response.headers["Cache-Control"] = DATA_CACHE_CONTROL
+            conn = cursor = None
+            return response
             
         except psycopg2.Error as e:
             logger.error(f"Database query error in /api/ercot-data: {e}")
@@ -1688,42 +1924,76 @@ async def get_ercot_data():
         except Exception as e:
             logger.error(f"Error closing database connection: {e}")
 
+PRICE_WINDOW_QUERY = """
+    SELECT timestamp, oper_day, interval_ending, hb_busavg, hb_houston, 
+           hb_hubavg, hb_north, lz_houston, lz_north, lz_south, lz_west
+    FROM {source} 
+    WHERE timestamp >= NOW() - INTERVAL '48 hours'
+    ORDER BY timestamp DESC
+    LIMIT 1000
+"""
+
 @app.get("/api/price-data")
-async def get_price_data():
-    conn = get_db_connection()
+def get_price_data(request: Request):
+    conn = None
+    cursor = None
     try:
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("""
-            SELECT timestamp, oper_day, interval_ending, hb_busavg, hb_houston, 
-                   hb_hubavg, hb_north, lz_houston, lz_north, lz_south, lz_west
-            FROM ercot_settlement_prices 
-            WHERE timestamp >= NOW() - INTERVAL '48 hours'
-            ORDER BY timestamp DESC
-            LIMIT 1000
-        """)
-        data = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        
-        for row in data:
-            if 'timestamp' in row:
-                row['timestamp'] = row['timestamp'].isoformat()
-            if 'oper_day' in row:
-                row['oper_day'] = row['oper_day'].isoformat()
+        conn, cursor = open_stream_cursor("price_data_stream")
         
-        return data
+        # Read the pre-materialized 48h window; the WHERE drops rows that aged
+        # out since the last refresh. The ETag comes from the relation the body
+        # is read from, so it only moves once the view has refreshed. Fall back
+        # to the base table until the view has been created.
+        source = "ercot_settlement_prices_48h"
+        try:
+            etag = latest_timestamp_etag(conn, source, window="48 hours", missing_ok=False)
+        except psycopg2.errors.UndefinedTable:
+            source = "ercot_settlement_prices"
+            etag = latest_timestamp_etag(conn, source, window="48 hours")
+        if is_not_modified(request, etag):
+            return not_modified_response(etag)
+        
+        cursor.execute(PRICE_WINDOW_QUERY.format(source=source))
+        first_batch = cursor.fetchmany(STREAM_BATCH_SIZE)
+        
+        response = StreamingResponse(
+            stream_json_rows(conn, cursor, first_batch),
+            media_type="application/json"
+        )
+        if etag:
+            response.headers["ETag"] = etag
+            response.headers["Cache-Control"] = DATA_CACHE_CONTROL
+        conn = cursor = None
+        return response
     except Exception as e:
         logger.error(f"Price data query error: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch price data")
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+# Probes hit /health every few seconds; the encoded body is rebuilt at most
+# once per HEALTH_REFRESH_SECONDS instead of on every request
+HEALTH_REFRESH_SECONDS = 1.0
+health_cache = {"expires_at": 0.0, "body": b""}
+
+def health_body() -> bytes:
+    now = time.monotonic()
+    if now >= health_cache["expires_at"]:
+        ai_status = "available" if AI_SYSTEM_AVAILABLE else "not_available"
+        health_cache["body"] = orjson.dumps({
+            "status": "healthy", 
+            "timestamp": datetime.now().isoformat(),
+            "ai_system": ai_status
+        })
+        health_cache["expires_at"] = now + HEALTH_REFRESH_SECONDS
+    return health_cache["body"]
 
 @app.get("/health")
 async def health():
-    ai_status = "available" if AI_SYSTEM_AVAILABLE else "not_available"
-    return {
-        "status": "healthy", 
-        "timestamp": datetime.now().isoformat(),
-        "ai_system": ai_status
-    }
+    return Response(health_body(), media_type="application/json")
 
 if __name__ == "__main__":
     uvicorn.run(
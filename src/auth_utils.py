@@ -1,18 +1,30 @@
 # auth_utils.py
 import os
+import base64
+import string
 import hashlib
-from datetime import datetime, timedelta
+import hmac
+import json
+import ssl
+from hmac import compare_digest
+import queue
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
 from typing import Optional, Dict, Any
 import jwt
 from passlib.context import CryptContext
+from passlib.hash import argon2 as passlib_argon2
 from fastapi import HTTPException, status, Depends, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import sys
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
-from database.db_connection import get_db_connection
+from database.db_connection import get_db_connection, execute_prepared
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 import logging
 
 logger = logging.getLogger(__name__)
@@ -33,6 +45,16 @@ except Exception as e:
 
 ALGORITHM = "HS256"
 
+def _b64url(raw: bytes) -> bytes:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=")
+
+# Every token carries the same header, so it is serialized and encoded once
+_JWT_HEADER_B64 = _b64url(json.dumps({"alg": ALGORITHM, "typ": "JWT"}, separators=(",", ":")).encode())
+_JWT_HEADER = _JWT_HEADER_B64.decode()
+
+# str.translate with this table leaves only characters outside the base64url alphabet
+_NON_B64URL = str.maketrans("", "", string.ascii_letters + string.digits + "-_")
+
 try:
     ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get("ACCESS_TOKEN_EXPIRE_MINUTES", "1440"))  # 24 hours default
     if ACCESS_TOKEN_EXPIRE_MINUTES <= 0:
@@ -42,37 +64,236 @@ except (ValueError, TypeError) as e:
     logger.error(f"Error parsing ACCESS_TOKEN_EXPIRE_MINUTES: {e}. Using default 24 hours")
     ACCESS_TOKEN_EXPIRE_MINUTES = 1440
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+ACCESS_TOKEN_EXPIRE_SECONDS = ACCESS_TOKEN_EXPIRE_MINUTES * 60
+
+# argon2id is preferred when argon2-cffi is installed; bcrypt hashes keep
+# verifying and are flagged for rehash on the next successful login
+if passlib_argon2.has_backend():
+    pwd_context = CryptContext(
+        schemes=["argon2", "bcrypt"],
+        deprecated="auto",
+        argon2__type="ID",
+        argon2__memory_cost=19456,
+        argon2__time_cost=2,
+        argon2__parallelism=1,
+    )
+else:
+    logger.warning("argon2-cffi not installed; hashing new passwords with bcrypt")
+    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# bcrypt and argon2 release the GIL, so handler threads already hash on separate
+# cores; cap concurrent hashes at the core count so a login burst queues here
+# instead of time-slicing every request's hash across oversubscribed CPUs
+PASSWORD_HASH_CONCURRENCY = int(os.environ.get("PASSWORD_HASH_CONCURRENCY", str(os.cpu_count() or 1)))
+_password_hash_slots = threading.BoundedSemaphore(PASSWORD_HASH_CONCURRENCY)
+
+# bcrypt cost is lowered (never below the floor) until one hash fits this budget
+BCRYPT_TARGET_HASH_SECONDS = float(os.environ.get("BCRYPT_TARGET_HASH_SECONDS", "0.25"))
+BCRYPT_MIN_ROUNDS = 10
+_bcrypt_calibrated = False
+_bcrypt_calibration_lock = threading.Lock()
+
+def _calibrate_bcrypt_rounds() -> None:
+    """Time one bcrypt hash and drop bcrypt__rounds until it fits the target"""
+    global _bcrypt_calibrated
+    if _bcrypt_calibrated:
+        return
+    with _bcrypt_calibration_lock:
+        if _bcrypt_calibrated:
+            return
+        _bcrypt_calibrated = True
+        if pwd_context.default_scheme() != "bcrypt":
+            return
+        try:
+            rounds = pwd_context.handler("bcrypt").default_rounds
+            started = time.perf_counter()
+            pwd_context.hash("x")
+            elapsed = time.perf_counter() - started
+        except Exception as e:
+            logger.warning(f"Skipping bcrypt calibration: {e}")
+            return
+        
+        # Each round step halves or doubles the work
+        calibrated = rounds
+        while elapsed > BCRYPT_TARGET_HASH_SECONDS and calibrated > BCRYPT_MIN_ROUNDS:
+            calibrated -= 1
+            elapsed /= 2
+        if calibrated != rounds:
+            pwd_context.update(bcrypt__rounds=calibrated)
+            logger.info(f"Lowered bcrypt rounds from {rounds} to {calibrated}")
+
 security = HTTPBearer()
 
+# How long verified token claims are reused without re-verifying the JWT
+SESSION_CACHE_TTL_SECONDS = int(os.environ.get("SESSION_CACHE_TTL_SECONDS", "60"))
+
+# How long user rows looked up by id are reused without re-reading the users table
+USER_CACHE_TTL_SECONDS = int(os.environ.get("USER_CACHE_TTL_SECONDS", "30"))
+
+# How long a token that failed verification is rejected without re-checking it
+REJECTED_TOKEN_TTL_SECONDS = int(os.environ.get("REJECTED_TOKEN_TTL_SECONDS", "300"))
+
+# How long an email with no active user short-circuits further lookups
+MISSING_EMAIL_TTL_SECONDS = int(os.environ.get("MISSING_EMAIL_TTL_SECONDS", "60"))
+
+# last_login writes are queued and flushed in batches off the login path
+LOGIN_FLUSH_INTERVAL_SECONDS = float(os.environ.get("LOGIN_FLUSH_INTERVAL_SECONDS", "2"))
+LOGIN_FLUSH_BATCH_SIZE = 500
+
+class TTLCache:
+    """Small thread-safe LRU cache whose entries expire after a TTL"""
+    
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+    
+    def set(self, key, value, ttl: Optional[float] = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def pop(self, key):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[0] if entry else None
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+# Decoded JWT claims, keyed by SHA-256 of the token so raw tokens are never
+# held in memory
+token_cache = TTLCache(maxsize=10_000, ttl=SESSION_CACHE_TTL_SECONDS)
+rejected_token_cache = TTLCache(maxsize=10_000, ttl=REJECTED_TOKEN_TTL_SECONDS)
+# Digests of tokens whose signature has been checked, kept until the token
+# expires; cheaper to hold than the claims, so it outlives token_cache entries
+verified_token_digests = TTLCache(maxsize=100_000, ttl=ACCESS_TOKEN_EXPIRE_SECONDS)
+
+def _parse_unverified(payload_b64: str) -> Optional[Dict[str, Any]]:
+    """Decode a JWT payload segment without checking the signature"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(payload_b64 + "=" * (-len(payload_b64) % 4)))
+    except ValueError:
+        return None
+    return payload if isinstance(payload, dict) else None
+
+def log_sha256_throughput() -> float:
+    """Benchmark hashlib.sha256 at startup; well under 1 GB/s means no SHA-NI path"""
+    block = b"\0" * (1 << 20)
+    rounds = 16
+    started = time.perf_counter()
+    for _ in range(rounds):
+        hashlib.sha256(block).digest()
+    elapsed = time.perf_counter() - started
+    throughput = rounds / elapsed / 1024 if elapsed > 0 else float("inf")
+    
+    if throughput < 1.0:
+        logger.warning(f"SHA-256 at {throughput:.2f} GB/s ({ssl.OPENSSL_VERSION}); hardware SHA extensions not in use")
+    else:
+        logger.info(f"SHA-256 at {throughput:.2f} GB/s ({ssl.OPENSSL_VERSION})")
+    return throughput
+
+def safe_eq(a: str, b: str) -> bool:
+    """Constant-time string comparison; use for every secret, token or hash check"""
+    return compare_digest(a.encode(), b.encode())
+
+def _normalize_email(email: str) -> str:
+    """Canonical form users.email is stored and looked up in"""
+    return email.strip().lower()
+
+def _looks_like_jwt(token: str) -> bool:
+    """Cheap structural check (three segments, sane length) before any decoding"""
+    return token.count('.') == 2 and 20 < len(token) < 2048
+
+# Column order of the auth lookups; rows come back as tuples and are mapped here
+_USER_COLS = ("id", "email", "username", "password_hash", "first_name", "last_name",
+              "is_active", "is_verified", "created_at", "last_login")
+_USER_PUBLIC_COLS = tuple(col for col in _USER_COLS if col != "password_hash")
+
+@dataclass(frozen=True)
+class SessionCtx:
+    """Client details recorded with a session, captured while the request is live"""
+    ip: Optional[str]
+    ua: str
+    
+    @classmethod
+    def from_request(cls, request: Request) -> "SessionCtx":
+        return cls(
+            ip=request.client.host if request.client else None,
+            ua=request.headers.get("user-agent", ""),
+        )
+
 class AuthManager:
     def __init__(self):
         self.secret_key = SECRET_KEY
         self.algorithm = ALGORITHM
+        # Decoder options and key are fixed, so build them once rather than per token
+        self._jwt = jwt.PyJWT(options={"require": ["exp", "sub"]})
+        self._key_bytes = self.secret_key.encode()
+        self._algorithms = (self.algorithm,)
+        self._user_cache = TTLCache(maxsize=5_000, ttl=USER_CACHE_TTL_SECONDS)
+        self._missing_email_cache = TTLCache(maxsize=100_000, ttl=MISSING_EMAIL_TTL_SECONDS)
+        self.login_update_queue = queue.Queue()
+        self._login_flusher = None
+        self._login_flusher_lock = threading.Lock()
         
     def get_db_connection(self):
         """Get database connection using shared module"""
         return get_db_connection()
     
+    def _release(self, conn, cursor=None) -> None:
+        """Close the cursor and hand the connection back to the pool"""
+        try:
+            if cursor:
+                cursor.close()
+        except Exception as e:
+            logger.error(f"Error closing cursor: {e}")
+        try:
+            if conn:
+                conn.close()
+        except Exception as e:
+            logger.error(f"Error closing database connection: {e}")
+    
     def verify_password(self, plain_password: str, hashed_password: str) -> bool:
         """Verify a password against its hash"""
-        return pwd_context.verify(plain_password, hashed_password)
+        with _password_hash_slots:
+            return pwd_context.verify(plain_password, hashed_password)
     
     def get_password_hash(self, password: str) -> str:
         """Hash a password"""
-        return pwd_context.hash(password)
+        _calibrate_bcrypt_rounds()
+        with _password_hash_slots:
+            return pwd_context.hash(password)
     
     def create_access_token(self, data: dict, expires_delta: Optional[timedelta] = None):
         """Create JWT access token"""
         to_encode = data.copy()
-        if expires_delta:
-            expire = datetime.utcnow() + expires_delta
-        else:
-            expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        lifetime = int(expires_delta.total_seconds()) if expires_delta else ACCESS_TOKEN_EXPIRE_SECONDS
+        to_encode["exp"] = int(time.time()) + lifetime
         
-        to_encode.update({"exp": expire})
-        encoded_jwt = jwt.encode(to_encode, self.secret_key, algorithm=self.algorithm)
-        return encoded_jwt
+        # HS256 signing with the precomputed header; verify_token still decodes
+        # through PyJWT
+        payload_b64 = _b64url(json.dumps(to_encode, separators=(",", ":")).encode())
+        signing_input = _JWT_HEADER_B64 + b"." + payload_b64
+        signature = hmac.new(self._key_bytes, signing_input, hashlib.sha256).digest()
+        return (signing_input + b"." + _b64url(signature)).decode()
     
     def verify_token(self, token: str) -> Dict[str, Any]:
         """Verify and decode JWT token with enhanced error handling"""
@@ -90,26 +311,52 @@ class AuthManager:
                 detail="Invalid token"
             )
             
+        # Repeat requests with the same token skip signature checking and
+        # decoding; expiry is still enforced on every hit
+        cache_key = hashlib.sha256(token.encode()).digest()
+        cached_claims = token_cache.get(cache_key)
+        if cached_claims is not None:
+            if cached_claims.get("exp", 0) > time.time():
+                return dict(cached_claims)
+            token_cache.pop(cache_key)
+            logger.info("Token has expired")
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Token has expired"
+            )
+        
+        # Reject garbage before PyJWT: we only issue tokens with our exact
+        # header, and payload/signature must be base64url
+        header, _, rest = token.partition(".")
+        payload_b64, _, signature_b64 = rest.partition(".")
+        if (header != _JWT_HEADER or not payload_b64 or not signature_b64
+                or (payload_b64 + signature_b64).translate(_NON_B64URL)):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid token"
+            )
+        
+        # Clients retrying the same bad token skip the HMAC check as well
+        rejected_key = cache_key[:16]
+        if rejected_token_cache.get(rejected_key) is not None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid token"
+            )
+        
+        # Signature already checked earlier: only the payload needs parsing
+        if verified_token_digests.get(cache_key) is not None:
+            payload = _parse_unverified(payload_b64)
+            if payload is not None:
+                return self._accept_claims(cache_key, payload)
+            
         try:
-            payload = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+            payload = self._jwt.decode(token, self._key_bytes, algorithms=self._algorithms)
             
-            # Validate payload structure
-            if not isinstance(payload, dict):
-                logger.warning("Invalid token payload structure")
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Invalid token payload"
-                )
-                
-            # Check for required fields
-            if 'sub' not in payload:
-                logger.warning("Token missing required 'sub' field")
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Invalid token payload"
-                )
-                
-            return payload
+            remaining = payload.get("exp", 0) - time.time()
+            if remaining > 0:
+                verified_token_digests.set(cache_key, True, remaining)
+            return self._accept_claims(cache_key, payload)
             
         except jwt.ExpiredSignatureError:
             logger.info("Token has expired")
@@ -117,8 +364,16 @@ class AuthManager:
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Token has expired"
             )
+        except jwt.MissingRequiredClaimError as e:
+            logger.warning(f"Token missing required '{e.claim}' field")
+            rejected_token_cache.set(rejected_key, True)
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid token payload"
+            )
         except jwt.InvalidTokenError:
             logger.warning("Invalid token signature")
+            rejected_token_cache.set(rejected_key, True)
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid token signature"
@@ -142,6 +397,18 @@ class AuthManager:
                 detail="Token verification failed"
             )
     
+    def _accept_claims(self, cache_key: bytes, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Check expiry of signature-verified claims and cache them"""
+        remaining = payload.get("exp", 0) - time.time()
+        if remaining <= 0:
+            logger.info("Token has expired")
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Token has expired"
+            )
+        token_cache.set(cache_key, dict(payload), min(SESSION_CACHE_TTL_SECONDS, remaining))
+        return payload
+    
     def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
         """Get user by email with comprehensive error handling"""
         if not email or not isinstance(email, str):
@@ -152,6 +419,13 @@ class AuthManager:
         if '@' not in email or len(email) > 255:
             logger.warning(f"Invalid email format: {email}")
             return None
+        
+        # Callers pass the address through _normalize_email once, up front
+        assert email == _normalize_email(email), "get_user_by_email expects a normalized email"
+        
+        # Credential-stuffing scans retry unknown addresses; skip the database for them
+        if self._missing_email_cache.get(email) is not None:
+            return None
             
         conn = None
         cursor = None
@@ -162,21 +436,22 @@ class AuthManager:
                 logger.error("Failed to get database connection in get_user_by_email")
                 return None
                 
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor = conn.cursor()
             
-            cursor.execute("""
+            execute_prepared(cursor, "auth_user_by_email", """
                 SELECT id, email, username, password_hash, first_name, last_name, 
                        is_active, is_verified, created_at, last_login
                 FROM users 
-                WHERE email = %s AND is_active = true
-            """, (email.lower().strip(),))  # Normalize email
+                WHERE lower(email) = $1 AND is_active
+            """, (email,))
             
-            user = cursor.fetchone()
+            row = cursor.fetchone()
             
-            if user:
-                return dict(user)
+            if row:
+                return dict(zip(_USER_COLS, row))
             else:
                 logger.debug(f"No active user found with email: {email}")
+                self._missing_email_cache.set(email, True)
                 return None
                 
         except psycopg2.Error as e:
@@ -186,22 +461,17 @@ class AuthManager:
             logger.error(f"Unexpected error getting user by email: {e}")
             return None
         finally:
-            try:
-                if cursor:
-                    cursor.close()
-            except Exception as e:
-                logger.error(f"Error closing cursor: {e}")
-            try:
-                if conn:
-                    conn.close()
-            except Exception as e:
-                logger.error(f"Error closing database connection: {e}")
+            self._release(conn, cursor)
     
     def get_user_by_id(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Get user by ID with comprehensive error handling"""
         if not user_id or not isinstance(user_id, int) or user_id <= 0:
             logger.warning(f"Invalid user_id provided: {user_id}")
             return None
+        
+        cached_user = self._user_cache.get(user_id)
+        if cached_user is not None:
+            return dict(cached_user)
             
         conn = None
         cursor = None
@@ -212,18 +482,20 @@ class AuthManager:
                 logger.error("Failed to get database connection in get_user_by_id")
                 return None
                 
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor = conn.cursor()
             
-            cursor.execute("""
+            execute_prepared(cursor, "auth_user_by_id", """
                 SELECT id, email, username, first_name, last_name, 
                        is_active, is_verified, created_at, last_login
                 FROM users 
-                WHERE id = %s AND is_active = true
+                WHERE id = $1 AND is_active
             """, (user_id,))
             
-            user = cursor.fetchone()
+            row = cursor.fetchone()
             
-            if user:
+            if row:
+                user = dict(zip(_USER_PUBLIC_COLS, row))
+                self._user_cache.set(user_id, user)
                 return dict(user)
             else:
                 logger.debug(f"No active user found with ID: {user_id}")
@@ -236,20 +508,14 @@ class AuthManager:
             logger.error(f"Unexpected error getting user by ID: {e}")
             return None
         finally:
-            try:
-                if cursor:
-                    cursor.close()
-            except Exception as e:
-                logger.error(f"Error closing cursor: {e}")
-            try:
-                if conn:
-                    conn.close()
-            except Exception as e:
-                logger.error(f"Error closing database connection: {e}")
+            self._release(conn, cursor)
     
     def create_user(self, email: str, username: str, password: str, 
                    first_name: str = None, last_name: str = None) -> Optional[Dict[str, Any]]:
         """Create a new user"""
+        email = _normalize_email(email) if isinstance(email, str) else email
+        conn = None
+        cursor = None
         try:
             # Check if user already exists
             if self.get_user_by_email(email):
@@ -273,8 +539,7 @@ class AuthManager:
             
             user = cursor.fetchone()
             conn.commit()
-            cursor.close()
-            conn.close()
+            self._missing_email_cache.pop(email)
             
             return dict(user) if user else None
             
@@ -294,9 +559,12 @@ class AuthManager:
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="User creation failed"
             )
+        finally:
+            self._release(conn, cursor)
     
     def authenticate_user(self, email: str, password: str) -> Optional[Dict[str, Any]]:
         """Authenticate user with email and password"""
+        email = _normalize_email(email) if isinstance(email, str) else email
         user = self.get_user_by_email(email)
         if not user:
             return None
@@ -304,49 +572,122 @@ class AuthManager:
         if not self.verify_password(password, user['password_hash']):
             return None
         
-        # Update last login
+        if pwd_context.needs_update(user['password_hash']):
+            threading.Thread(
+                target=self._rehash_password, args=(user['id'], password), daemon=True
+            ).start()
+        
+        # Update last login in the next batch flush
+        self.login_update_queue.put((user['id'], datetime.now(timezone.utc)))
+        self._ensure_login_flusher()
+        return user
+    
+    def _ensure_login_flusher(self) -> None:
+        """Start the background thread that writes queued last_login updates"""
+        if self._login_flusher is not None:
+            return
+        with self._login_flusher_lock:
+            if self._login_flusher is None:
+                self._login_flusher = threading.Thread(
+                    target=self._run_login_flusher, name="last-login-flusher", daemon=True
+                )
+                self._login_flusher.start()
+    
+    def _run_login_flusher(self) -> None:
+        while True:
+            time.sleep(LOGIN_FLUSH_INTERVAL_SECONDS)
+            try:
+                self.flush_login_updates()
+            except Exception as e:
+                logger.error(f"Error flushing last login updates: {e}")
+    
+    def flush_login_updates(self) -> int:
+        """Write queued last_login timestamps with one batched UPDATE per chunk"""
+        flushed = 0
+        while True:
+            latest = {}
+            while len(latest) < LOGIN_FLUSH_BATCH_SIZE:
+                try:
+                    user_id, logged_in_at = self.login_update_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if user_id not in latest or logged_in_at > latest[user_id]:
+                    latest[user_id] = logged_in_at
+            if not latest:
+                return flushed
+            
+            conn = None
+            cursor = None
+            try:
+                conn = self.get_db_connection()
+                cursor = conn.cursor()
+                execute_values(cursor, """
+                    UPDATE users SET last_login = data.ts
+                    FROM (VALUES %s) AS data(id, ts)
+                    WHERE users.id = data.id
+                """, list(latest.items()), template="(%s, %s::timestamptz)")
+                conn.commit()
+            except Exception as e:
+                logger.error(f"Error updating last login for {len(latest)} users: {e}")
+                # Keep the batch for the next flush instead of dropping it
+                for item in latest.items():
+                    self.login_update_queue.put(item)
+                return flushed
+            finally:
+                self._release(conn, cursor)
+            
+            # last_login changed; drop the cached rows
+            for user_id in latest:
+                self.invalidate_user(user_id)
+            flushed += len(latest)
+    
+    def _rehash_password(self, user_id: int, password: str) -> None:
+        """Replace a deprecated password hash with one from the preferred scheme"""
+        conn = None
+        cursor = None
         try:
+            password_hash = self.get_password_hash(password)
             conn = self.get_db_connection()
             cursor = conn.cursor()
             cursor.execute(
-                "UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = %s",
-                (user['id'],)
+                "UPDATE users SET password_hash = %s WHERE id = %s",
+                (password_hash, user_id)
             )
             conn.commit()
-            cursor.close()
-            conn.close()
         except Exception as e:
-            logger.error(f"Error updating last login: {e}")
-        
-        return user
+            logger.error(f"Error rehashing password for user {user_id}: {e}")
+        finally:
+            self._release(conn, cursor)
     
-    def store_session(self, user_id: int, token: str, request: Request) -> None:
+    def invalidate_user(self, user_id: int) -> None:
+        """Forget the cached row for a user whose record has changed"""
+        self._user_cache.pop(user_id)
+    
+    def store_session(self, user_id: int, token: str, ctx: SessionCtx) -> None:
         """Store user session"""
+        conn = None
+        cursor = None
         try:
             conn = self.get_db_connection()
             cursor = conn.cursor()
             
-            # Hash token for storage
-            token_hash = hashlib.sha256(token.encode()).hexdigest()
-            
-            # Get client info
-            ip_address = request.client.host if request.client else None
-            user_agent = request.headers.get("user-agent", "")
+            # Store the raw 32-byte SHA-256; BYTEA halves the row and index versus hex
+            token_hash = psycopg2.Binary(hashlib.sha256(token.encode()).digest())
             
             # Calculate expiry
-            expires_at = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+            expires_at = datetime.now(timezone.utc) + timedelta(seconds=ACCESS_TOKEN_EXPIRE_SECONDS)
             
-            cursor.execute("""
+            execute_prepared(cursor, "auth_store_session", """
                 INSERT INTO user_sessions (user_id, token_hash, expires_at, ip_address, user_agent)
-                VALUES (%s, %s, %s, %s, %s)
-            """, (user_id, token_hash, expires_at, ip_address, user_agent))
+                VALUES ($1, $2, $3, $4, $5)
+            """, (user_id, token_hash, expires_at, ctx.ip, ctx.ua))
             
             conn.commit()
-            cursor.close()
-            conn.close()
             
         except Exception as e:
             logger.error(f"Error storing session: {e}")
+        finally:
+            self._release(conn, cursor)
 
 # Global auth manager instance
 auth_manager = AuthManager()
@@ -376,7 +717,7 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
 # Optional dependency for routes that work with or without auth
 def get_current_user_optional(credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False))) -> Optional[Dict[str, Any]]:
     """Get current user if authenticated, None otherwise"""
-    if not credentials:
+    if not credentials or not _looks_like_jwt(credentials.credentials):
         return None
     
     try:
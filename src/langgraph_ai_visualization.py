@@ -2,17 +2,28 @@
 # LangGraph-based AI Visualization System for ERCOT Analytics Dashboard
 
 import asyncio
+import copy
+import functools
+import hashlib
 import json
+import time
 import logging
 from datetime import datetime
-from typing import Dict, List, Optional, Any, Literal
+from typing import Dict, List, Optional, Any, Literal, Sequence, Tuple, Union
 from dataclasses import dataclass, field
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import orjson
+from pydantic import BaseModel, Field, ValidationError
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
 import re
 import boto3
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from database.db_connection import get_db_connection, execute_prepared, AI_PANEL_ORDER_LOCK_NS
 
 from langgraph.graph import StateGraph, MessagesState, START, END
 from langgraph.graph.message import add_messages
@@ -22,16 +33,543 @@ from typing_extensions import TypedDict
 
 logger = logging.getLogger(__name__)
 
+# ERCOT tables refresh at most every 5 minutes, so identical previews within
+# that window return the same rows
+PREVIEW_CACHE_TTL_SECONDS = float(os.getenv("PREVIEW_CACHE_TTL_SECONDS", "300"))
+PREVIEW_CACHE_MAX_ENTRIES = 256
+
+# Upper bound on Bedrock calls in flight, each holding a worker thread
+BEDROCK_MAX_CONCURRENCY = int(os.getenv("BEDROCK_MAX_CONCURRENCY", "8"))
+
+# Stored error_message is truncated to this many characters; the full list
+# is still kept in chart_config
+ERROR_MESSAGE_MAX_CHARS = 2000
+
+# Explicit chart type keywords, in priority order: the first type with any
+# keyword in the request wins
+VISUALIZATION_PATTERNS = {
+    'bar': ['bar chart', 'bar graph', 'bars', 'column chart', 'histogram'],
+    'line': ['line chart', 'line graph', 'time series', 'trend', 'over time'],
+    'area': ['area chart', 'filled chart', 'area graph'],
+    'scatter': ['scatter plot', 'scatter chart', 'correlation', 'relationship'],
+    'pie': ['pie chart', 'donut', 'distribution', 'breakdown', 'percentage'],
+    'gauge': ['gauge', 'meter', 'dial', 'speedometer'],
+    'table': ['table', 'list', 'tabular', 'data table'],
+    'heatmap': ['heatmap', 'heat map', 'intensity', 'correlation matrix'],
+    'stat': ['stat', 'single value', 'metric', 'number', 'current value'],
+    'timeseries': ['timeseries', 'time series', 'timeline', 'historical', 'over time']
+}
+
+CAPACITY_KEYWORDS = [
+    'capacity', 'reserve', 'ancillary', 'stress', 'grid stress', 'system stress',
+    'demand', 'load', 'generation', 'responsive', 'regulation', 'contingency',
+    'spinning', 'non-spin', 'emergency', 'outage', 'availability', 'margin',
+    'reliability', 'stability', 'frequency response', 'volt', 'reactive'
+]
+
+PRICE_KEYWORDS = [
+    'price', 'pricing', 'settlement', 'hub', 'cost', 'market', 'clearing',
+    'locational marginal', 'lmp', 'energy price', 'real time', 'day ahead'
+]
+
+def _keyword_regex(keywords: List[str]) -> "re.Pattern":
+    """One alternation per keyword list, so a substring scan is a single C-level search"""
+    return re.compile('|'.join(re.escape(keyword) for keyword in keywords))
+
+_VISUALIZATION_TYPE_REGEXES = [
+    (chart_type, _keyword_regex(keywords)) for chart_type, keywords in VISUALIZATION_PATTERNS.items()
+]
+# Context hints used when no chart type is named explicitly
+_COMPARISON_CONTEXT_RE = _keyword_regex(['compare', 'vs', 'versus', 'against'])
+_CURRENT_VALUE_CONTEXT_RE = _keyword_regex(['current', 'now', 'latest', 'today'])
+_TREND_CONTEXT_RE = _keyword_regex(['trend', 'change', 'evolution', 'history'])
+# Broader operational terms the ambiguous-request fallback treats as capacity data
+GRID_CONTEXT_KEYWORDS = [
+    'stress', 'capacity', 'reserve', 'grid', 'system', 'stability',
+    'emergency', 'outage', 'regulation', 'frequency', 'demand', 'load'
+]
+
+# Data source categories, one bit each so a single scan can report all of them
+CAT_CAPACITY = 1 << 0
+CAT_PRICE = 1 << 1
+CAT_GRID_CONTEXT = 1 << 2
+
+def _build_keyword_classifier(groups: Sequence[Tuple[Sequence[str], int]]):
+    """Compile (keywords, category bit) groups into one pattern plus a keyword -> category mask table"""
+    categories: Dict[str, int] = {}
+    for keywords, category in groups:
+        for keyword in keywords:
+            categories[keyword] = categories.get(keyword, 0) | category
+    
+    # The lookahead tries every start offset and the alternation takes the longest
+    # keyword there; folding in the mask of every keyword it contains keeps the
+    # result identical to testing each keyword separately
+    masks = {}
+    for keyword in categories:
+        mask = 0
+        for other, category in categories.items():
+            if other in keyword:
+                mask |= category
+        masks[keyword] = mask
+    ordered = sorted(categories, key=len, reverse=True)
+    pattern = re.compile('(?=(' + '|'.join(re.escape(keyword) for keyword in ordered) + '))')
+    return pattern, masks
+
+def _keyword_mask(pattern: "re.Pattern", masks: Dict[str, int], text: str) -> int:
+    """Single scan of `text` returning the union of the categories of every keyword in it"""
+    mask = 0
+    for match in pattern.finditer(text):
+        mask |= masks[match.group(1)]
+    return mask
+
+_DATA_SOURCE_KEYWORDS_RE, _DATA_SOURCE_KEYWORD_MASKS = _build_keyword_classifier((
+    (CAPACITY_KEYWORDS, CAT_CAPACITY),
+    (PRICE_KEYWORDS, CAT_PRICE),
+    (GRID_CONTEXT_KEYWORDS, CAT_GRID_CONTEXT),
+))
+
+def _classify_data_source_keywords(request_lower: str) -> int:
+    """Return the CAT_* bitmask of every keyword category mentioned in the request"""
+    return _keyword_mask(_DATA_SOURCE_KEYWORDS_RE, _DATA_SOURCE_KEYWORD_MASKS, request_lower)
+
+@functools.lru_cache(maxsize=4096)
+def _match_visualization_keyword(request_lower: str) -> Optional[Tuple[str, str]]:
+    """Return (chart_type, keyword) for the highest-priority explicit chart mention"""
+    for chart_type, pattern in _VISUALIZATION_TYPE_REGEXES:
+        match = pattern.search(request_lower)
+        if match:
+            return chart_type, match.group(0)
+    return None
+
+# Bedrock prompt pieces, stored without source indentation: every space is an
+# input token on every request
+_AI_CONTEXT_TEMPLATE = """Data Source: {table_name}
+Description: {description}
+Columns: {columns}
+Time Column: {time_column}
+
+Important SQL Requirements:
+- Use 'timestamp AS time' for time column
+- Use $__timeFilter(timestamp) for time filtering
+- Use quoted aliases for metrics like "Hub Price"
+- Single line query, no extra whitespace"""
+
+_QUERY_PROMPT_TEMPLATE = """You are an expert SQL query generator for ERCOT energy data visualization.
+
+Context:
+{context}
+
+User Request: {request_text}
+
+Generate a JSON response with:
+{{"sql_query": "Single line SQL query", "chart_type": "timeseries", "title": "Descriptive chart title"}}
+
+Requirements:
+- MUST use 'timestamp AS time'
+- MUST use $__timeFilter(timestamp) not NOW()
+- MUST be single line, no indentation
+- Use proper quoted aliases"""
+
+# Every rule-based fallback query is the same SELECT with different columns and
+# capacity filters, so each is rendered once here and the fallback only picks one
+_FALLBACK_SQL_TEMPLATE = (
+    'SELECT timestamp AS time, {columns} FROM {table} '
+    'WHERE {filters}$__timeFilter(timestamp) ORDER BY timestamp'
+)
+_HDL_SUBCATEGORY = 'Capacity available to increase Generation Resource Base Points in the next 5 minutes in SCED (HDL)'
+
+def _settlement_query(columns: str, title: str) -> Dict[str, str]:
+    """Fallback query over the settlement price hubs"""
+    return {
+        'sql_query': _FALLBACK_SQL_TEMPLATE.format(columns=columns, table='ercot_settlement_prices', filters=''),
+        'chart_type': 'timeseries',
+        'title': title
+    }
+
+def _capacity_query(label: str, category: str, subcategory: str, title: str) -> Dict[str, str]:
+    """Fallback query for one capacity monitor category/subcategory series"""
+    return {
+        'sql_query': _FALLBACK_SQL_TEMPLATE.format(
+            columns=f'value AS "{label}"',
+            table='ercot_capacity_monitor',
+            filters=f"category = '{category}' AND subcategory = '{subcategory}' AND "
+        ),
+        'chart_type': 'timeseries',
+        'title': title
+    }
+
+_FALLBACK_QUERIES: Dict[str, Dict[str, str]] = {
+    'houston_hub': _settlement_query('hb_houston AS "Houston Hub Price"', 'Houston Hub Settlement Prices'),
+    'north_hub': _settlement_query('hb_north AS "North Hub Price"', 'North Hub Settlement Prices'),
+    'south_hub': _settlement_query('hb_south AS "South Hub Price"', 'South Hub Settlement Prices'),
+    'west_hub': _settlement_query('hb_west AS "West Hub Price"', 'West Hub Settlement Prices'),
+    'all_hubs': _settlement_query(
+        'hb_houston AS "Houston Hub", hb_north AS "North Hub", hb_south AS "South Hub", hb_west AS "West Hub"',
+        'ERCOT Settlement Point Prices'
+    ),
+    'grid_stress': _capacity_query(
+        'Available Capacity to Increase (MW)', 'System Available Capacity (MW)', _HDL_SUBCATEGORY,
+        'Grid Stress - Available Generation Capacity'
+    ),
+    'reserve_margin': _capacity_query(
+        'Responsive Reserve (MW)', 'Responsive Reserve Capacity (MW)', 'Generation Resources',
+        'Reserve Margin - Generation Resources'
+    ),
+    'emergency_outage': _capacity_query(
+        'Emergency/Outage Capacity (MW)', 'EMR, OUT, and OUTL Capacity (MW)',
+        'Aggregate telemetered HSL capacity for Resources with a telemetered Resource Status of EMR',
+        'Emergency and Outage Conditions'
+    ),
+    'regulation_up': _capacity_query(
+        'Regulation Up (MW)', 'Regulation Capacity (MW)', 'Deployed Reg-Up',
+        'Frequency Regulation - Deployed Up'
+    ),
+    'non_spin_reserve': _capacity_query(
+        'Non-Spin Reserve (MW)', 'Non-Spin Reserve Capacity (MW)',
+        'On-Line Generation Resources with Output Schedules',
+        'Non-Spinning Reserve Capacity'
+    ),
+    'operating_reserve': _capacity_query(
+        'Operating Reserve (MW)', 'Real-Time Operating Reserve Demand Curve Capacity (MW)',
+        'Real-Time On-Line reserve capacity',
+        'Real-Time Operating Reserve'
+    ),
+    'capacity_overview': _capacity_query(
+        'Available Increase Capacity (MW)', 'System Available Capacity (MW)', _HDL_SUBCATEGORY,
+        'System Available Capacity Overview'
+    ),
+    'data_overview': {
+        'sql_query': 'SELECT timestamp AS time, value AS "Value" FROM ercot_capacity_monitor WHERE $__timeFilter(timestamp) ORDER BY timestamp LIMIT 1000',
+        'chart_type': 'timeseries',
+        'title': 'ERCOT Data Overview'
+    }
+}
+
+# Rule-based fallback routing per table: (keywords, query name) in priority
+# order, then the query used when no rule matches
+FALLBACK_QUERY_RULES = {
+    'ercot_settlement_prices': ([
+        (['houston'], 'houston_hub'),
+        (['north'], 'north_hub'),
+        (['south'], 'south_hub'),
+        (['west'], 'west_hub'),
+    ], 'all_hubs'),
+    'ercot_capacity_monitor': ([
+        (['stress', 'grid stress', 'system stress', 'strain'], 'grid_stress'),
+        (['reserve', 'margin', 'contingency'], 'reserve_margin'),
+        (['emergency', 'outage', 'emr', 'out'], 'emergency_outage'),
+        (['regulation', 'frequency', 'freq'], 'regulation_up'),
+        (['spin', 'spinning', 'non-spin'], 'non_spin_reserve'),
+        (['demand', 'curve', 'operating'], 'operating_reserve'),
+    ], 'capacity_overview'),
+}
+
+def _build_fallback_matchers():
+    """One keyword scan per table; bit i of the mask is rule i, so the lowest set bit wins"""
+    matchers = {}
+    for table_name, (rules, default_name) in FALLBACK_QUERY_RULES.items():
+        pattern, masks = _build_keyword_classifier(
+            [(keywords, 1 << index) for index, (keywords, _) in enumerate(rules)]
+        )
+        matchers[table_name] = (pattern, masks, tuple(name for _, name in rules), default_name)
+    return matchers
+
+_FALLBACK_MATCHERS = _build_fallback_matchers()
+
+@functools.lru_cache(maxsize=512)
+def _resolve_fallback_query_name(table_name: str, request_lower: str) -> str:
+    """Name of the fallback query for a table and lower-cased request"""
+    matcher = _FALLBACK_MATCHERS.get(table_name)
+    if matcher is None:
+        # Final fallback
+        return 'data_overview'
+    
+    pattern, masks, rule_names, default_name = matcher
+    if not request_lower:
+        return default_name
+    mask = _keyword_mask(pattern, masks, request_lower)
+    if mask:
+        return rule_names[(mask & -mask).bit_length() - 1]
+    return default_name
+
+# Rewrites NOW() - INTERVAL filters to the Grafana macro; compiled once
+_NOW_INTERVAL_FILTER_RE = re.compile(r'WHERE.*NOW\(\).*?(?=ORDER|$)')
+
+@functools.lru_cache(maxsize=256)
+def _to_preview_sql(query: str) -> str:
+    """Swap Grafana's time macro for a fixed 24-hour window so Postgres can run the query"""
+    return query.replace('$__timeFilter(timestamp)', "timestamp >= NOW() - INTERVAL '24 hours'")
+
+# Grafana needs these exact fragments; FROM may be written in any case, and a
+# case-insensitive search avoids upper-casing a copy of the query
+_REQUIRED_SQL_TOKENS = (
+    ('timestamp AS time', "Missing 'timestamp AS time' requirement"),
+    ('$__timeFilter(timestamp)', "Missing '$__timeFilter(timestamp)' requirement"),
+)
+_FROM_RE = re.compile('FROM', re.IGNORECASE)
+
+@functools.lru_cache(maxsize=4)
+def _dashboard_timestamps(epoch_seconds: int) -> Tuple[str, str]:
+    """Compact tag timestamp and ISO creation time for one wall-clock second"""
+    now = datetime.fromtimestamp(epoch_seconds)
+    return now.strftime("%Y%m%d_%H%M%S"), now.isoformat()
+
+# Dashboard fields that never vary between requests
+_DASHBOARD_DEFAULTS = {
+    "id": None,
+    "timezone": "browser",
+    "time": {"from": "now-24h", "to": "now"},
+    "refresh": "30s",
+    "schemaVersion": 37,
+    "version": 0,
+    "fiscalYearStartMonth": 0,
+    "liveNow": False,
+    "weekStart": ""
+}
+_PANEL_DATASOURCE = {
+    "uid": "aep8tntrm562ob",
+    "type": "grafana-postgresql-datasource"
+}
+_PANEL_GRID_POS = {"h": 12, "w": 24, "x": 0, "y": 0}
+
+# Grafana field configs and panel options; built once at import and shared
+# read-only by every dashboard
+_TIMESERIES_FIELD_CONFIG = {
+    "defaults": {
+        "custom": {
+            "drawStyle": "line",
+            "lineInterpolation": "linear",
+            "barAlignment": 0,
+            "lineWidth": 2,
+            "fillOpacity": 0,
+            "gradientMode": "none",
+            "spanNulls": False,
+            "insertNulls": False,
+            "showPoints": "auto",
+            "pointSize": 5,
+            "stacking": {"mode": "none", "group": "A"},
+            "axisPlacement": "auto",
+            "axisLabel": "",
+            "axisColorMode": "text",
+            "axisBorderShow": False,
+            "scaleDistribution": {"type": "linear"},
+            "axisCenteredZero": False,
+            "hideFrom": {"tooltip": False, "viz": False, "legend": False},
+            "thresholdsStyle": {"mode": "off"}
+        },
+        "color": {"mode": "palette-classic"},
+        "mappings": [],
+        "thresholds": {
+            "mode": "absolute",
+            "steps": [
+                {"color": "green", "value": None},
+                {"color": "red", "value": 80}
+            ]
+        }
+    },
+    "overrides": []
+}
+
+_BAR_FIELD_CONFIG = {
+    "defaults": {
+        "custom": {
+            "orientation": "auto",
+            "barWidth": 0.97,
+            "barMaxWidth": 100,
+            "groupWidth": 0.7,
+            "axisPlacement": "auto",
+            "axisLabel": "",
+            "axisColorMode": "text",
+            "scaleDistribution": {"type": "linear"},
+            "axisCenteredZero": False,
+            "hideFrom": {"tooltip": False, "viz": False, "legend": False},
+            "thresholdsStyle": {"mode": "off"}
+        },
+        "color": {"mode": "palette-classic"},
+        "mappings": [],
+        "thresholds": {
+            "mode": "absolute",
+            "steps": [
+                {"color": "green", "value": None},
+                {"color": "red", "value": 80}
+            ]
+        }
+    },
+    "overrides": []
+}
+
+_STAT_FIELD_CONFIG = {
+    "defaults": {
+        "color": {"mode": "thresholds"},
+        "custom": {
+            "displayMode": "basic",
+            "cellDisplayMode": "basic",
+            "orientation": "auto",
+            "textMode": "auto",
+            "wideLayout": True,
+            "showUnfilled": True
+        },
+        "mappings": [],
+        "thresholds": {
+            "mode": "absolute",
+            "steps": [
+                {"color": "green", "value": None},
+                {"color": "red", "value": 80}
+            ]
+        },
+        "unit": "short"
+    },
+    "overrides": []
+}
+
+_GAUGE_FIELD_CONFIG = {
+    "defaults": {
+        "color": {"mode": "thresholds"},
+        "custom": {},
+        "mappings": [],
+        "thresholds": {
+            "mode": "absolute",
+            "steps": [
+                {"color": "green", "value": None},
+                {"color": "yellow", "value": 50},
+                {"color": "red", "value": 80}
+            ]
+        },
+        "unit": "short",
+        "min": 0,
+        "max": 100
+    },
+    "overrides": []
+}
+
+_TABLE_FIELD_CONFIG = {
+    "defaults": {
+        "color": {"mode": "thresholds"},
+        "custom": {
+            "align": "auto",
+            "cellOptions": {"type": "auto"},
+            "inspect": False
+        },
+        "mappings": [],
+        "thresholds": {
+            "mode": "absolute",
+            "steps": [
+                {"color": "green", "value": None},
+                {"color": "red", "value": 80}
+            ]
+        }
+    },
+    "overrides": []
+}
+
+# Area charts are timeseries panels with a filled, gradient series
+_AREA_FIELD_CONFIG = copy.deepcopy(_TIMESERIES_FIELD_CONFIG)
+_AREA_FIELD_CONFIG["defaults"]["custom"]["fillOpacity"] = 30
+_AREA_FIELD_CONFIG["defaults"]["custom"]["gradientMode"] = "opacity"
+
+_TIMESERIES_OPTIONS = {
+    "tooltip": {"mode": "single", "sort": "none"},
+    "legend": {
+        "showLegend": True,
+        "displayMode": "list",
+        "placement": "bottom",
+        "calcs": []
+    }
+}
+
+_BAR_OPTIONS = {
+    "tooltip": {"mode": "single", "sort": "none"},
+    "legend": {
+        "showLegend": True,
+        "displayMode": "list",
+        "placement": "bottom",
+        "calcs": []
+    },
+    "orientation": "auto"
+}
+
+_STAT_OPTIONS = {
+    "reduceOptions": {
+        "values": False,
+        "calcs": ["lastNotNull"],
+        "fields": ""
+    },
+    "orientation": "auto",
+    "textMode": "auto",
+    "colorMode": "value",
+    "graphMode": "area",
+    "justifyMode": "auto"
+}
+
+_GAUGE_OPTIONS = {
+    "reduceOptions": {
+        "values": False,
+        "calcs": ["lastNotNull"],
+        "fields": ""
+    },
+    "orientation": "auto",
+    "showThresholdLabels": False,
+    "showThresholdMarkers": True
+}
+
+_TABLE_OPTIONS = {
+    "showHeader": True,
+    "cellHeight": "sm",
+    "footer": {
+        "show": False,
+        "reducer": ["sum"],
+        "countRows": False,
+        "fields": ""
+    }
+}
+
+# Complete panel config per chart type, assembled once and shared read-only by
+# every dashboard; line, timeseries and unknown types use the default
+_DEFAULT_PANEL_CONFIG = {
+    "type": "timeseries",
+    "format": "time_series",
+    "fieldConfig": _TIMESERIES_FIELD_CONFIG,
+    "options": _TIMESERIES_OPTIONS
+}
+_PANEL_CONFIGS: Dict[str, Dict[str, Any]] = {
+    "bar": {
+        "type": "barchart",
+        "format": "time_series",
+        "fieldConfig": _BAR_FIELD_CONFIG,
+        "options": _BAR_OPTIONS
+    },
+    "stat": {
+        "type": "stat",
+        "format": "time_series",
+        "fieldConfig": _STAT_FIELD_CONFIG,
+        "options": _STAT_OPTIONS
+    },
+    "gauge": {
+        "type": "gauge",
+        "format": "time_series",
+        "fieldConfig": _GAUGE_FIELD_CONFIG,
+        "options": _GAUGE_OPTIONS
+    },
+    "table": {
+        "type": "table",
+        "format": "table",
+        "fieldConfig": _TABLE_FIELD_CONFIG,
+        "options": _TABLE_OPTIONS
+    },
+    "area": {**_DEFAULT_PANEL_CONFIG, "fieldConfig": _AREA_FIELD_CONFIG},
+}
+
 # State Management for LangGraph
 class AIVisualizationState(TypedDict):
     """State object for the AI visualization workflow"""
     # Input data
     user_id: int
     request_text: str
+    request_lower: str  # lower-cased once for every keyword matcher
     visualization_type: str
     
     # Processing context
-    available_data_sources: List[Dict[str, Any]]
+    available_data_sources: Sequence[Dict[str, Any]]
     selected_data_source: Optional[Dict[str, Any]]
     
     # AI-generated artifacts
@@ -59,6 +597,32 @@ class AIVisualizationState(TypedDict):
     visualization_id: Optional[int]
     iframe_url: Optional[str]
 
+# Starting values shared by every run; the per-request fields and the mutable
+# lists are filled in by process_visualization_request
+_INITIAL_STATE_TEMPLATE = AIVisualizationState(
+    selected_data_source=None,
+    analysis_result=None,
+    raw_sql_query=None,
+    cleaned_sql_query=None,
+    chart_type=None,
+    chart_title=None,
+    detected_visualization_type=None,
+    sql_validation_result=None,
+    data_preview=None,
+    dashboard_config=None,
+    grafana_response=None,
+    dashboard_uid=None,
+    status="processing",
+    visualization_id=None,
+    iframe_url=None
+)
+
+class BedrockReply(BaseModel):
+    """Query-generation reply expected from the model"""
+    sql_query: str = Field(min_length=1)
+    chart_type: str = 'timeseries'
+    title: str = 'AI Generated Chart'
+
 @dataclass
 class DataSource:
     """Data source metadata for LangGraph processing"""
@@ -78,13 +642,48 @@ class LangGraphAIVisualizer:
         )
         self.grafana_url = os.getenv("GRAFANA_URL", "http://grafana:3000")
         self.grafana_external_url = os.getenv("GRAFANA_EXTERNAL_URL", "http://localhost:3000")
+        self._grafana_auth = (os.getenv("GRAFANA_USER", "admin"), os.getenv("GRAFANA_PASSWORD", "admin"))
+        self._grafana_session = self._create_grafana_session()
+        
+        # Preview rows keyed by a digest of the cleaned SQL: (expires_at, rows)
+        self._preview_cache: Dict[bytes, Tuple[float, List[Dict]]] = {}
+        
+        self._bedrock_slots = asyncio.Semaphore(BEDROCK_MAX_CONCURRENCY)
         
         # Initialize data sources
         self.data_sources = self._initialize_data_sources()
         
+        # Built once and shared read-only by every run instead of per request
+        self._ds_list = tuple(
+            {
+                'table_name': ds.table_name,
+                'description': ds.description,
+                'columns': tuple(ds.columns),
+                'time_column': ds.time_column
+            }
+            for ds in self.data_sources
+        )
+        self._ds_by_name = {ds['table_name']: ds for ds in self._ds_list}
+        self._ds_context = {ds['table_name']: self._format_ai_context(ds) for ds in self._ds_list}
+        
         # Build the LangGraph workflow
         self.workflow = self._build_workflow()
     
+    def _create_grafana_session(self) -> requests.Session:
+        """Keep-alive session reused for every Grafana deployment"""
+        session = requests.Session()
+        session.auth = self._grafana_auth
+        session.headers.update({'Content-Type': 'application/json'})
+        
+        # Retry only failed connects: a POST that reached Grafana is not replayed
+        adapter = HTTPAdapter(
+            pool_maxsize=8,
+            max_retries=Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.2)
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+    
     def _initialize_data_sources(self) -> List[DataSource]:
         """Initialize available data sources with enhanced metadata"""
         return [
@@ -128,9 +727,21 @@ class LangGraphAIVisualizer:
         
         # Define edges and routing logic
         workflow.add_edge(START, "parse_request")
-        workflow.add_edge("parse_request", "detect_visualization_type")
-        workflow.add_edge("detect_visualization_type", "analyze_data_sources")
-        workflow.add_edge("analyze_data_sources", "generate_query")
+        
+        # Type detection and data source selection are independent: fan out
+        # after parsing and join before query generation. Both nodes return
+        # only the keys they write so their updates merge in the same step.
+        # Rejected requests skip both branches so they never reach Bedrock.
+        workflow.add_conditional_edges(
+            "parse_request",
+            self._should_analyze_request,
+            {
+                "detect": "detect_visualization_type",
+                "analyze": "analyze_data_sources",
+                "error": "handle_error"
+            }
+        )
+        workflow.add_edge(["detect_visualization_type", "analyze_data_sources"], "generate_query")
         
         # Conditional routing after query generation
         workflow.add_conditional_edges(
@@ -183,7 +794,7 @@ class LangGraphAIVisualizer:
     
     async def _parse_request_node(self, state: AIVisualizationState) -> AIVisualizationState:
         """Parse and validate the user request"""
-        logger.info(f"🔍 Parsing user request: {state['request_text']}")
+        logger.info("🔍 Parsing user request: %s", state['request_text'])
         
         try:
             # Basic validation
@@ -193,72 +804,46 @@ class LangGraphAIVisualizer:
                 return state
             
             # Initialize data sources in state
-            state['available_data_sources'] = [
-                {
-                    'table_name': ds.table_name,
-                    'description': ds.description,
-                    'columns': ds.columns,
-                    'time_column': ds.time_column
-                }
-                for ds in self.data_sources
-            ]
+            state['available_data_sources'] = self._ds_list
             
-            logger.info(f"✅ Request parsed successfully. Found {len(state['available_data_sources'])} data sources")
+            logger.info("✅ Request parsed successfully. Found %s data sources", len(state['available_data_sources']))
             return state
             
         except Exception as e:
-            logger.error(f"❌ Error parsing request: {e}")
+            logger.error("❌ Error parsing request: %s", e)
             state['errors'].append(f"Request parsing failed: {str(e)}")
             state['status'] = "failed"
             return state
     
-    async def _detect_visualization_type_node(self, state: AIVisualizationState) -> AIVisualizationState:
+    async def _detect_visualization_type_node(self, state: AIVisualizationState) -> Dict[str, Any]:
         """Detect the desired visualization type from the user request"""
         logger.info("🎨 Detecting visualization type from request")
         
         try:
-            request_lower = state['request_text'].lower()
-            
-            # Define visualization type patterns
-            visualization_patterns = {
-                'bar': ['bar chart', 'bar graph', 'bars', 'column chart', 'histogram'],
-                'line': ['line chart', 'line graph', 'time series', 'trend', 'over time'],
-                'area': ['area chart', 'filled chart', 'area graph'],
-                'scatter': ['scatter plot', 'scatter chart', 'correlation', 'relationship'],
-                'pie': ['pie chart', 'donut', 'distribution', 'breakdown', 'percentage'],
-                'gauge': ['gauge', 'meter', 'dial', 'speedometer'],
-                'table': ['table', 'list', 'tabular', 'data table'],
-                'heatmap': ['heatmap', 'heat map', 'intensity', 'correlation matrix'],
-                'stat': ['stat', 'single value', 'metric', 'number', 'current value'],
-                'timeseries': ['timeseries', 'time series', 'timeline', 'historical', 'over time']
-            }
+            request_lower = state['request_lower']
             
             # Default to timeseries for time-based data
             detected_type = 'timeseries'
             confidence = 0.3  # Default confidence
             
             # Check for explicit chart type mentions
-            for chart_type, keywords in visualization_patterns.items():
-                for keyword in keywords:
-                    if keyword in request_lower:
-                        detected_type = chart_type
-                        confidence = 0.9
-                        logger.info(f"🎯 Detected visualization type: {chart_type} (keyword: '{keyword}')")
-                        break
-                if confidence > 0.8:
-                    break
+            explicit_match = _match_visualization_keyword(request_lower)
+            if explicit_match:
+                detected_type, keyword = explicit_match
+                confidence = 0.9
+                logger.info("🎯 Detected visualization type: %s (keyword: '%s')", detected_type, keyword)
             
             # Smart defaults based on data context
             if confidence < 0.8:
-                if any(word in request_lower for word in ['compare', 'vs', 'versus', 'against']):
+                if _COMPARISON_CONTEXT_RE.search(request_lower):
                     detected_type = 'bar'
                     confidence = 0.7
                     logger.info("🎯 Detected comparison context → bar chart")
-                elif any(word in request_lower for word in ['current', 'now', 'latest', 'today']):
+                elif _CURRENT_VALUE_CONTEXT_RE.search(request_lower):
                     detected_type = 'stat'
                     confidence = 0.7
                     logger.info("🎯 Detected current value context → stat")
-                elif any(word in request_lower for word in ['trend', 'change', 'evolution', 'history']):
+                elif _TREND_CONTEXT_RE.search(request_lower):
                     detected_type = 'timeseries'
                     confidence = 0.8
                     logger.info("🎯 Detected trend context → timeseries")
@@ -268,81 +853,61 @@ class LangGraphAIVisualizer:
                     confidence = 0.6
                     logger.info("🎯 Default for energy data → timeseries")
             
-            state['detected_visualization_type'] = detected_type
-            state['chart_type'] = detected_type
-            
-            logger.info(f"✅ Visualization type detection complete: {detected_type} (confidence: {confidence})")
-            return state
+            logger.info("✅ Visualization type detection complete: %s (confidence: %s)", detected_type, confidence)
+            return {'detected_visualization_type': detected_type, 'chart_type': detected_type}
             
         except Exception as e:
-            logger.error(f"❌ Error detecting visualization type: {e}")
+            logger.error("❌ Error detecting visualization type: %s", e)
             # Default fallback
-            state['detected_visualization_type'] = 'timeseries'
-            state['chart_type'] = 'timeseries'
-            return state
+            return {'detected_visualization_type': 'timeseries', 'chart_type': 'timeseries'}
     
-    async def _analyze_data_sources_node(self, state: AIVisualizationState) -> AIVisualizationState:
+    async def _analyze_data_sources_node(self, state: AIVisualizationState) -> Dict[str, Any]:
         """Analyze which data sources are relevant for the request"""
         logger.info("🔍 Analyzing data sources for relevance")
         
         try:
-            request_lower = state['request_text'].lower()
+            request_lower = state['request_lower']
+            keyword_mask = _classify_data_source_keywords(request_lower)
             
             # Enhanced rule-based data source selection
-            capacity_keywords = [
-                'capacity', 'reserve', 'ancillary', 'stress', 'grid stress', 'system stress',
-                'demand', 'load', 'generation', 'responsive', 'regulation', 'contingency',
-                'spinning', 'non-spin', 'emergency', 'outage', 'availability', 'margin',
-                'reliability', 'stability', 'frequency response', 'volt', 'reactive'
-            ]
-            
-            price_keywords = [
-                'price', 'pricing', 'settlement', 'hub', 'cost', 'market', 'clearing',
-                'locational marginal', 'lmp', 'energy price', 'real time', 'day ahead'
-            ]
-            
-            if any(word in request_lower for word in capacity_keywords):
+            if keyword_mask & CAT_CAPACITY:
                 # Capacity/grid stress related request
-                state['selected_data_source'] = next(
-                    ds for ds in state['available_data_sources']
-                    if ds['table_name'] == 'ercot_capacity_monitor'
-                )
+                selected_source = self._ds_by_name['ercot_capacity_monitor']
                 logger.info("📊 Selected data source: ERCOT Capacity Monitor (grid operations/stress)")
                 
-            elif any(word in request_lower for word in price_keywords):
+            elif keyword_mask & CAT_PRICE:
                 # Price-related request
-                state['selected_data_source'] = next(
-                    ds for ds in state['available_data_sources'] 
-                    if ds['table_name'] == 'ercot_settlement_prices'
-                )
+                selected_source = self._ds_by_name['ercot_settlement_prices']
                 logger.info("📊 Selected data source: ERCOT Settlement Prices")
                 
             else:
                 # For ambiguous requests, use AI to analyze context
-                selected_source = await self._ai_analyze_data_source(request_lower, state['available_data_sources'])
+                selected_source = self._ai_analyze_data_source(
+                    request_lower, state['available_data_sources'], keyword_mask
+                )
                 if selected_source:
-                    state['selected_data_source'] = selected_source
-                    logger.info(f"📊 AI-selected data source: {selected_source['table_name']}")
+                    logger.info("📊 AI-selected data source: %s", selected_source['table_name'])
                 else:
                     # Final fallback to capacity monitor for operational queries
-                    state['selected_data_source'] = next(
-                        ds for ds in state['available_data_sources']
-                        if ds['table_name'] == 'ercot_capacity_monitor'
-                    )
+                    selected_source = self._ds_by_name['ercot_capacity_monitor']
                     logger.info("📊 Default data source: ERCOT Capacity Monitor")
             
-            return state
+            return {'selected_data_source': selected_source}
             
         except Exception as e:
-            logger.error(f"❌ Error analyzing data sources: {e}")
-            state['errors'].append(f"Data source analysis failed: {str(e)}")
-            state['status'] = "failed"
-            return state
+            logger.error("❌ Error analyzing data sources: %s", e)
+            return {
+                'errors': state['errors'] + [f"Data source analysis failed: {str(e)}"],
+                'status': "failed"
+            }
     
     async def _generate_query_node(self, state: AIVisualizationState) -> AIVisualizationState:
         """Generate SQL query using AWS Bedrock"""
         logger.info("🤖 Generating SQL query using AI")
         
+        if state['status'] == "failed":
+            return state
+        
         try:
             # Build context for AI
             data_source = state['selected_data_source']
@@ -359,7 +924,7 @@ class LangGraphAIVisualizer:
                 state['chart_type'] = response.get('chart_type', 'timeseries')
                 state['chart_title'] = response.get('title', 'AI Generated Chart')
                 
-                logger.info(f"✅ AI generated SQL query: {state['raw_sql_query'][:100]}...")
+                logger.info("✅ AI generated SQL query: %s...", state['raw_sql_query'][:100])
             else:
                 # Fallback to rule-based generation
                 logger.warning("🔄 AI generation failed, using fallback logic")
@@ -371,7 +936,7 @@ class LangGraphAIVisualizer:
             return state
             
         except Exception as e:
-            logger.error(f"❌ Error generating query: {e}")
+            logger.error("❌ Error generating query: %s", e)
             state['errors'].append(f"Query generation failed: {str(e)}")
             state['status'] = "failed"
             return state
@@ -392,7 +957,7 @@ class LangGraphAIVisualizer:
             if validation_result['valid']:
                 state['cleaned_sql_query'] = cleaned_query
                 state['sql_validation_result'] = validation_result
-                logger.info(f"✅ SQL query validated: {cleaned_query[:100]}...")
+                logger.info("✅ SQL query validated: %s...", cleaned_query[:100])
             else:
                 state['errors'].append(f"SQL validation failed: {validation_result['errors']}")
                 state['status'] = "failed"
@@ -400,7 +965,7 @@ class LangGraphAIVisualizer:
             return state
             
         except Exception as e:
-            logger.error(f"❌ Error validating query: {e}")
+            logger.error("❌ Error validating query: %s", e)
             state['errors'].append(f"Query validation failed: {str(e)}")
             state['status'] = "failed"
             return state
@@ -418,7 +983,7 @@ class LangGraphAIVisualizer:
             
             if preview_data:
                 state['data_preview'] = preview_data
-                logger.info(f"✅ Data preview successful: {len(preview_data)} rows")
+                logger.info("✅ Data preview successful: %s rows", len(preview_data))
             else:
                 state['errors'].append("Data preview returned no results")
                 state['status'] = "failed"
@@ -426,7 +991,7 @@ class LangGraphAIVisualizer:
             return state
             
         except Exception as e:
-            logger.error(f"❌ Error previewing data: {e}")
+            logger.error("❌ Error previewing data: %s", e)
             state['errors'].append(f"Data preview failed: {str(e)}")
             state['status'] = "failed"
             return state
@@ -436,7 +1001,8 @@ class LangGraphAIVisualizer:
         logger.info("🏗️ Building Grafana dashboard configuration")
         
         try:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            # Read the clock once; deploys within the same second share the strings
+            timestamp, created_at = _dashboard_timestamps(time.time_ns() // 1_000_000_000)
             title = state['chart_title']
             
             # Get panel configuration based on detected chart type
@@ -445,21 +1011,17 @@ class LangGraphAIVisualizer:
             # Build dashboard configuration using the detected chart type
             dashboard_config = {
                 "dashboard": {
-                    "id": None,
+                    **_DASHBOARD_DEFAULTS,
                     "title": f"AI: {title} {timestamp}",
-                    "description": f"AI-generated {state['chart_type']} visualization created at {datetime.now().isoformat()}",
+                    "description": f"AI-generated {state['chart_type']} visualization created at {created_at}",
                     "tags": ["ai-generated", f"user-{state['user_id']}", "ercot", "langgraph", timestamp, state['chart_type']],
-                    "timezone": "browser",
                     "panels": [{
                         "id": 1,
                         "title": title,
                         "type": panel_config['type'],
-                        "gridPos": {"h": 12, "w": 24, "x": 0, "y": 0},
+                        "gridPos": _PANEL_GRID_POS,
                         "targets": [{
-                            "datasource": {
-                                "uid": "aep8tntrm562ob",
-                                "type": "grafana-postgresql-datasource"
-                            },
+                            "datasource": _PANEL_DATASOURCE,
                             "format": panel_config['format'],
                             "rawQuery": True,
                             "rawSql": state['cleaned_sql_query'],
@@ -468,13 +1030,6 @@ class LangGraphAIVisualizer:
                         "fieldConfig": panel_config['fieldConfig'],
                         "options": panel_config['options']
                     }],
-                    "time": {"from": "now-24h", "to": "now"},
-                    "refresh": "30s",
-                    "schemaVersion": 37,
-                    "version": 0,
-                    "fiscalYearStartMonth": 0,
-                    "liveNow": False,
-                    "weekStart": ""
                 },
                 "folderId": 0,
                 "overwrite": False,
@@ -482,12 +1037,12 @@ class LangGraphAIVisualizer:
             }
             
             state['dashboard_config'] = dashboard_config
-            logger.info(f"✅ Dashboard configuration built successfully")
+            logger.info("✅ Dashboard configuration built successfully")
             
             return state
             
         except Exception as e:
-            logger.error(f"❌ Error building dashboard: {e}")
+            logger.error("❌ Error building dashboard: %s", e)
             state['errors'].append(f"Dashboard building failed: {str(e)}")
             state['status'] = "failed"
             return state
@@ -497,15 +1052,11 @@ class LangGraphAIVisualizer:
         logger.info("🚀 Deploying dashboard to Grafana")
         
         try:
-            # Create Grafana session
-            session = requests.Session()
-            session.auth = (os.getenv("GRAFANA_USER", "admin"), os.getenv("GRAFANA_PASSWORD", "admin"))
-            session.headers.update({'Content-Type': 'application/json'})
-            
-            # Deploy to Grafana
-            response = session.post(
+            # Deploy to Grafana on the shared session, off the event loop
+            response = await asyncio.to_thread(
+                self._grafana_session.post,
                 f"{self.grafana_url}/api/dashboards/db",
-                json=state['dashboard_config'],
+                data=orjson.dumps(state['dashboard_config']),
                 timeout=30
             )
             
@@ -517,7 +1068,7 @@ class LangGraphAIVisualizer:
                 # Generate iframe URL
                 state['iframe_url'] = f"{self.grafana_external_url}/d-solo/{result['uid']}?orgId=1&panelId=1&refresh=30s&kiosk"
                 
-                logger.info(f"✅ Dashboard deployed successfully: {result['uid']}")
+                logger.info("✅ Dashboard deployed successfully: %s", result['uid'])
             else:
                 state['errors'].append(f"Grafana deployment failed: HTTP {response.status_code}")
                 state['status'] = "failed"
@@ -525,7 +1076,7 @@ class LangGraphAIVisualizer:
             return state
             
         except Exception as e:
-            logger.error(f"❌ Error deploying to Grafana: {e}")
+            logger.error("❌ Error deploying to Grafana: %s", e)
             state['errors'].append(f"Grafana deployment failed: {str(e)}")
             state['status'] = "failed"
             return state
@@ -535,27 +1086,24 @@ class LangGraphAIVisualizer:
         logger.info("💾 Storing visualization results in database")
         
         try:
-            # Store AI visualization record
+            # Store the AI visualization record and its dashboard panel together
             viz_id = await self._store_ai_visualization(state)
             state['visualization_id'] = viz_id
             
-            # Add to user dashboard
-            await self._add_to_user_dashboard(state, viz_id)
-            
             state['status'] = "completed"
-            logger.info(f"✅ Results stored successfully: visualization ID {viz_id}")
+            logger.info("✅ Results stored successfully: visualization ID %s", viz_id)
             
             return state
             
         except Exception as e:
-            logger.error(f"❌ Error storing results: {e}")
+            logger.error("❌ Error storing results: %s", e)
             state['errors'].append(f"Result storage failed: {str(e)}")
             state['status'] = "failed"
             return state
     
     async def _handle_error_node(self, state: AIVisualizationState) -> AIVisualizationState:
         """Handle errors and cleanup"""
-        logger.error(f"🚨 Handling error state. Errors: {state['errors']}")
+        logger.error("🚨 Handling error state. Errors: %s", state['errors'])
         
         try:
             # Store error state in database if we have enough context
@@ -566,12 +1114,18 @@ class LangGraphAIVisualizer:
             return state
             
         except Exception as e:
-            logger.error(f"❌ Error in error handler: {e}")
+            logger.error("❌ Error in error handler: %s", e)
             state['errors'].append(f"Error handling failed: {str(e)}")
             return state
     
     # Conditional Edge Functions
     
+    def _should_analyze_request(self, state: AIVisualizationState) -> Union[str, List[str]]:
+        """Determine if the parsed request should fan out or if there's an error"""
+        if state['status'] == "failed":
+            return "error"
+        return ["detect", "analyze"]
+    
     def _should_validate_query(self, state: AIVisualizationState) -> str:
         """Determine if query should be validated or if there's an error"""
         if state['status'] == "failed" or not state.get('raw_sql_query'):
@@ -598,7 +1152,8 @@ class LangGraphAIVisualizer:
     
     # Helper Methods
     
-    async def _ai_analyze_data_source(self, request_text: str, available_sources: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    def _ai_analyze_data_source(self, request_text: str, available_sources: Sequence[Dict[str, Any]],
+                                      keyword_mask: Optional[int] = None) -> Optional[Dict[str, Any]]:
         """Use AI to analyze which data source best matches the request"""
         try:
             # Build context about available data sources
@@ -621,57 +1176,36 @@ class LangGraphAIVisualizer:
             """
             
             # Simple pattern matching for now (can be enhanced with actual AI call)
-            if any(word in request_text.lower() for word in [
-                'stress', 'capacity', 'reserve', 'grid', 'system', 'stability', 
-                'emergency', 'outage', 'regulation', 'frequency', 'demand', 'load'
-            ]):
-                return next(ds for ds in available_sources if ds['table_name'] == 'ercot_capacity_monitor')
+            if keyword_mask is None:
+                keyword_mask = _classify_data_source_keywords(request_text.lower())
+            if keyword_mask & CAT_GRID_CONTEXT:
+                return self._ds_by_name['ercot_capacity_monitor']
             else:
-                return next(ds for ds in available_sources if ds['table_name'] == 'ercot_settlement_prices')
+                return self._ds_by_name['ercot_settlement_prices']
                 
         except Exception as e:
-            logger.error(f"❌ AI data source analysis failed: {e}")
+            logger.error("❌ AI data source analysis failed: %s", e)
             return None
     
     def _build_ai_context(self, data_source: Dict[str, Any]) -> str:
         """Build context for AI query generation"""
-        context = f"""
-        Data Source: {data_source['table_name']}
-        Description: {data_source['description']}
-        Columns: {', '.join(data_source['columns'])}
-        Time Column: {data_source['time_column']}
-        
-        Important SQL Requirements:
-        - Use 'timestamp AS time' for time column
-        - Use $__timeFilter(timestamp) for time filtering
-        - Use quoted aliases for metrics like "Hub Price"
-        - Single line query, no extra whitespace
-        """
+        context = self._ds_context.get(data_source['table_name'])
+        if context is None:
+            context = self._format_ai_context(data_source)
         return context
     
+    def _format_ai_context(self, data_source: Dict[str, Any]) -> str:
+        """Render the context template for one data source"""
+        return _AI_CONTEXT_TEMPLATE.format(
+            table_name=data_source['table_name'],
+            description=data_source['description'],
+            columns=', '.join(data_source['columns']),
+            time_column=data_source['time_column']
+        )
+    
     def _create_query_generation_prompt(self, request_text: str, context: str) -> str:
         """Create prompt for AI query generation"""
-        return f"""
-        You are an expert SQL query generator for ERCOT energy data visualization.
-        
-        Context:
-        {context}
-        
-        User Request: {request_text}
-        
-        Generate a JSON response with:
-        {{
-            "sql_query": "Single line SQL query",
-            "chart_type": "timeseries",
-            "title": "Descriptive chart title"
-        }}
-        
-        Requirements:
-        - MUST use 'timestamp AS time'
-        - MUST use $__timeFilter(timestamp) not NOW()
-        - MUST be single line, no indentation
-        - Use proper quoted aliases
-        """
+        return _QUERY_PROMPT_TEMPLATE.format(context=context, request_text=request_text)
     
     async def _call_bedrock_ai(self, prompt: str) -> Optional[Dict[str, Any]]:
         """Call AWS Bedrock AI for query generation"""
@@ -682,135 +1216,84 @@ class LangGraphAIVisualizer:
                 "messages": [{"role": "user", "content": prompt}]
             }
             
-            response = self.bedrock_client.invoke_model(
-                body=json.dumps(payload),
-                modelId="anthropic.claude-3-sonnet-20240229-v1:0"
-            )
-            
-            result = json.loads(response['body'].read())
-            content = result['content'][0]['text']
-            
-            # Parse JSON response
-            return json.loads(content)
+            # boto3 is blocking; keep the event loop free while the model streams
+            async with self._bedrock_slots:
+                reply = await asyncio.to_thread(self._stream_bedrock_json, orjson.dumps(payload))
+            return reply.model_dump()
             
+        except ValidationError as e:
+            logger.warning("⚠️ Bedrock reply did not match the expected schema: %s", e)
+            return None
         except Exception as e:
-            logger.error(f"❌ Bedrock AI call failed: {e}")
+            logger.error("❌ Bedrock AI call failed: %s", e)
             return None
     
-    def _generate_fallback_query(self, request_text: str, data_source: Dict[str, Any]) -> Dict[str, Any]:
-        """Generate fallback query using enhanced rule-based logic"""
-        request_lower = request_text.lower()
-        
-        if data_source['table_name'] == 'ercot_settlement_prices':
-            if 'houston' in request_lower:
-                return {
-                    'sql_query': 'SELECT timestamp AS time, hb_houston AS "Houston Hub Price" FROM ercot_settlement_prices WHERE $__timeFilter(timestamp) ORDER BY timestamp',
-                    'chart_type': 'timeseries',
-                    'title': 'Houston Hub Settlement Prices'
-                }
-            elif 'north' in request_lower:
-                return {
-                    'sql_query': 'SELECT timestamp AS time, hb_north AS "North Hub Price" FROM ercot_settlement_prices WHERE $__timeFilter(timestamp) ORDER BY timestamp',
-                    'chart_type': 'timeseries',
-                    'title': 'North Hub Settlement Prices'
-                }
-            elif 'south' in request_lower:
-                return {
-                    'sql_query': 'SELECT timestamp AS time, hb_south AS "South Hub Price" FROM ercot_settlement_prices WHERE $__timeFilter(timestamp) ORDER BY timestamp',
-                    'chart_type': 'timeseries',
-                    'title': 'South Hub Settlement Prices'
-                }
-            elif 'west' in request_lower:
-                return {
-                    'sql_query': 'SELECT timestamp AS time, hb_west AS "West Hub Price" FROM ercot_settlement_prices WHERE $__timeFilter(timestamp) ORDER BY timestamp',
-                    'chart_type': 'timeseries',
-                    'title': 'West Hub Settlement Prices'
-                }
-            else:
-                return {
-                    'sql_query': 'SELECT timestamp AS time, hb_houston AS "Houston Hub", hb_north AS "North Hub", hb_south AS "South Hub", hb_west AS "West Hub" FROM ercot_settlement_prices WHERE $__timeFilter(timestamp) ORDER BY timestamp',
-                    'chart_type': 'timeseries',
-                    'title': 'ERCOT Settlement Point Prices'
-                }
+    def _stream_bedrock_json(self, body: bytes) -> "BedrockReply":
+        """Stream the model's text and validate its JSON object as soon as it closes"""
+        response = self.bedrock_client.invoke_model_with_response_stream(
+            body=body,
+            modelId="anthropic.claude-3-sonnet-20240229-v1:0"
+        )
+        stream = response['body']
+        decoder = json.JSONDecoder()
+        pieces = []
         
-        elif data_source['table_name'] == 'ercot_capacity_monitor':
-            # Enhanced capacity monitor queries based on actual data categories
-            if any(word in request_lower for word in ['stress', 'grid stress', 'system stress', 'strain']):
-                return {
-                    'sql_query': 'SELECT timestamp AS time, value AS "Available Capacity to Increase (MW)" FROM ercot_capacity_monitor WHERE category = \'System Available Capacity (MW)\' AND subcategory = \'Capacity available to increase Generation Resource Base Points in the next 5 minutes in SCED (HDL)\' AND $__timeFilter(timestamp) ORDER BY timestamp',
-                    'chart_type': 'timeseries',
-                    'title': 'Grid Stress - Available Generation Capacity'
-                }
-            elif any(word in request_lower for word in ['reserve', 'margin', 'contingency']):
-                return {
-                    'sql_query': 'SELECT timestamp AS time, value AS "Responsive Reserve (MW)" FROM ercot_capacity_monitor WHERE category = \'Responsive Reserve Capacity (MW)\' AND subcategory = \'Generation Resources\' AND $__timeFilter(timestamp) ORDER BY timestamp',
-                    'chart_type': 'timeseries',
-                    'title': 'Reserve Margin - Generation Resources'
-                }
-            elif any(word in request_lower for word in ['emergency', 'outage', 'emr', 'out']):
-                return {
-                    'sql_query': 'SELECT timestamp AS time, value AS "Emergency/Outage Capacity (MW)" FROM ercot_capacity_monitor WHERE category = \'EMR, OUT, and OUTL Capacity (MW)\' AND subcategory = \'Aggregate telemetered HSL capacity for Resources with a telemetered Resource Status of EMR\' AND $__timeFilter(timestamp) ORDER BY timestamp',
-                    'chart_type': 'timeseries',
-                    'title': 'Emergency and Outage Conditions'
-                }
-            elif any(word in request_lower for word in ['regulation', 'frequency', 'freq']):
-                return {
-                    'sql_query': 'SELECT timestamp AS time, value AS "Regulation Up (MW)" FROM ercot_capacity_monitor WHERE category = \'Regulation Capacity (MW)\' AND subcategory = \'Deployed Reg-Up\' AND $__timeFilter(timestamp) ORDER BY timestamp',
-                    'chart_type': 'timeseries',
-                    'title': 'Frequency Regulation - Deployed Up'
-                }
-            elif any(word in request_lower for word in ['spin', 'spinning', 'non-spin']):
-                return {
-                    'sql_query': 'SELECT timestamp AS time, value AS "Non-Spin Reserve (MW)" FROM ercot_capacity_monitor WHERE category = \'Non-Spin Reserve Capacity (MW)\' AND subcategory = \'On-Line Generation Resources with Output Schedules\' AND $__timeFilter(timestamp) ORDER BY timestamp',
-                    'chart_type': 'timeseries',
-                    'title': 'Non-Spinning Reserve Capacity'
-                }
-            elif any(word in request_lower for word in ['demand', 'curve', 'operating']):
-                return {
-                    'sql_query': 'SELECT timestamp AS time, value AS "Operating Reserve (MW)" FROM ercot_capacity_monitor WHERE category = \'Real-Time Operating Reserve Demand Curve Capacity (MW)\' AND subcategory = \'Real-Time On-Line reserve capacity\' AND $__timeFilter(timestamp) ORDER BY timestamp',
-                    'chart_type': 'timeseries',
-                    'title': 'Real-Time Operating Reserve'
-                }
-            else:
-                # General capacity overview showing multiple metrics
-                return {
-                    'sql_query': 'SELECT timestamp AS time, value AS "Available Increase Capacity (MW)" FROM ercot_capacity_monitor WHERE category = \'System Available Capacity (MW)\' AND subcategory = \'Capacity available to increase Generation Resource Base Points in the next 5 minutes in SCED (HDL)\' AND $__timeFilter(timestamp) ORDER BY timestamp',
-                    'chart_type': 'timeseries',
-                    'title': 'System Available Capacity Overview'
-                }
+        try:
+            for event in stream:
+                chunk = event.get('chunk')
+                if not chunk:
+                    continue
+                message = orjson.loads(chunk['bytes'])
+                if message.get('type') != 'content_block_delta':
+                    continue
+                piece = message['delta'].get('text', '')
+                pieces.append(piece)
+                
+                # Only a closing brace can complete the object; stop reading
+                # the stream (and the model's trailing prose) once it parses
+                if '}' in piece:
+                    text = ''.join(pieces)
+                    start = text.find('{')
+                    if start == -1:
+                        continue
+                    try:
+                        result, _ = decoder.raw_decode(text, start)
+                    except ValueError:
+                        continue
+                    return BedrockReply.model_validate(result)
+        finally:
+            close = getattr(stream, 'close', None)
+            if close:
+                close()
         
-        # Final fallback
-        return {
-            'sql_query': 'SELECT timestamp AS time, value AS "Value" FROM ercot_capacity_monitor WHERE $__timeFilter(timestamp) ORDER BY timestamp LIMIT 1000',
-            'chart_type': 'timeseries',
-            'title': 'ERCOT Data Overview'
-        }
+        # Parse JSON response
+        return BedrockReply.model_validate_json(''.join(pieces))
+    
+    def _generate_fallback_query(self, request_text: str, data_source: Dict[str, Any]) -> Dict[str, Any]:
+        """Generate fallback query using enhanced rule-based logic"""
+        name = _resolve_fallback_query_name(data_source['table_name'], request_text.lower())
+        return dict(_FALLBACK_QUERIES[name])
     
     def _clean_sql_query(self, sql_query: str) -> str:
         """Clean SQL query to match Grafana requirements"""
         if not sql_query:
             return ""
         
-        # Remove all extra whitespace, tabs, and newlines
-        cleaned = re.sub(r'\s+', ' ', sql_query.strip())
+        # Remove all extra whitespace, tabs, and newlines (str.split splits on
+        # exactly the characters \s matches, without going through the regex engine)
+        cleaned = ' '.join(sql_query.split())
         
         # Ensure proper time filtering
         if 'NOW() - INTERVAL' in cleaned:
-            cleaned = re.sub(r'WHERE.*NOW\(\).*?(?=ORDER|$)', 'WHERE $__timeFilter(timestamp) ', cleaned)
+            cleaned = _NOW_INTERVAL_FILTER_RE.sub('WHERE $__timeFilter(timestamp) ', cleaned)
         
         return cleaned
     
     def _validate_sql_components(self, sql_query: str) -> Dict[str, Any]:
         """Validate required SQL components"""
-        errors = []
-        
-        if 'timestamp AS time' not in sql_query:
-            errors.append("Missing 'timestamp AS time' requirement")
+        errors = [message for token, message in _REQUIRED_SQL_TOKENS if token not in sql_query]
         
-        if '$__timeFilter(timestamp)' not in sql_query:
-            errors.append("Missing '$__timeFilter(timestamp)' requirement")
-        
-        if 'FROM' not in sql_query.upper():
+        if not _FROM_RE.search(sql_query):
             errors.append("Missing FROM clause")
         
         return {
@@ -819,301 +1302,62 @@ class LangGraphAIVisualizer:
         }
     
     async def _execute_preview_query(self, query: str) -> Optional[List[Dict]]:
-        """Execute preview query against database"""
+        """Execute preview query against database without blocking the event loop"""
+        # _clean_sql_query has already collapsed whitespace, so equal queries
+        # have equal text
+        cache_key = hashlib.blake2b(query.encode(), digest_size=16).digest()
+        cached = self._preview_cache.get(cache_key)
+        now = time.monotonic()
+        if cached and cached[0] > now:
+            logger.info("📊 Preview served from cache")
+            return list(cached[1])
+        
         try:
-            conn = psycopg2.connect(
-                host=os.getenv('DB_HOST'),
-                database=os.getenv('DB_NAME'),
-                user=os.getenv('DB_USER'),
-                password=os.getenv('DB_PASSWORD')
-            )
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            
-            # Replace Grafana variables for preview
-            preview_query = query.replace(
-                '$__timeFilter(timestamp)',
-                "timestamp >= NOW() - INTERVAL '24 hours'"
-            )
+            rows = await asyncio.to_thread(self._run_preview_query, query)
+            if rows:
+                if len(self._preview_cache) >= PREVIEW_CACHE_MAX_ENTRIES:
+                    self._preview_cache = {
+                        key: entry for key, entry in self._preview_cache.items() if entry[0] > now
+                    }
+                    if len(self._preview_cache) >= PREVIEW_CACHE_MAX_ENTRIES:
+                        self._preview_cache.pop(next(iter(self._preview_cache)))
+                self._preview_cache[cache_key] = (now + PREVIEW_CACHE_TTL_SECONDS, rows)
+            return rows
             
+        except Exception as e:
+            logger.error("❌ Preview query failed: %s", e)
+            return None
+    
+    def _run_preview_query(self, query: str) -> List[Dict]:
+        """Run the preview on a connection borrowed from the shared pool"""
+        # Replace Grafana variables for preview
+        preview_query = _to_preview_sql(query)
+        
+        conn = get_db_connection()
+        if conn is None:
+            raise ConnectionError("No database connection available for preview")
+        try:
+            # Plain tuples plus one shared column tuple; RealDictCursor would
+            # build a dict per row only for us to copy it again
+            cursor = conn.cursor()
             cursor.execute(preview_query)
             results = cursor.fetchall()
-            
+            columns = tuple(column[0] for column in cursor.description)
             cursor.close()
+            return [dict(zip(columns, row)) for row in results]
+        finally:
             conn.close()
-            
-            return [dict(row) for row in results]
-            
-        except Exception as e:
-            logger.error(f"❌ Preview query failed: {e}")
-            return None
     
     def _get_panel_config_for_type(self, chart_type: str) -> Dict[str, Any]:
-        """Get complete panel configuration for different chart types"""
-        
-        base_config = {
-            "type": "timeseries",
-            "format": "time_series",
-            "fieldConfig": self._get_timeseries_field_config(),
-            "options": self._get_timeseries_options()
-        }
-        
-        if chart_type == "bar":
-            return {
-                "type": "barchart",
-                "format": "time_series", 
-                "fieldConfig": self._get_bar_field_config(),
-                "options": self._get_bar_options()
-            }
-        elif chart_type == "stat":
-            return {
-                "type": "stat",
-                "format": "time_series",
-                "fieldConfig": self._get_stat_field_config(),
-                "options": self._get_stat_options()
-            }
-        elif chart_type == "gauge":
-            return {
-                "type": "gauge",
-                "format": "time_series",
-                "fieldConfig": self._get_gauge_field_config(),
-                "options": self._get_gauge_options()
-            }
-        elif chart_type == "table":
-            return {
-                "type": "table",
-                "format": "table",
-                "fieldConfig": self._get_table_field_config(),
-                "options": self._get_table_options()
-            }
-        elif chart_type == "area":
-            config = base_config.copy()
-            config["fieldConfig"] = self._get_area_field_config()
-            return config
-        else:
-            # Default to timeseries for line, timeseries, and unknown types
-            return base_config
-    
-    def _get_timeseries_field_config(self) -> Dict[str, Any]:
-        """Get field configuration for timeseries charts"""
-        return {
-            "defaults": {
-                "custom": {
-                    "drawStyle": "line",
-                    "lineInterpolation": "linear",
-                    "barAlignment": 0,
-                    "lineWidth": 2,
-                    "fillOpacity": 0,
-                    "gradientMode": "none",
-                    "spanNulls": False,
-                    "insertNulls": False,
-                    "showPoints": "auto",
-                    "pointSize": 5,
-                    "stacking": {"mode": "none", "group": "A"},
-                    "axisPlacement": "auto",
-                    "axisLabel": "",
-                    "axisColorMode": "text",
-                    "axisBorderShow": False,
-                    "scaleDistribution": {"type": "linear"},
-                    "axisCenteredZero": False,
-                    "hideFrom": {"tooltip": False, "viz": False, "legend": False},
-                    "thresholdsStyle": {"mode": "off"}
-                },
-                "color": {"mode": "palette-classic"},
-                "mappings": [],
-                "thresholds": {
-                    "mode": "absolute",
-                    "steps": [
-                        {"color": "green", "value": None},
-                        {"color": "red", "value": 80}
-                    ]
-                }
-            },
-            "overrides": []
-        }
-    
-    def _get_bar_field_config(self) -> Dict[str, Any]:
-        """Get field configuration for bar charts"""
-        return {
-            "defaults": {
-                "custom": {
-                    "orientation": "auto",
-                    "barWidth": 0.97,
-                    "barMaxWidth": 100,
-                    "groupWidth": 0.7,
-                    "axisPlacement": "auto",
-                    "axisLabel": "",
-                    "axisColorMode": "text",
-                    "scaleDistribution": {"type": "linear"},
-                    "axisCenteredZero": False,
-                    "hideFrom": {"tooltip": False, "viz": False, "legend": False},
-                    "thresholdsStyle": {"mode": "off"}
-                },
-                "color": {"mode": "palette-classic"},
-                "mappings": [],
-                "thresholds": {
-                    "mode": "absolute",
-                    "steps": [
-                        {"color": "green", "value": None},
-                        {"color": "red", "value": 80}
-                    ]
-                }
-            },
-            "overrides": []
-        }
-    
-    def _get_stat_field_config(self) -> Dict[str, Any]:
-        """Get field configuration for stat panels"""
-        return {
-            "defaults": {
-                "color": {"mode": "thresholds"},
-                "custom": {
-                    "displayMode": "basic",
-                    "cellDisplayMode": "basic",
-                    "orientation": "auto",
-                    "textMode": "auto",
-                    "wideLayout": True,
-                    "showUnfilled": True
-                },
-                "mappings": [],
-                "thresholds": {
-                    "mode": "absolute",
-                    "steps": [
-                        {"color": "green", "value": None},
-                        {"color": "red", "value": 80}
-                    ]
-                },
-                "unit": "short"
-            },
-            "overrides": []
-        }
-    
-    def _get_gauge_field_config(self) -> Dict[str, Any]:
-        """Get field configuration for gauge panels"""
-        return {
-            "defaults": {
-                "color": {"mode": "thresholds"},
-                "custom": {},
-                "mappings": [],
-                "thresholds": {
-                    "mode": "absolute",
-                    "steps": [
-                        {"color": "green", "value": None},
-                        {"color": "yellow", "value": 50},
-                        {"color": "red", "value": 80}
-                    ]
-                },
-                "unit": "short",
-                "min": 0,
-                "max": 100
-            },
-            "overrides": []
-        }
-    
-    def _get_area_field_config(self) -> Dict[str, Any]:
-        """Get field configuration for area charts"""
-        config = self._get_timeseries_field_config()
-        config["defaults"]["custom"]["fillOpacity"] = 30
-        config["defaults"]["custom"]["gradientMode"] = "opacity"
-        return config
-    
-    def _get_table_field_config(self) -> Dict[str, Any]:
-        """Get field configuration for table panels"""
-        return {
-            "defaults": {
-                "color": {"mode": "thresholds"},
-                "custom": {
-                    "align": "auto",
-                    "cellOptions": {"type": "auto"},
-                    "inspect": False
-                },
-                "mappings": [],
-                "thresholds": {
-                    "mode": "absolute",
-                    "steps": [
-                        {"color": "green", "value": None},
-                        {"color": "red", "value": 80}
-                    ]
-                }
-            },
-            "overrides": []
-        }
-    
-    def _get_timeseries_options(self) -> Dict[str, Any]:
-        """Get options for timeseries panels"""
-        return {
-            "tooltip": {"mode": "single", "sort": "none"},
-            "legend": {
-                "showLegend": True,
-                "displayMode": "list",
-                "placement": "bottom",
-                "calcs": []
-            }
-        }
-    
-    def _get_bar_options(self) -> Dict[str, Any]:
-        """Get options for bar chart panels"""
-        return {
-            "tooltip": {"mode": "single", "sort": "none"},
-            "legend": {
-                "showLegend": True,
-                "displayMode": "list",
-                "placement": "bottom",
-                "calcs": []
-            },
-            "orientation": "auto"
-        }
-    
-    def _get_stat_options(self) -> Dict[str, Any]:
-        """Get options for stat panels"""
-        return {
-            "reduceOptions": {
-                "values": False,
-                "calcs": ["lastNotNull"],
-                "fields": ""
-            },
-            "orientation": "auto",
-            "textMode": "auto",
-            "colorMode": "value",
-            "graphMode": "area",
-            "justifyMode": "auto"
-        }
-    
-    def _get_gauge_options(self) -> Dict[str, Any]:
-        """Get options for gauge panels"""
-        return {
-            "reduceOptions": {
-                "values": False,
-                "calcs": ["lastNotNull"],
-                "fields": ""
-            },
-            "orientation": "auto",
-            "showThresholdLabels": False,
-            "showThresholdMarkers": True
-        }
-    
-    def _get_table_options(self) -> Dict[str, Any]:
-        """Get options for table panels"""
-        return {
-            "showHeader": True,
-            "cellHeight": "sm",
-            "footer": {
-                "show": False,
-                "reducer": ["sum"],
-                "countRows": False,
-                "fields": ""
-            }
-        }
+        """Get the shared (read-only) panel configuration for a chart type"""
+        return _PANEL_CONFIGS.get(chart_type, _DEFAULT_PANEL_CONFIG)
     
     async def _store_ai_visualization(self, state: AIVisualizationState) -> int:
-        """Store AI visualization in database"""
-        conn = psycopg2.connect(
-            host=os.getenv('DB_HOST'),
-            database=os.getenv('DB_NAME'),
-            user=os.getenv('DB_USER'),
-            password=os.getenv('DB_PASSWORD')
-        )
-        cursor = conn.cursor()
-        
+        """Store AI visualization and its dashboard panel without blocking the event loop"""
+        return await asyncio.to_thread(self._write_ai_visualization, state)
+    
+    def _write_ai_visualization(self, state: AIVisualizationState) -> int:
+        """Store AI visualization and add it to the user dashboard in one statement"""
         chart_config = {
             'title': state['chart_title'],
             'chart_type': state['chart_type'],
@@ -1123,71 +1367,60 @@ class LangGraphAIVisualizer:
             'workflow': 'langgraph'
         }
         
-        cursor.execute("""
-            INSERT INTO ai_visualizations 
-            (user_id, request_text, visualization_type, chart_config, status)
-            VALUES (%s, %s, %s, %s, %s)
-            RETURNING id
-        """, (
-            state['user_id'],
-            state['request_text'],
-            state['visualization_type'],
-            json.dumps(chart_config),
-            'completed'
-        ))
-        
-        viz_id = cursor.fetchone()[0]
-        conn.commit()
-        cursor.close()
-        conn.close()
-        
-        return viz_id
-    
-    async def _add_to_user_dashboard(self, state: AIVisualizationState, viz_id: int):
-        """Add visualization to user dashboard"""
-        conn = psycopg2.connect(
-            host=os.getenv('DB_HOST'),
-            database=os.getenv('DB_NAME'),
-            user=os.getenv('DB_USER'),
-            password=os.getenv('DB_PASSWORD')
-        )
-        cursor = conn.cursor()
-        
-        # Get next panel order
-        cursor.execute("""
-            SELECT COALESCE(MAX(panel_order), 0) + 1
-            FROM user_dashboard_settings 
-            WHERE user_id = %s
-        """, (state['user_id'],))
-        next_order = cursor.fetchone()[0]
-        
-        panel_id = f"ai_viz_{viz_id}"
-        panel_name = f"AI: {state['chart_title']}"
-        
-        cursor.execute("""
-            INSERT INTO user_dashboard_settings 
-            (user_id, panel_id, panel_name, panel_type, is_visible, panel_order, 
-             panel_grid_column, iframe_src, ai_visualization_id, dashboard_uid)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (
-            state['user_id'], panel_id, panel_name, 'ai_generated', True, next_order,
-            2, state['iframe_url'], viz_id, state['dashboard_uid']
-        ))
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+        conn = get_db_connection(autocommit=False)
+        if conn is None:
+            raise ConnectionError("No database connection available to store results")
+        try:
+            cursor = conn.cursor()
+            
+            # Same per-user lock as the dashboard's add-panel endpoint, so two
+            # stores can't read the same MAX(panel_order); released at commit
+            cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)", (AI_PANEL_ORDER_LOCK_NS, state['user_id']))
+            
+            # The panel row needs the new visualization id and the user's next panel
+            # order; a data-modifying CTE gets both without extra round trips.
+            # Each placeholder is used once so the unprepared fallback can bind it.
+            execute_prepared(cursor, "ai_viz_store_completed", """
+                WITH viz AS (
+                    INSERT INTO ai_visualizations 
+                    (user_id, request_text, visualization_type, chart_config, status)
+                    VALUES ($1, $2, $3, $4, 'completed')
+                    RETURNING id
+                )
+                INSERT INTO user_dashboard_settings 
+                (user_id, panel_id, panel_name, panel_type, is_visible, panel_order, 
+                 panel_grid_column, iframe_src, ai_visualization_id, dashboard_uid)
+                SELECT $5::integer, 'ai_viz_' || viz.id, $6::text, 'ai_generated', true,
+                       (SELECT COALESCE(MAX(panel_order), 0) + 1
+                        FROM user_dashboard_settings WHERE user_id = $7),
+                       2, $8::text, viz.id, $9::text
+                FROM viz
+                RETURNING ai_visualization_id
+            """, (
+                state['user_id'],
+                state['request_text'],
+                state['visualization_type'],
+                orjson.dumps(chart_config).decode(),
+                state['user_id'],
+                f"AI: {state['chart_title']}",
+                state['user_id'],
+                state['iframe_url'],
+                state['dashboard_uid']
+            ))
+            
+            viz_id = cursor.fetchone()[0]
+            conn.commit()
+            cursor.close()
+            return viz_id
+        finally:
+            conn.close()
     
     async def _store_error_state(self, state: AIVisualizationState):
+        """Store error state in database without blocking the event loop"""
+        await asyncio.to_thread(self._write_error_state, state)
+    
+    def _write_error_state(self, state: AIVisualizationState):
         """Store error state in database"""
-        conn = psycopg2.connect(
-            host=os.getenv('DB_HOST'),
-            database=os.getenv('DB_NAME'),
-            user=os.getenv('DB_USER'),
-            password=os.getenv('DB_PASSWORD')
-        )
-        cursor = conn.cursor()
-        
         error_config = {
             'errors': state['errors'],
             'partial_state': {
@@ -1198,22 +1431,28 @@ class LangGraphAIVisualizer:
             'workflow': 'langgraph'
         }
         
-        cursor.execute("""
-            INSERT INTO ai_visualizations 
-            (user_id, request_text, visualization_type, chart_config, status, error_message)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """, (
-            state['user_id'],
-            state['request_text'],
-            state['visualization_type'],
-            json.dumps(error_config),
-            'failed',
-            '; '.join(state['errors'])
-        ))
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+        conn = get_db_connection()
+        if conn is None:
+            raise ConnectionError("No database connection available to store the error state")
+        try:
+            cursor = conn.cursor()
+            execute_prepared(cursor, "ai_viz_store_failed", """
+                INSERT INTO ai_visualizations 
+                (user_id, request_text, visualization_type, chart_config, status, error_message)
+                VALUES ($1, $2, $3, $4, $5, $6)
+            """, (
+                state['user_id'],
+                state['request_text'],
+                state['visualization_type'],
+                orjson.dumps(error_config).decode(),
+                'failed',
+                '; '.join(state['errors'])[:ERROR_MESSAGE_MAX_CHARS]
+            ))
+            
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
     
     # Main execution method
     
@@ -1225,31 +1464,18 @@ class LangGraphAIVisualizer:
     ) -> Dict[str, Any]:
         """Process a visualization request using the LangGraph workflow"""
         
-        logger.info(f"🚀 Starting LangGraph AI visualization workflow for user {user_id}")
+        logger.info("🚀 Starting LangGraph AI visualization workflow for user %s", user_id)
         
         # Initialize state
-        initial_state = AIVisualizationState(
-            user_id=user_id,
-            request_text=request_text,
-            visualization_type=visualization_type,
-            available_data_sources=[],
-            selected_data_source=None,
-            analysis_result=None,
-            raw_sql_query=None,
-            cleaned_sql_query=None,
-            chart_type=None,
-            chart_title=None,
-            detected_visualization_type=None,
-            sql_validation_result=None,
-            data_preview=None,
-            dashboard_config=None,
-            grafana_response=None,
-            dashboard_uid=None,
-            errors=[],
-            status="processing",
-            visualization_id=None,
-            iframe_url=None
-        )
+        initial_state: AIVisualizationState = {
+            **_INITIAL_STATE_TEMPLATE,
+            'user_id': user_id,
+            'request_text': request_text,
+            'request_lower': request_text.lower(),
+            'visualization_type': visualization_type,
+            'available_data_sources': [],
+            'errors': []
+        }
         
         try:
             # Execute the workflow
@@ -1274,7 +1500,7 @@ class LangGraphAIVisualizer:
                 }
                 
         except Exception as e:
-            logger.error(f"❌ LangGraph workflow failed: {e}")
+            logger.error("❌ LangGraph workflow failed: %s", e)
             return {
                 'success': False,
                 'errors': [f"Workflow execution failed: {str(e)}"],
@@ -4,7 +4,8 @@ Pytest configuration and fixtures for ERCOT Analytics Dashboard tests
 import pytest
 import os
 import sys
-from unittest.mock import Mock, patch
+import psycopg2
+from unittest.mock import Mock, MagicMock, patch
 from fastapi.testclient import TestClient
 
 # Add src to path for imports
@@ -16,8 +17,9 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scrapers'))
 def mock_db_connection():
     """Mock database connection for testing"""
     with patch('psycopg2.connect') as mock_connect:
-        mock_conn = Mock()
-        mock_cursor = Mock()
+        # Specced mocks reject attributes a real connection/cursor doesn't have
+        mock_conn = MagicMock(spec=psycopg2.extensions.connection)
+        mock_cursor = MagicMock(spec=psycopg2.extensions.cursor)
         mock_conn.cursor.return_value = mock_cursor
         mock_connect.return_value = mock_conn
         yield mock_conn, mock_cursor
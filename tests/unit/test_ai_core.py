@@ -230,4 +230,26 @@ class TestAIVisualizationCore:
         
         processor = get_ai_processor()
         
-        assert processor == mock_processor
\ No newline at end of file
+        assert processor == mock_processor
+    
+    @patch('src.ai_visualization_core.get_db_connection')
+    @patch('src.ai_visualization_core.boto3')
+    def test_status_update_runs_off_loop_and_releases_connection(self, mock_boto3, mock_get_db):
+        """Test a failed status update still returns its pooled connection"""
+        import asyncio
+        import threading
+        from src.ai_visualization_core import AIVisualizationProcessor
+        
+        db_threads = []
+        mock_conn = Mock()
+        mock_cursor = Mock()
+        mock_cursor.execute.side_effect = lambda *args: db_threads.append(threading.current_thread())
+        mock_conn.commit.side_effect = Exception("commit failed")
+        mock_conn.cursor.return_value = mock_cursor
+        mock_get_db.return_value = mock_conn
+        
+        processor = AIVisualizationProcessor()
+        asyncio.run(processor._update_visualization_status(1, 'completed', {}))
+        
+        assert db_threads and db_threads[0] is not threading.main_thread()
+        mock_conn.close.assert_called_once()
\ No newline at end of file
@@ -136,6 +136,7 @@ class TestAppExtended:
                 'hb_north': 24.50
             }
         ]
+        mock_cursor.fetchmany.return_value = []
         
         # Test valid table requests
         valid_requests = [
@@ -834,4 +835,26 @@ class TestAppExtended:
         
         # Test app configuration
         assert app.title is not None
-        assert app.version is not None
\ No newline at end of file
+        assert app.version is not None
+    
+    @patch('src.app.log_api_usage')
+    @patch('src.app.verify_api_key', return_value={'id': 1, 'user_id': 1})
+    @patch('src.app.get_db_connection')
+    def test_settlement_prices_timestamps_match_in_both_shapes(self, mock_get_db, mock_verify, mock_log):
+        """Test both column shapes render timestamps with the same helper and unknown hubs are rejected"""
+        from src.app import app
+        client = TestClient(app)
+        
+        mock_cursor = mock_get_db.return_value.cursor.return_value
+        mock_cursor.fetchall.return_value = []
+        headers = {'X-API-Key': 'test-key', 'X-API-Secret': 'test-secret'}
+        
+        for url in ('/api/v1/settlement-prices', '/api/v1/settlement-prices?hub=north'):
+            response = client.get(url, headers=headers)
+            assert response.status_code == 200
+            query = mock_cursor.execute.call_args[0][0]
+            assert 'SELECT *' not in query
+            assert query.count("to_char(timestamp, 'US') = '000000'") == 1
+        
+        response = client.get('/api/v1/settlement-prices?hub=nowhere', headers=headers)
+        assert response.status_code == 400
\ No newline at end of file
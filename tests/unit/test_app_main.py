@@ -5,6 +5,7 @@ import pytest
 from unittest.mock import Mock, patch, MagicMock
 from fastapi.testclient import TestClient
 import json
+import psycopg2
 
 import sys
 import os
@@ -129,8 +130,9 @@ class TestAppMain:
         mock_conn = Mock()
         mock_cursor = Mock()
         mock_conn.cursor.return_value = mock_cursor
-        mock_cursor.fetchall.return_value = [
-            {"timestamp": "2024-01-01T00:00:00", "hb_busavg": 25.50}
+        mock_cursor.fetchmany.side_effect = [
+            [{"timestamp": "2024-01-01T00:00:00", "hb_busavg": 25.50}],
+            []
         ]
         mock_get_db.return_value = mock_conn
         
@@ -139,6 +141,8 @@ class TestAppMain:
         assert response.status_code == 200
         data = response.json()
         assert isinstance(data, list)
+        assert data[0]["hb_busavg"] == 25.50
+        mock_conn.close.assert_called_once()
     
     def test_cors_headers(self):
         """Test CORS headers are set"""
@@ -182,4 +186,214 @@ class TestAppMain:
         
         # Should return not authenticated
         data = response.json()
-        assert data["authenticated"] is False
\ No newline at end of file
+        assert data["authenticated"] is False
+    
+    @patch('src.app.get_db_connection')
+    def test_default_dashboard_settings_skip_when_locked(self, mock_get_db):
+        """Test default panel creation waits instead of inserting when another request holds the lock"""
+        from src.app import create_default_dashboard_settings
+        
+        mock_conn = Mock()
+        mock_cursor = Mock()
+        mock_conn.cursor.return_value = mock_cursor
+        mock_cursor.fetchone.return_value = (False,)
+        mock_get_db.return_value = mock_conn
+        
+        assert create_default_dashboard_settings(1) is True
+        
+        mock_get_db.assert_called_once_with(autocommit=False)
+        executed = [call.args[0] for call in mock_cursor.execute.call_args_list]
+        assert not any("INSERT" in sql for sql in executed)
+        mock_conn.commit.assert_called_once()
+    
+    @patch('src.app.get_db_connection')
+    def test_metadata_loader_is_cached(self, mock_get_db):
+        """Test metadata is served from cache instead of re-scanning the table"""
+        from src.app import load_capacity_monitor_metadata
+        
+        mock_conn = Mock()
+        mock_cursor = Mock()
+        mock_conn.cursor.return_value = mock_cursor
+        mock_cursor.fetchone.return_value = {'earliest': None, 'latest': None, 'total_records': 0}
+        mock_cursor.fetchall.return_value = []
+        mock_get_db.return_value = mock_conn
+        
+        load_capacity_monitor_metadata.cache_clear()
+        first = load_capacity_monitor_metadata()
+        second = load_capacity_monitor_metadata()
+        load_capacity_monitor_metadata.cache_clear()
+        
+        assert first == second
+        mock_get_db.assert_called_once()
+    
+    def test_fetch_date_range_falls_back_without_view(self):
+        """Test date range query scans the table when the metadata view is missing"""
+        import psycopg2
+        from src.app import fetch_date_range
+        
+        mock_cursor = Mock()
+        mock_cursor.execute.side_effect = [psycopg2.errors.UndefinedTable(), None]
+        mock_cursor.fetchone.return_value = {'earliest': None, 'latest': None, 'total_records': 0}
+        
+        assert fetch_date_range(mock_cursor, "ercot_capacity_monitor")['total_records'] == 0
+        
+        executed = [call.args[0] for call in mock_cursor.execute.call_args_list]
+        assert "ercot_capacity_monitor_meta" in executed[0]
+        assert "MIN(timestamp)" in executed[1]
+    
+    @patch('src.app.get_db_connection')
+    def test_add_ai_visualization_reports_existing_panel(self, mock_get_db):
+        """Test a conflicting AI panel insert is reported as already on the dashboard"""
+        from src.app import add_ai_visualization_to_dashboard
+        
+        mock_conn = Mock()
+        mock_cursor = Mock()
+        mock_conn.cursor.return_value = mock_cursor
+        mock_cursor.fetchone.return_value = None
+        mock_get_db.return_value = mock_conn
+        
+        result = {
+            'visualization_id': 7,
+            'analysis': {'title': 'Prices'},
+            'grafana_dashboard': {'success': True, 'embed_url': 'http://grafana/d/abc', 'dashboard_uid': 'abc'}
+        }
+        
+        assert add_ai_visualization_to_dashboard(1, result) is False
+        mock_get_db.assert_called_once_with(autocommit=False)
+        executed = [call.args[0] for call in mock_cursor.execute.call_args_list]
+        assert "pg_advisory_xact_lock" in executed[0]
+        assert "ON CONFLICT (user_id, panel_id) DO NOTHING" in executed[1]
+        mock_conn.commit.assert_called_once()
+    
+    @patch('src.app.get_db_connection')
+    def test_api_data_not_modified(self, mock_get_db):
+        """Test /api/data answers 304 when the client's ETag matches the newest row"""
+        from datetime import datetime, timezone
+        from src.app import app
+        client = TestClient(app)
+        
+        mock_conn = Mock()
+        mock_cursor = Mock()
+        mock_conn.cursor.return_value = mock_cursor
+        mock_cursor.fetchone.return_value = (datetime(2024, 1, 1, tzinfo=timezone.utc),)
+        mock_get_db.return_value = mock_conn
+        
+        etag = 'W/"1704067200000"'
+        response = client.get("/api/data", headers={"If-None-Match": etag})
+        
+        assert response.status_code == 304
+        assert response.headers["etag"] == etag
+        mock_cursor.fetchall.assert_not_called()
+    
+    @patch('src.app.get_db_connection')
+    def test_user_visualizations_since_no_changes(self, mock_get_db):
+        """Test polling visualizations with `since` returns 204 when nothing is newer"""
+        from src.app import app, get_current_user
+        
+        mock_conn = Mock()
+        mock_cursor = Mock()
+        mock_conn.cursor.return_value = mock_cursor
+        mock_cursor.fetchall.return_value = []
+        mock_get_db.return_value = mock_conn
+        
+        app.dependency_overrides[get_current_user] = lambda: {'id': 1}
+        try:
+            client = TestClient(app)
+            response = client.get("/api/ai/visualizations?since=2024-01-01T00:00:00Z")
+        finally:
+            app.dependency_overrides.pop(get_current_user, None)
+        
+        assert response.status_code == 204
+        query, params = mock_cursor.execute.call_args.args
+        assert "created_at > %s" in query
+        assert params[0] == 1
+
+    
+    def test_latest_timestamp_etag_rolls_back_failed_probe(self):
+        """Test a failed ETag probe rolls back so the caller's transaction stays usable"""
+        from src.app import latest_timestamp_etag
+        
+        mock_conn = Mock()
+        mock_conn.cursor.return_value.execute.side_effect = psycopg2.errors.UndefinedTable("missing")
+        
+        assert latest_timestamp_etag(mock_conn, "ercot_settlement_prices_48h") is None
+        mock_conn.rollback.assert_called_once()
+    
+    def test_latest_timestamp_etag_includes_window_start(self):
+        """Test windowed ETags change when the oldest row in the window ages out"""
+        from datetime import datetime, timezone
+        from src.app import latest_timestamp_etag
+        
+        newest = datetime(2024, 1, 1, 6, tzinfo=timezone.utc)
+        mock_conn = Mock()
+        mock_cursor = mock_conn.cursor.return_value
+        
+        mock_cursor.fetchone.return_value = (newest, datetime(2024, 1, 1, 0, 5, tzinfo=timezone.utc))
+        before = latest_timestamp_etag(mock_conn, "ercot_capacity_monitor", window="6 hours")
+        mock_cursor.fetchone.return_value = (newest, datetime(2024, 1, 1, 0, 10, tzinfo=timezone.utc))
+        after = latest_timestamp_etag(mock_conn, "ercot_capacity_monitor", window="6 hours")
+        
+        assert before != after
+        assert "INTERVAL '6 hours'" in mock_cursor.execute.call_args.args[0]
+    
+    @patch('src.app.get_db_connection')
+    def test_price_data_etag_follows_the_relation_read(self, mock_get_db):
+        """Test /api/price-data tags the 48h view it reads, and the base table when the view is missing"""
+        from datetime import datetime, timezone
+        from src.app import app
+        client = TestClient(app)
+        
+        probe_cursor = Mock()
+        probe_cursor.execute.side_effect = [psycopg2.errors.UndefinedTable("missing"), None]
+        probe_cursor.fetchone.return_value = (datetime(2024, 1, 1, tzinfo=timezone.utc), None)
+        stream_cursor = Mock()
+        stream_cursor.fetchmany.return_value = []
+        mock_conn = Mock()
+        mock_conn.cursor.side_effect = lambda name=None, **kwargs: stream_cursor if name else probe_cursor
+        mock_get_db.return_value = mock_conn
+        
+        response = client.get("/api/price-data")
+        
+        assert response.status_code == 200
+        assert response.headers["etag"] == 'W/"1704067200000"'
+        probes = [call.args[0] for call in probe_cursor.execute.call_args_list]
+        assert "FROM ercot_settlement_prices_48h" in probes[0]
+        assert "FROM ercot_settlement_prices_48h" not in probes[1]
+        assert "FROM ercot_settlement_prices \n" in stream_cursor.execute.call_args.args[0]
+    
+    @patch('src.app.get_db_connection')
+    def test_refresh_metadata_views_isolates_failures(self, mock_get_db):
+        """Test one failing view doesn't skip the rest and only the lock holder refreshes"""
+        from src import app as app_module
+        
+        mock_conn = Mock(closed=0)
+        mock_cursor = mock_conn.cursor.return_value
+        mock_cursor.fetchone.return_value = (True,)
+        refreshed = []
+        
+        def execute(sql, params=None):
+            if sql.startswith("REFRESH"):
+                view = sql.rsplit(" ", 1)[1]
+                refreshed.append(view)
+                if view == "ercot_settlement_prices_meta":
+                    raise psycopg2.errors.UndefinedTable("missing")
+        mock_cursor.execute.side_effect = execute
+        mock_get_db.return_value = mock_conn
+        
+        with patch.dict(app_module.metadata_refresh_state, {"conn": None, "last_refreshed": {}}):
+            app_module.refresh_metadata_views()
+            assert refreshed == list(app_module.METADATA_VIEWS)
+            
+            # Within the aggregate interval only the 48h window is due again
+            refreshed.clear()
+            last = app_module.metadata_refresh_state["last_refreshed"]
+            last["ercot_settlement_prices_48h"] -= app_module.METADATA_REFRESH_INTERVAL
+            app_module.refresh_metadata_views()
+            assert refreshed == ["ercot_settlement_prices_48h"]
+        
+        # Another worker holds the lock: nothing is refreshed
+        refreshed.clear()
+        mock_cursor.fetchone.return_value = (False,)
+        with patch.dict(app_module.metadata_refresh_state, {"conn": None, "last_refreshed": {}}):
+            app_module.refresh_metadata_views()
+        assert refreshed == []
\ No newline at end of file
@@ -4,6 +4,7 @@ Unit tests for database connection utilities
 import pytest
 from unittest.mock import Mock, patch
 import psycopg2
+import threading
 
 import sys
 import os
@@ -96,4 +97,75 @@ class TestDatabaseConnection:
             db_conn = DatabaseConnection()
             
             with pytest.raises(ConnectionError, match="Database 'nonexistent' not found"):
-                db_conn.get_connection()
\ No newline at end of file
+                db_conn.get_connection()
+    
+    @patch('psycopg2.pool.ThreadedConnectionPool')
+    def test_pooled_connection_close_returns_to_pool(self, mock_pool_cls):
+        """Test pooled connections are handed back to the pool instead of closed"""
+        mock_pool = Mock()
+        mock_conn = Mock()
+        mock_conn.closed = 0
+        mock_conn.get_transaction_status.return_value = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+        mock_pool.getconn.return_value = mock_conn
+        mock_pool_cls.return_value = mock_pool
+        
+        db_conn = DatabaseConnection()
+        conn = db_conn.get_pooled_connection(autocommit=False)
+        assert mock_conn.autocommit is False
+        
+        conn.close()
+        conn.close()
+        
+        mock_conn.rollback.assert_called_once()
+        mock_conn.close.assert_not_called()
+        mock_pool.putconn.assert_called_once_with(mock_conn, close=False)
+    
+    @patch('psycopg2.pool.ThreadedConnectionPool')
+    def test_pooled_connection_waits_for_a_free_slot(self, mock_pool_cls):
+        """Test borrowing beyond the pool size waits for a return instead of failing at once"""
+        mock_conn = Mock()
+        mock_conn.closed = 0
+        mock_conn.get_transaction_status.return_value = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        mock_pool_cls.return_value.getconn.return_value = mock_conn
+        
+        with patch.dict('os.environ', {'DB_POOL_MIN_SIZE': '1', 'DB_POOL_MAX_SIZE': '1'}):
+            db_conn = DatabaseConnection()
+            first = db_conn.get_pooled_connection()
+            
+            with pytest.raises(ConnectionError, match="pool exhausted"):
+                db_conn.get_pooled_connection(timeout=0.01)
+            
+            # A returned connection frees its slot for the waiting caller
+            threading.Timer(0.05, first.close).start()
+            second = db_conn.get_pooled_connection(timeout=5)
+            second.close()
+        
+        assert mock_pool_cls.return_value.getconn.call_count == 2
+    
+    def test_execute_prepared_reuses_statement(self):
+        """Test a pooled connection prepares a statement once and then only executes it"""
+        from database.db_connection import execute_prepared, PreparingConnection
+        
+        mock_conn = Mock(spec=PreparingConnection)
+        mock_conn.prepared_statements = set()
+        mock_cursor = Mock()
+        mock_cursor.connection = mock_conn
+        
+        execute_prepared(mock_cursor, "latest_rows", "SELECT * FROM t WHERE id = $1", (1,))
+        execute_prepared(mock_cursor, "latest_rows", "SELECT * FROM t WHERE id = $1", (2,))
+        
+        executed = [call.args[0] for call in mock_cursor.execute.call_args_list]
+        assert executed == [
+            "PREPARE latest_rows AS SELECT * FROM t WHERE id = $1",
+            "EXECUTE latest_rows(%s)",
+            "EXECUTE latest_rows(%s)",
+        ]
+    
+    def test_execute_prepared_plain_connection(self):
+        """Test connections outside the pool run the query directly"""
+        from database.db_connection import execute_prepared
+        
+        mock_cursor = Mock()
+        execute_prepared(mock_cursor, "latest_rows", "SELECT * FROM t WHERE id = $1", (1,))
+        
+        mock_cursor.execute.assert_called_once_with("SELECT * FROM t WHERE id = %s", (1,))
@@ -282,4 +282,223 @@ class TestLangGraphAI:
             
             # Should route to error handler
             next_node = visualizer._determine_next_node(error_state)
-            assert next_node == 'handle_error'
\ No newline at end of file
+            assert next_node == 'handle_error'
+    
+    def test_workflow_fans_out_type_detection_and_source_selection(self):
+        """Test the parallel detection/selection branches merge before query generation"""
+        import asyncio
+        from unittest.mock import AsyncMock
+        from langgraph_ai_visualization import LangGraphAIVisualizer
+        
+        async def fake_deploy(self, state):
+            return {'dashboard_uid': 'abc', 'iframe_url': 'http://grafana/d-solo/abc'}
+        
+        async def fake_store(self, state):
+            return {'status': 'completed', 'visualization_id': 7}
+        
+        with patch('langgraph_ai_visualization.boto3.client'), \
+             patch.object(LangGraphAIVisualizer, '_call_bedrock_ai', AsyncMock(return_value=None)), \
+             patch.object(LangGraphAIVisualizer, '_execute_preview_query', AsyncMock(return_value=[{'time': 1}])), \
+             patch.object(LangGraphAIVisualizer, '_deploy_grafana_node', fake_deploy), \
+             patch.object(LangGraphAIVisualizer, '_store_results_node', fake_store):
+            visualizer = LangGraphAIVisualizer()
+            result = asyncio.run(visualizer.process_visualization_request(1, "houston hub price trend"))
+        
+        assert result['success'] is True
+        assert result['visualization_id'] == 7
+        assert 'hb_houston' in result['sql_query']
+    
+    def test_preview_query_results_are_cached(self):
+        """Test identical preview queries hit the database once within the TTL"""
+        import asyncio
+        from langgraph_ai_visualization import LangGraphAIVisualizer
+        
+        with patch('langgraph_ai_visualization.boto3.client'):
+            visualizer = LangGraphAIVisualizer()
+        
+        query = "SELECT * FROM (SELECT timestamp AS time FROM ercot_settlement_prices) AS preview LIMIT 5"
+        with patch.object(visualizer, '_run_preview_query', return_value=[{'time': 1}]) as mock_run:
+            first = asyncio.run(visualizer._execute_preview_query(query))
+            second = asyncio.run(visualizer._execute_preview_query(query))
+        
+        assert first == second == [{'time': 1}]
+        mock_run.assert_called_once_with(query)
+    
+    def test_bedrock_stream_returns_once_json_closes(self):
+        """Test the streamed Bedrock reply is parsed as soon as its JSON object completes"""
+        import asyncio
+        from langgraph_ai_visualization import LangGraphAIVisualizer
+        
+        def delta(text):
+            return {'chunk': {'bytes': json.dumps({'type': 'content_block_delta', 'delta': {'text': text}}).encode()}}
+        
+        events = [
+            {'chunk': {'bytes': json.dumps({'type': 'message_start'}).encode()}},
+            delta('Here you go: {"sql_query": "SELECT 1", '),
+            delta('"chart_type": "bar", "title": "T"}'),
+            delta(' trailing prose that is never read'),
+        ]
+        consumed = []
+        
+        def stream():
+            for event in events:
+                consumed.append(event)
+                yield event
+        
+        with patch('langgraph_ai_visualization.boto3.client') as mock_boto3:
+            mock_boto3.return_value.invoke_model_with_response_stream.return_value = {'body': stream()}
+            visualizer = LangGraphAIVisualizer()
+            result = asyncio.run(visualizer._call_bedrock_ai("prompt"))
+        
+        assert result == {"sql_query": "SELECT 1", "chart_type": "bar", "title": "T"}
+        assert len(consumed) == 3
+    
+    def test_data_source_keyword_classifier_matches_substring_checks(self):
+        """Test the single-pass classifier reports the same categories as per-keyword checks"""
+        import langgraph_ai_visualization as lg
+        
+        requests = [
+            "show grid stress over time",
+            "day ahead prices at the houston hub",
+            "system frequency trend",
+            "nothing relevant here",
+            "reserve margin versus settlement price",
+        ]
+        for text in requests:
+            expected = 0
+            if any(word in text for word in lg.CAPACITY_KEYWORDS):
+                expected |= lg.CAT_CAPACITY
+            if any(word in text for word in lg.PRICE_KEYWORDS):
+                expected |= lg.CAT_PRICE
+            if any(word in text for word in lg.GRID_CONTEXT_KEYWORDS):
+                expected |= lg.CAT_GRID_CONTEXT
+            assert lg._classify_data_source_keywords(text) == expected
+    
+    def test_panel_config_templates_are_shared(self):
+        """Test panel configs are built once per chart type and shared across visualizers"""
+        from langgraph_ai_visualization import LangGraphAIVisualizer
+        
+        with patch('langgraph_ai_visualization.boto3.client'):
+            first = LangGraphAIVisualizer()
+            second = LangGraphAIVisualizer()
+        
+        assert first._get_panel_config_for_type('bar') is second._get_panel_config_for_type('bar')
+        assert first._get_panel_config_for_type('line') is first._get_panel_config_for_type('unknown')
+        assert first._get_panel_config_for_type('area')['fieldConfig']['defaults']['custom']['fillOpacity'] == 30
+        assert first._get_panel_config_for_type('timeseries')['fieldConfig']['defaults']['custom']['fillOpacity'] == 0
+    
+    def test_store_results_uses_single_statement(self):
+        """Test the visualization record and dashboard panel are written in one statement"""
+        import asyncio
+        from langgraph_ai_visualization import LangGraphAIVisualizer
+        
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value
+        mock_cursor.fetchone.return_value = (42,)
+        state = {
+            'user_id': 7, 'request_text': 'show prices', 'visualization_type': 'chart',
+            'chart_title': 'Prices', 'chart_type': 'timeseries', 'cleaned_sql_query': 'SELECT 1',
+            'dashboard_uid': 'abc', 'iframe_url': 'http://grafana/d-solo/abc',
+            'selected_data_source': {'table_name': 'ercot_settlement_prices'},
+            'errors': [], 'status': 'processing'
+        }
+        
+        with patch('langgraph_ai_visualization.boto3.client'), \
+             patch('langgraph_ai_visualization.get_db_connection', return_value=mock_conn):
+            visualizer = LangGraphAIVisualizer()
+            result = asyncio.run(visualizer._store_results_node(state))
+        
+        assert result['status'] == 'completed'
+        assert result['visualization_id'] == 42
+        # Per-user panel-order lock, then the single combined write
+        assert mock_cursor.execute.call_count == 2
+        assert 'pg_advisory_xact_lock' in mock_cursor.execute.call_args_list[0][0][0]
+        mock_conn.commit.assert_called_once()
+    
+    def test_run_preview_query_maps_tuple_rows(self):
+        """Test preview rows are built from tuple rows and the cursor's column names"""
+        from langgraph_ai_visualization import LangGraphAIVisualizer
+        
+        mock_conn = MagicMock()
+        mock_cursor = mock_conn.cursor.return_value
+        mock_cursor.description = [('time',), ('price',)]
+        mock_cursor.fetchall.return_value = [(1, 20.5), (2, 21.0)]
+        
+        with patch('langgraph_ai_visualization.boto3.client'), \
+             patch('langgraph_ai_visualization.get_db_connection', return_value=mock_conn):
+            visualizer = LangGraphAIVisualizer()
+            rows = visualizer._run_preview_query("SELECT 1 WHERE $__timeFilter(timestamp)")
+        
+        assert rows == [{'time': 1, 'price': 20.5}, {'time': 2, 'price': 21.0}]
+        mock_conn.cursor.assert_called_once_with()
+        mock_conn.close.assert_called_once()
+    
+    def test_bedrock_reply_without_sql_is_rejected(self):
+        """Test a streamed reply missing sql_query fails validation and returns None"""
+        import asyncio
+        from langgraph_ai_visualization import LangGraphAIVisualizer
+        
+        events = [{'chunk': {'bytes': json.dumps({
+            'type': 'content_block_delta', 'delta': {'text': '{"title": "No query"}'}
+        }).encode()}}]
+        
+        with patch('langgraph_ai_visualization.boto3.client') as mock_boto3:
+            mock_boto3.return_value.invoke_model_with_response_stream.return_value = {'body': iter(events)}
+            visualizer = LangGraphAIVisualizer()
+            result = asyncio.run(visualizer._call_bedrock_ai("prompt"))
+        
+        assert result is None
+    
+    def test_fallback_query_rules_keep_priority_order(self):
+        """Test the single-scan fallback picks the first matching rule, not the first keyword in the text"""
+        from langgraph_ai_visualization import LangGraphAIVisualizer
+        
+        with patch('langgraph_ai_visualization.boto3.client'):
+            visualizer = LangGraphAIVisualizer()
+        
+        prices = {'table_name': 'ercot_settlement_prices'}
+        capacity = {'table_name': 'ercot_capacity_monitor'}
+        
+        assert visualizer._generate_fallback_query("west and houston hubs", prices)['title'] == 'Houston Hub Settlement Prices'
+        assert visualizer._generate_fallback_query("prices", prices)['title'] == 'ERCOT Settlement Point Prices'
+        assert visualizer._generate_fallback_query("spinning reserve", capacity)['title'] == 'Reserve Margin - Generation Resources'
+        assert visualizer._generate_fallback_query("capacity", capacity)['title'] == 'System Available Capacity Overview'
+        assert visualizer._generate_fallback_query("anything", {'table_name': 'other'})['title'] == 'ERCOT Data Overview'
+    
+    def test_validate_sql_components(self):
+        """Test SQL validation reports each missing Grafana requirement"""
+        from langgraph_ai_visualization import LangGraphAIVisualizer
+        
+        with patch('langgraph_ai_visualization.boto3.client'):
+            visualizer = LangGraphAIVisualizer()
+        
+        valid = visualizer._validate_sql_components(
+            'SELECT timestamp AS time, hb_west from ercot_settlement_prices WHERE $__timeFilter(timestamp)'
+        )
+        assert valid == {'valid': True, 'errors': []}
+        
+        invalid = visualizer._validate_sql_components('SELECT 1')
+        assert invalid['valid'] is False
+        assert invalid['errors'] == [
+            "Missing 'timestamp AS time' requirement",
+            "Missing '$__timeFilter(timestamp)' requirement",
+            "Missing FROM clause",
+        ]
+    
+    def test_short_request_skips_bedrock(self):
+        """Test a rejected request routes straight to the error handler without calling Bedrock"""
+        import asyncio
+        from unittest.mock import AsyncMock
+        from langgraph_ai_visualization import LangGraphAIVisualizer
+        
+        bedrock = AsyncMock(return_value=None)
+        with patch('langgraph_ai_visualization.boto3.client'), \
+             patch.object(LangGraphAIVisualizer, '_call_bedrock_ai', bedrock), \
+             patch.object(LangGraphAIVisualizer, '_ai_analyze_data_source') as analyze, \
+             patch.object(LangGraphAIVisualizer, '_store_error_state', AsyncMock()):
+            visualizer = LangGraphAIVisualizer()
+            result = asyncio.run(visualizer.process_visualization_request(1, "ab"))
+        
+        assert result['success'] is False
+        bedrock.assert_not_called()
+        analyze.assert_not_called()
\ No newline at end of file